@@ -0,0 +1,318 @@
+'''
+Repository Architecture for the YAML-Based Project Documentation Tool
+
+This module documents the packages and the repository as a whole, bottom-up, from the per-file reports in the report
+store: no source code is ever sent to the LLM again. Every folder gets a SUMMARY, a DFD and an ERD:
+- DFD: one subgraph per file with its main data-flow nodes, one node per sub-package, and the import edges between them
+  (extracted locally with codeoutline, every edge is drawn at the lowest folder that holds both ends).
+- ERD: the entities and relationships of the children merged (attributes are dropped beyond max_erd_entities).
+- SUMMARY: compiled from the one-line summaries of the children, or written by the LLM from those summaries only.
+Each result is saved with a fingerprint of its inputs (the children's results and the import edges), so after a re-scan only
+the ancestors of the changed files are recomputed. Package pages are written to ./reports/architecture/.
+
+    python architecture.py ./example_repo [--llm] [--full]
+'''
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+
+from codeoutline import analyze_code
+from mermaidtools import ER_RELATION_RE, strip_fence, fence, parse_flowchart, parse_erdiagram, merge_erdiagrams
+from reportstore import ReportStore, default_store_path
+
+architecturedir = './reports/architecture/'
+max_child_nodes = 6                                                                   # Data-flow nodes shown per file in a package DFD (the most connected ones)
+max_erd_entities = 40                                                                 # Larger package ERDs keep entities and relationships only
+summary_chars = 200                                                                   # Length of a child summary in the package summary (and its prompt)
+python_import_re = re.compile(r'^\s*from\s+(\.*)([\w.]*)\s+import\s+(.+)$|^\s*import\s+(.+)$')
+quoted_import_re = re.compile(r'''(?:from\s+|require\(\s*|import\s*\(?\s*|#include\s*)["']([^"']+)["']''')
+
+# Prompt of the optional LLM step: it only ever sees the children's one-line summaries and the import edges
+package_summary_prompt = '''You document the architecture of a source code repository.
+Write the SUMMARY of the package `{package}`: its responsibility, its main components and how they depend on each other, in one paragraph of plain text (no lists, no code, no JSON).
+Only use the information below.
+
+Components (files and sub-packages) with their summaries:
+{children}
+
+Import edges between the components:
+{edges}
+'''
+
+# Function to shorten a summary to its first sentence (within summary_chars)
+def first_sentence(text):
+    text = ' '.join(str(text or '').split())
+    match = re.match(r'(.+?[.!?])(\s|$)', text)
+    sentence = match.group(1) if match else text
+    return sentence if len(sentence) <= summary_chars else sentence[:summary_chars - 3] + '...'
+
+# Function to hash the inputs of a result
+def fingerprint(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+# Function to load the latest report of every file of a repository, as relpath -> report (paths as scanned, relative to the repository)
+def load_file_reports(store, repo_root):
+    root = os.path.abspath(repo_root)
+    latest = {}
+    for path, report_id in store.latest_ids().items():
+        relpath = os.path.relpath(os.path.abspath(path), root)
+        if not relpath.startswith('..'):
+            latest[relpath.replace(os.sep, '/')] = report_id
+    reports = store.reports_by_id(latest.values())
+    return {relpath: reports[report_id] for relpath, report_id in latest.items()}
+
+# Function to index the documented files by module name (Python dotted names, every suffix) and by path without extension
+def module_index(relpaths):
+    modules, stems = {}, {}
+    for relpath in relpaths:
+        stem = os.path.splitext(relpath)[0]
+        stems.setdefault(stem, relpath)
+        parts = stem.split('/')
+        if parts[-1] == '__init__':
+            parts = parts[:-1]
+            stems.setdefault('/'.join(parts), relpath)
+        for start in range(len(parts)):
+            modules.setdefault('.'.join(parts[start:]), []).append(relpath)
+    return modules, stems
+
+# Function to resolve a module name to a documented file (the candidate closest to the importing file wins)
+def _resolve_module(name, relpath, modules):
+    candidates = modules.get(name, [])
+    if not candidates:
+        return None
+    folder = os.path.dirname(relpath).split('/')
+    return max(candidates, key=lambda candidate: (len(os.path.commonprefix([folder, os.path.dirname(candidate).split('/')])), -len(candidate)))
+
+# Function to extract the import edges of a file to other documented files (Python imports, quoted relative imports/includes)
+def file_imports(repo_root, relpath, modules, stems):
+    try:
+        with open(os.path.join(repo_root, relpath), 'r', encoding='utf-8', errors='replace') as f:
+            code = f.read()
+    except OSError:
+        return []
+    folder = os.path.dirname(relpath)
+    targets = set()
+    for line in analyze_code(code, os.path.basename(relpath))['imports']:
+        match = python_import_re.match(line) if relpath.endswith(('.py', '.pyw', '.pyi')) else None
+        if match and match.group(4):
+            resolved = [_resolve_module(name.split(' as ')[0].strip(), relpath, modules) for name in match.group(4).split(',')]
+        elif match:
+            dots, module = match.group(1), match.group(2)
+            if dots:
+                base = folder.split('/') if folder else []
+                base = base[:len(base) - (len(dots) - 1)] if len(dots) > 1 else base
+                module = '.'.join(base + ([module] if module else []))
+            imported = [name.split(' as ')[0].strip(' ()') for name in match.group(3).split(',')]
+            resolved = [_resolve_module(f"{module}.{name}" if module else name, relpath, modules) for name in imported if name and name != '*']
+            if not any(resolved) and module:                                              # `from a import b`: b is a submodule, or something defined in a
+                resolved = [_resolve_module(module, relpath, modules)]
+        else:
+            resolved = []
+            for target in quoted_import_re.findall(line):
+                if target.startswith('.'):
+                    stem = os.path.normpath(os.path.join(folder, os.path.splitext(target)[0])).replace(os.sep, '/')
+                    resolved.append(stems.get(stem) or stems.get(f"{stem}/index"))
+                else:
+                    resolved.append(stems.get(os.path.splitext(f"{folder}/{target}" if folder else target)[0]))
+        targets.update(target for target in resolved if target)
+    targets.discard(relpath)
+    return sorted(targets)
+
+# Function to list the folders of the repository: folder -> {'files': [...], 'packages': [...]} ('' is the repository root)
+def package_tree(relpaths):
+    tree = {'': {'files': [], 'packages': []}}
+    for relpath in sorted(relpaths):
+        folder = os.path.dirname(relpath)
+        tree.setdefault(folder, {'files': [], 'packages': []})['files'].append(relpath)
+        while folder:
+            parent = os.path.dirname(folder)
+            siblings = tree.setdefault(parent, {'files': [], 'packages': []})['packages']
+            if folder not in siblings:
+                siblings.append(folder)
+            folder = parent
+    return tree
+
+# Function to find the child of a folder that holds a file (the file itself, or the sub-package it is in)
+def _child_of(folder, relpath):
+    rest = relpath[len(folder) + 1:] if folder else relpath
+    return f"{folder}/{rest.split('/')[0]}" if folder else rest.split('/')[0]
+
+# Function to escape a label for Mermaid
+def _label(text):
+    return str(text).replace('"', "'")
+
+# Function to pick the main data-flow nodes of a file DFD (the most connected ones) and the edges between them
+def _main_nodes(diagram):
+    body = strip_fence(diagram) if isinstance(diagram, str) else None
+    if body is None:
+        return {}, []
+    header, statements, _ = parse_flowchart(body)
+    if header is None:
+        return {}, []
+    labels, degree, edges = {}, {}, []
+    for statement in statements:
+        for node_id, label in statement['nodes'].items():
+            labels[node_id] = label or labels.get(node_id) or node_id
+        for src, dst in statement['edges']:
+            degree[src], degree[dst] = degree.get(src, 0) + 1, degree.get(dst, 0) + 1
+            if (src, dst) not in edges:
+                edges.append((src, dst))
+    main = sorted(labels, key=lambda node_id: (-degree.get(node_id, 0), node_id))[:max_child_nodes]
+    return {node_id: labels[node_id] for node_id in main}, [(src, dst) for src, dst in edges if src in main and dst in main]
+
+# Function to build the DFD of a folder: its files (with their main nodes) and sub-packages, linked by the import edges between them
+def package_dfd(folder, children, file_reports, edges):
+    lines, ids = ['flowchart LR'], {}
+    for index, child in enumerate(children, start=1):
+        child_id = ids[child] = f"c{index}"
+        name = os.path.basename(child)
+        if child in file_reports:
+            nodes, node_edges = _main_nodes(file_reports[child].get('DFD'))
+            lines.append(f'    subgraph {child_id}["{_label(name)}"]')
+            lines += [f'        {child_id}_{node_id}["{_label(label)}"]' for node_id, label in nodes.items()] or [f'        {child_id}_file["{_label(name)}"]']
+            lines += [f"        {child_id}_{src} --> {child_id}_{dst}" for src, dst in node_edges]
+            lines.append('    end')
+        else:
+            lines.append(f'    {child_id}[["{_label(name)}/"]]')
+    lines += [f"    {ids[src]} -->|imports| {ids[dst]}" for src, dst in edges]
+    return fence('\n'.join(lines))
+
+# Function to build the ERD of a folder from the ERDs of its children (entities only when it grows beyond max_erd_entities)
+def package_erd(diagrams):
+    merged = merge_erdiagrams([diagram for diagram in diagrams if isinstance(diagram, str)])
+    entities, relationships, _ = parse_erdiagram(strip_fence(merged))
+    if len(entities) <= max_erd_entities:
+        return merged
+    lines = ['erDiagram'] + [f"    {relationship}" for relationship in relationships]
+    related = {ER_RELATION_RE.match(relationship).group(group).strip('"') for relationship in relationships for group in (1, 5)}
+    lines += [f'    "{name}"' if not re.fullmatch(r'[\w\-]+', name) else f"    {name}" for name in entities if name not in related]
+    return fence('\n'.join(lines))
+
+# Function to document one folder from the results of its children
+def aggregate_package(folder, tree, file_reports, results, edges, summarize=None):
+    children = tree[folder]['files'] + tree[folder]['packages']
+    child_summaries, briefs, lines_of_code, files = [], [], 0, 0
+    for child in children:
+        if child in file_reports:
+            report = file_reports[child]
+            lines_of_code += report.get('lines_of_code', 0) or 0
+            files += 1
+            briefs.append(first_sentence(report.get('SUMMARY')))
+            child_summaries.append(f"- {os.path.basename(child)}: {briefs[-1]}")
+        else:
+            lines_of_code += results[child]['lines_of_code']
+            files += results[child]['files']
+            briefs.append(results[child]['brief'])
+            child_summaries.append(f"- {os.path.basename(child)}/ (package, {results[child]['files']} files): {briefs[-1]}")
+    edge_lines = [f"- {os.path.basename(src)} imports {os.path.basename(dst)}" for src, dst in edges] or ['- none']
+    name = folder or '.'
+    summary, llm_summary = None, False
+    if summarize is not None:
+        try:
+            summary = summarize(package_summary_prompt.format(package=name, children='\n'.join(child_summaries), edges='\n'.join(edge_lines)))
+            llm_summary = bool(summary)
+        except Exception as e:
+            logging.warning("PACKAGE SUMMARY FAILED: %s - %s, the summary is compiled from the children", name, e)
+    if not summary:
+        summary = f"Package `{name}` ({files} files, {lines_of_code:,} lines of code):\n" + '\n'.join(child_summaries)
+    diagrams = [file_reports[child].get('ERD') if child in file_reports else results[child]['ERD'] for child in children]
+    return {
+        'folder': folder,
+        'SUMMARY': summary,
+        'brief': first_sentence(summary) if llm_summary else first_sentence(' '.join(dict.fromkeys(briefs))),   # One line for the summary of the parent folder
+        'DFD': package_dfd(folder, children, file_reports, edges),
+        'ERD': package_erd(diagrams),
+        'children': children,
+        'file_children': tree[folder]['files'],
+        'imports': [list(edge) for edge in edges],
+        'files': files,
+        'lines_of_code': lines_of_code,
+        'llm_summary': llm_summary
+    }
+
+# Function to name the page of a folder
+def package_page(folder):
+    return f"package_{folder.replace('/', '.')}.md" if folder else 'repository.md'
+
+# Function to write the page of a folder: summary, children (sub-packages link to their page), DFD and ERD
+def write_package_page(result, output_folder):
+    out = [f"# {result['folder'] or 'Repository'}\n\n", f"{result['SUMMARY']}\n\n", "## Components\n\n"]
+    for child in result['children']:
+        name = os.path.basename(child)
+        out.append(f"- {name}\n" if child in result['file_children'] else f"- [{name}/]({package_page(child)})\n")
+    out += ["\n## Data Flow Diagram\n\n", f"{result['DFD']}\n\n", "## Entity Relationship Diagram\n\n", f"{result['ERD']}\n"]
+    with open(os.path.join(output_folder, package_page(result['folder'])), 'w') as f:
+        f.write(''.join(out))
+
+# Function to document the packages and the repository, recomputing only the folders whose inputs changed (all of them with full=True)
+# Returns (results by folder, recomputed folders)
+def build_architecture(store, repo_root, summarize=None, full=False, output_folder=architecturedir):
+    root = os.path.abspath(repo_root)
+    file_reports = load_file_reports(store, repo_root)
+    if not file_reports:
+        logging.warning("ARCHITECTURE: no reports of %s in the report store, scan it first", repo_root)
+        return {}, []
+    modules, stems = module_index(file_reports)
+    imports = {relpath: file_imports(repo_root, relpath, modules, stems) for relpath in file_reports}
+    tree = package_tree(file_reports)
+    stored = {} if full else store.aggregates(root)
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Every import edge belongs to the lowest folder holding both ends
+    edges = {folder: set() for folder in tree}
+    for src, targets in imports.items():
+        for dst in targets:
+            folder = '/'.join(os.path.commonprefix([os.path.dirname(src).split('/'), os.path.dirname(dst).split('/')])).strip('/')
+            src_child, dst_child = _child_of(folder, src), _child_of(folder, dst)
+            if src_child != dst_child:
+                edges[folder].add((src_child, dst_child))
+
+    # Bottom-up: deepest folders first, a folder is only recomputed when the results of its children or its edges changed
+    results, recomputed = {}, []
+    for folder in sorted(tree, key=lambda folder: (-folder.count('/') if folder else 1, folder)):
+        children = tree[folder]['files'] + tree[folder]['packages']
+        folder_edges = sorted(edges[folder])
+        inputs = fingerprint([
+            [(child, [file_reports[child].get(k) for k in ('SUMMARY', 'DFD', 'ERD')] + [file_reports[child].get('lines_of_code')]) if child in file_reports else (child, results[child]['fingerprint']) for child in children],
+            folder_edges, summarize is not None, max_child_nodes, max_erd_entities
+        ])
+        if folder in stored and stored[folder][0] == inputs and os.path.exists(os.path.join(output_folder, package_page(folder))):
+            results[folder] = stored[folder][1]
+            continue
+        result = aggregate_package(folder, tree, file_reports, results, folder_edges, summarize)
+        result['fingerprint'] = inputs
+        store.save_aggregate(root, folder, inputs, result)
+        write_package_page(result, output_folder)
+        results[folder] = result
+        recomputed.append(folder)
+    gone = [folder for folder in store.aggregates(root) if folder not in tree]
+    if gone:
+        store.delete_aggregates(root, gone)
+    logging.info("ARCHITECTURE: %s folders, %s recomputed, %s unchanged, pages in %s", len(tree), len(recomputed), len(tree) - len(recomputed), output_folder)
+    return results, recomputed
+
+# Function to parse command-line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Document the packages and the repository from the per-file reports')
+    parser.add_argument('repo_to_scan', type=str, help='Folder that was scanned')
+    parser.add_argument('--store', type=str, default=default_store_path, help=f'Report store (default: {default_store_path})')
+    parser.add_argument('--llm', action='store_true', help='Have the LLM write the package summaries (from the child summaries only)')
+    parser.add_argument('--full', action='store_true', help='Recompute every folder, not only the ancestors of the changed files')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    summarize, run = None, None
+    if args.llm:
+        import genmermaid                                                                             # Only for the LLM client and its settings
+        run = genmermaid.new_summary_run()
+        summarize = lambda prompt: genmermaid.summarize_package(prompt, run)
+    store = ReportStore(args.store)
+    build_architecture(store, args.repo_to_scan, summarize=summarize, full=args.full)
+    store.close()
+    if run is not None:
+        logging.info("PACKAGE SUMMARIES: %s requests, %s tokens, $%s", run["requests"], run["total_tokens"], round(run["total_cost"], 5))
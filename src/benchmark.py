@@ -0,0 +1,334 @@
+'''
+Benchmarks for the YAML-Based Project Documentation Tool
+
+This script measures the documentation pipeline without touching the main scanner:
+- outline: compares the full-source and outline prompt modes of genmermaid.py on a repository. Input tokens are computed
+  locally with tiktoken; output quality (symbol coverage, Mermaid validity, diagram sizes, tokens and cost spent) is read
+  from the reports of two scans of the same repository, one with and one without `--outline`.
+- throughput: runs genmermaid.main() over a synthetic repository against a local stand-in for the OpenAI chat-completions
+  endpoint (configurable latency, token counts, error rate and canned JSON replies), so that throughput changes can be
+  measured without spending money: files/min, tokens/s, rounds per file, p50/p95 per-file latency and peak memory.
+
+Results are printed and written as JSON into ./benchmarks/ so that they can be compared between versions.
+'''
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tiktoken
+
+from codeoutline import analyze_code, build_outline, build_skeleton, symbol_names
+from mermaidtools import strip_fence, parse_flowchart, parse_erdiagram, validate_flowchart, validate_erdiagram
+from reportstore import ReportStore, default_store_path
+
+# Directories for input and output
+benchmarksdir = './benchmarks/'
+
+encoding = tiktoken.get_encoding("cl100k_base")
+
+# Function to parse command-line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Benchmark the source code documentation pipeline')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    outline = subparsers.add_parser('outline', help='Compare full-source and outline prompt modes (tokens and output quality)')
+    outline.add_argument('repo_to_scan', type=str, help='Folder that was scanned in both modes')
+    outline.add_argument('--reports', type=str, default=default_store_path, help=f'Report store with the reports of both scans (default: {default_store_path})')
+    throughput = subparsers.add_parser('throughput', help='Scan a synthetic repository against a local mock of the OpenAI endpoint')
+    throughput.add_argument('--files', type=int, default=50, help='Number of synthetic files (default: 50)')
+    throughput.add_argument('--lines', type=int, default=200, help='Lines per synthetic file (default: 200)')
+    throughput.add_argument('--latency', type=float, default=1.0, help='Mean mock latency per request in seconds (default: 1.0)')
+    throughput.add_argument('--jitter', type=float, default=0.2, help='Standard deviation of the mock latency in seconds (default: 0.2)')
+    throughput.add_argument('--error-rate', type=float, default=0.0, help='Share of mock requests answered with HTTP 429 (default: 0)')
+    throughput.add_argument('--revise-rate', type=float, default=0.3, help='Share of mock reviews answered with NEXTSTEP: REVISE (default: 0.3)')
+    throughput.add_argument('--completion-tokens', type=int, default=1500, help='Completion tokens reported per mock reply (default: 1500)')
+    throughput.add_argument('--reply', type=str, default=None, help='JSON file with the canned core_coder_agent reply (default: a built-in valid result)')
+    throughput.add_argument('--model', type=str, default='gpt-4o', help='Model name sent to the mock, used for the cost estimate (default: gpt-4o)')
+    throughput.add_argument('--seed', type=int, default=7, help='Random seed of the mock (default: 7)')
+    throughput.add_argument('--workers', type=int, default=1, help='genmermaid --workers (default: 1)')
+    throughput.add_argument('--speaker-selection', choices=['fixed', 'auto'], default='fixed', help='genmermaid --speaker-selection (default: fixed)')
+    throughput.add_argument('--trust-valid', action='store_true', help='genmermaid --trust-valid')
+    throughput.add_argument('--outline', action='store_true', help='genmermaid --outline')
+    return parser.parse_args()
+
+# Function to count tokens in a given text (uses tiktoken and cl100k_base)
+def count_tokens(text):
+    return len(encoding.encode(text, disallowed_special=()))
+
+# Function to compute the median and the 95th percentile of a list of values
+def percentiles(values):
+    if not values:
+        return 0.0, 0.0
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2], ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+# Function to write a benchmark result as JSON into the benchmarks folder
+def save_benchmark(name, result):
+    os.makedirs(benchmarksdir, exist_ok=True)
+    path = os.path.join(benchmarksdir, f"{name}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=4)
+    return path
+
+# Function to load the latest report per (md5, prompt mode) from the report store (every stored version, both modes of a path are needed)
+def load_latest_reports(store_path):
+    latest = {}
+    if not os.path.isfile(store_path):
+        return latest
+    store = ReportStore(store_path)
+    reports = store.reports(latest=False)
+    store.close()
+    for report_id, report in reports:
+        key = (report.get('md5_hash'), report.get('prompt_mode', 'full'))
+        if key not in latest or report.get('scan_date', '') > latest[key].get('scan_date', ''):
+            latest[key] = report
+    return latest
+
+# Function to score a report: share of the locally found symbols it documents, Mermaid validity and diagram sizes
+def score_report(report, symbols):
+    documented = json.dumps([report.get('DataDictionary', {}), report.get('codecontext', {})])
+    covered = [name for name in symbols if name in documented]
+    dfd_body, erd_body = strip_fence(report.get('DFD')) or '', strip_fence(report.get('ERD')) or ''
+    _, statements, _ = parse_flowchart(dfd_body)
+    entities, relationships, _ = parse_erdiagram(erd_body)
+    return {
+        'symbol_coverage': round(len(covered) / len(symbols), 3) if symbols else 1.0,
+        'mermaid_errors': len(validate_flowchart(report.get('DFD'))) + len(validate_erdiagram(report.get('ERD'))),
+        'dfd_nodes': len({node for statement in statements for node in statement['nodes']}),
+        'erd_entities': len(entities),
+        'erd_relationships': len(relationships),
+        'total_tokens': report.get('total_tokens', 0),
+        'total_cost': report.get('total_cost', 0.0),
+        'scan_duration': report.get('scan_duration', 0.0)
+    }
+
+# Canned core_coder_agent reply of the mock server (a result that passes the local validation)
+canned_result = {
+    "SUMMARY": "Synthetic module that scales values and builds output paths.",
+    "DFD": "```mermaid\nflowchart TD\n  A[value] -->|scaled by factor| B[result]\n  B -->|os.path.join| C[output path]\n```",
+    "ERD": "```mermaid\nerDiagram\n  MODULE ||--o{ FUNCTION : defines\n  FUNCTION {\n    number value\n    number factor\n  }\n```",
+    "DataDictionary": {"Module Constants": {"LIMIT": "Offset added to every scaled value."}},
+    "codecontext": {"functions": {"Description": "Scale a value by a factor and return an output path."}}
+}
+
+# Class of the local stand-in for the chat-completions endpoint (the configuration is set by start_mock_server)
+class MockChatCompletions(BaseHTTPRequestHandler):
+    config, log, lock = {}, [], threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._send(404, {"error": {"message": f"Unknown path {self.path}", "type": "invalid_request_error"}})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        config, started = self.config, time.monotonic()
+        with self.lock:
+            latency = max(0.0, config['rng'].gauss(config['latency'], config['jitter']))
+            fail = config['rng'].random() < config['error_rate']
+            revise = config['rng'].random() < config['revise_rate']
+        time.sleep(latency)
+        messages = body.get('messages', [])
+        system = messages[0]['content'] if messages and messages[0].get('role') == 'system' else ''
+        submission = next((m.get('content') or '' for m in messages if m.get('role') != 'system'), '')
+        reviewer = 'reviewing Mermaid' in system                                                  # core_manager_agent system message, see yaml/promptsmermaid.yml
+        with self.lock:
+            self.log.append({'conversation': hashlib.md5(str(submission).encode('utf-8')).hexdigest(), 'reviewer': reviewer, 'error': fail, 'latency': time.monotonic() - started})
+        if fail:
+            self._send(429, {"error": {"message": "Rate limit reached (mock)", "type": "requests", "code": "rate_limit_exceeded"}}, {'retry-after-ms': '10'})
+            return
+        if reviewer:
+            content = json.dumps({"NEXTSTEP": "REVISE", "comments": "Document the missing functions (mock)."} if revise else {"NEXTSTEP": "TERMINATE"})
+        else:
+            content = json.dumps(config['reply'])
+        prompt_tokens = sum(count_tokens(str(m.get('content') or '')) for m in messages)
+        self._send(200, {
+            "id": f"chatcmpl-mock-{len(self.log)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get('model', 'mock'),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": config['completion_tokens'], "total_tokens": prompt_tokens + config['completion_tokens']}
+        })
+
+# Function to start the mock server on a free local port, in a daemon thread
+def start_mock_server(latency, jitter, error_rate, revise_rate, completion_tokens, reply, seed):
+    MockChatCompletions.config = {
+        'latency': latency, 'jitter': jitter, 'error_rate': error_rate, 'revise_rate': revise_rate,
+        'completion_tokens': completion_tokens, 'reply': reply, 'rng': random.Random(seed)
+    }
+    MockChatCompletions.log = []
+    server = ThreadingHTTPServer(('127.0.0.1', 0), MockChatCompletions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Function to write a synthetic repository of Python modules with the given number of lines each
+def make_synthetic_repo(folder, files, lines):
+    for i in range(files):
+        body = [f'"""Synthetic module {i} for the throughput benchmark."""', 'import os', '', f'LIMIT_{i} = {i}', '']
+        n = 0
+        while len(body) < lines:
+            body += [f'def function_{i}_{n}(value, factor={n}):', f'    """Scale value by factor {n}."""', f'    result = value * factor + LIMIT_{i}', '    return os.path.join(str(result), "out")', '']
+            n += 1
+        package = os.path.join(folder, f"package_{i % 10}")
+        os.makedirs(package, exist_ok=True)
+        with open(os.path.join(package, f"module_{i}.py"), 'w') as f:
+            f.write('\n'.join(body[:lines]) + '\n')
+
+# Function to identify the code version being benchmarked (best effort)
+def code_version():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# Function to run genmermaid.main() over a synthetic repository against the mock server and collect throughput metrics
+def benchmark_throughput(args):
+    reply = canned_result
+    if args.reply:
+        with open(args.reply, 'r') as f:
+            reply = json.load(f)
+    server = start_mock_server(args.latency, args.jitter, args.error_rate, args.revise_rate, args.completion_tokens, reply, args.seed)
+    workdir = tempfile.mkdtemp(prefix='genmermaid_bench_')
+    repo_to_scan = os.path.join(workdir, 'repo')
+    make_synthetic_repo(repo_to_scan, args.files, args.lines)
+
+    import genmermaid                                                                               # Imported here so that `outline` runs without autogen
+    genmermaid.config_list_openai[0].update(model=args.model, api_key='mock', base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    genmermaid.model_name = args.model                                                              # Price lookups and the model recorded in the reports
+    genmermaid.llm_config['cache_seed'] = None                                                      # No autogen disk cache: every request must reach the mock
+    for folder in ('reportsdir', 'feedbackdir', 'logsdir', 'cachedir', 'journaldir'):              # Nothing mixes with the state of real runs (main() creates them)
+        setattr(genmermaid, folder, os.path.join(workdir, folder.replace('dir', '')) + os.sep)
+
+    # Warm-up before the clock: the autogen import (most of the first pod build, ~1s) and the tokenizer are one-off costs, not throughput.
+    # The pods themselves are built by the workers, timed apart from the file durations (the 'pod' phase)
+    import autogen
+    genmermaid.get_encoding()
+
+    tracemalloc.start()
+    started = time.monotonic()
+    stats = genmermaid.main(repo_to_scan, use_cache=False, workers=args.workers, speaker_selection=args.speaker_selection, trust_valid=args.trust_valid, outline=args.outline)
+    wall = time.monotonic() - started
+    peak_traced = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    server.shutdown()
+
+    requests = MockChatCompletions.log
+    rounds = {}
+    for request in (request for request in requests if not request['error']):
+        rounds[request['conversation']] = rounds.get(request['conversation'], 0) + 1
+    p50, p95 = percentiles(stats.file_durations)
+    return {
+        'benchmark': 'throughput',
+        'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        'version': code_version(),
+        'config': {k: v for k, v in vars(args).items() if k != 'benchmark'},
+        'files': stats.vueltas,
+        'errors': stats.sum_error,
+        'wall_seconds': round(wall, 3),
+        'files_per_minute': round(stats.vueltas / wall * 60, 2) if wall else 0.0,
+        'tokens_per_second': round(stats.sum_total_tokens / wall, 2) if wall else 0.0,
+        'total_tokens': stats.sum_total_tokens,
+        'total_cost': stats.sum_total_cost,
+        'requests': len(requests),
+        'requests_failed': sum(1 for request in requests if request['error']),
+        'rounds_per_file': round(sum(rounds.values()) / len(rounds), 2) if rounds else 0.0,
+        'p50_file_seconds': round(p50, 3),
+        'p95_file_seconds': round(p95, 3),
+        'peak_traced_memory_mb': round(peak_traced / 1024 / 1024, 2),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 2)
+    }
+
+# Function to compare the full-source and outline prompt modes on a repository
+def benchmark_outline(repo_to_scan, store_path):
+    reports = load_latest_reports(store_path)
+    files, totals = [], {'full_input_tokens': 0, 'outline_input_tokens': 0, 'skeleton_tokens': 0}
+    for dirpath, dirnames, filenames in os.walk(repo_to_scan):
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            try:
+                with open(file_path, 'rb') as f:
+                    raw_data = f.read()
+                code = raw_data.decode('utf-8')
+            except (OSError, UnicodeDecodeError):
+                continue
+            analysis = analyze_code(code, filename)
+            entry = {
+                'file_path': file_path,
+                'language': analysis['language'],
+                'full_input_tokens': count_tokens(code),
+                'outline_input_tokens': count_tokens(build_outline(analysis, filename)),
+                'skeleton_tokens': count_tokens(json.dumps(build_skeleton(analysis), indent=1))
+            }
+            for k in totals:
+                totals[k] += entry[k]
+            md5 = hashlib.md5(raw_data).hexdigest()
+            symbols = symbol_names(analysis)
+            for mode in ('full', 'outline'):
+                if (md5, mode) in reports:
+                    entry[mode] = score_report(reports[(md5, mode)], symbols)
+            files.append(entry)
+
+    compared = [entry for entry in files if 'full' in entry and 'outline' in entry]
+    quality = {}
+    for mode in ('full', 'outline'):
+        scores = [entry[mode] for entry in compared]
+        p50, p95 = percentiles([score['scan_duration'] for score in scores])
+        quality[mode] = {
+            'files': len(scores),
+            'avg_symbol_coverage': round(sum(score['symbol_coverage'] for score in scores) / len(scores), 3) if scores else None,
+            'mermaid_errors': sum(score['mermaid_errors'] for score in scores),
+            'dfd_nodes': sum(score['dfd_nodes'] for score in scores),
+            'erd_entities': sum(score['erd_entities'] for score in scores),
+            'total_tokens': sum(score['total_tokens'] for score in scores),
+            'total_cost': sum(score['total_cost'] for score in scores),
+            'p50_scan_duration': p50,
+            'p95_scan_duration': p95
+        }
+    reduction = 1 - totals['outline_input_tokens'] / totals['full_input_tokens'] if totals['full_input_tokens'] else 0.0
+    return {
+        'benchmark': 'outline',
+        'date': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        'repo': repo_to_scan,
+        'files': len(files),
+        'input_tokens': dict(totals, outline_reduction=round(reduction, 3)),
+        'quality': quality,
+        'per_file': files
+    }
+
+# Entry point for the script
+if __name__ == "__main__":
+    args = parse_arguments()
+    if args.benchmark == 'outline':
+        result = benchmark_outline(args.repo_to_scan, args.reports)
+        tokens = result['input_tokens']
+        print(f"[ {result['files']} files ] [ Full input tokens: {tokens['full_input_tokens']:,} ] [ Outline input tokens: {tokens['outline_input_tokens']:,} ] [ Reduction: {tokens['outline_reduction']:.1%} ]")
+        for mode, quality in result['quality'].items():
+            print(f"[ {mode:7} ] [ Files compared: {quality['files']} ] [ Symbol coverage: {quality['avg_symbol_coverage']} ] [ Mermaid errors: {quality['mermaid_errors']} ] [ Tokens: {quality['total_tokens']:,} ] [ Cost (USD): {quality['total_cost']:.4f} ]")
+        print(f"Results saved to {save_benchmark('outline', result)}")
+    elif args.benchmark == 'throughput':
+        result = benchmark_throughput(args)
+        print(f"[ {result['files']} files in {result['wall_seconds']}s ] [ Files/min: {result['files_per_minute']} ] [ Tokens/s: {result['tokens_per_second']:,} ] [ Rounds/file: {result['rounds_per_file']} ]")
+        print(f"[ Per-file latency p50: {result['p50_file_seconds']}s p95: {result['p95_file_seconds']}s ] [ Peak memory: {result['peak_traced_memory_mb']} MB traced, {result['peak_rss_mb']} MB RSS ] [ ERRORS: {result['errors']} ]")
+        print(f"Results saved to {save_benchmark('throughput', result)}")
@@ -0,0 +1,79 @@
+'''
+Source Code Chunker for the YAML-Based Project Documentation Tool
+
+This module splits source files that exceed the model context size into chunks that can be documented independently
+(map) and merged back into a single report (reduce). Python files are split on class/function boundaries using `ast`,
+any other language (or Python that does not parse) falls back to splitting on blank lines, then on single lines.
+'''
+import ast
+
+python_extensions = ('.py', '.pyw', '.pyi')
+nested_nodes = (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)
+
+# Function to turn a list of statements into contiguous line ranges (leading comments and blank lines stick to the statement below)
+def _statement_ranges(statements, start, end):
+    ranges = []
+    for index, node in enumerate(statements):
+        node_start = start if index == 0 else ranges[-1][1]
+        node_end = end if index == len(statements) - 1 else node.end_lineno
+        ranges.append((node_start, node_end, node))
+    return ranges
+
+# Function to split a line range on blank lines first, and on single lines when a paragraph is still too large
+def _line_units(line_tokens, lines, start, end, max_tokens):
+    units, paragraph_start = [], start
+    for index in range(start, end):
+        if not lines[index].strip() or index == end - 1:
+            units.append((paragraph_start, index + 1))
+            paragraph_start = index + 1
+    split = []
+    for unit_start, unit_end in units:
+        if sum(line_tokens[unit_start:unit_end]) > max_tokens:
+            split.extend((i, i + 1) for i in range(unit_start, unit_end))
+        else:
+            split.append((unit_start, unit_end))
+    return split
+
+# Function to split a Python line range on statement boundaries, descending into classes and functions that are too large
+def _python_units(line_tokens, lines, statements, start, end, max_tokens):
+    units = []
+    for unit_start, unit_end, node in _statement_ranges(statements, start, end):
+        if sum(line_tokens[unit_start:unit_end]) <= max_tokens:
+            units.append((unit_start, unit_end))
+        elif isinstance(node, nested_nodes) and len(node.body) > 1:
+            units.extend(_python_units(line_tokens, lines, node.body, unit_start, unit_end, max_tokens))
+        else:
+            units.extend(_line_units(line_tokens, lines, unit_start, unit_end, max_tokens))
+    return units
+
+# Function to split a source file into chunks of at most max_tokens (a single line larger than max_tokens becomes its own chunk)
+def split_code(code, filename, max_tokens, count_tokens):
+    lines = code.splitlines(keepends=True)
+    line_tokens = [count_tokens(line) for line in lines]
+    units = None
+    if filename.endswith(python_extensions):
+        try:
+            tree = ast.parse(code)
+            if tree.body:
+                units = _python_units(line_tokens, lines, tree.body, 0, len(lines), max_tokens)
+        except (SyntaxError, ValueError):
+            units = None
+    if units is None:
+        units = _line_units(line_tokens, lines, 0, len(lines), max_tokens)
+
+    # Greedy packing of consecutive units into chunks
+    chunks, chunk_start, chunk_tokens = [], 0, 0
+    for unit_start, unit_end in units:
+        unit_tokens = sum(line_tokens[unit_start:unit_end])
+        if chunk_tokens and chunk_tokens + unit_tokens > max_tokens:
+            chunks.append((chunk_start, unit_start, chunk_tokens))
+            chunk_start, chunk_tokens = unit_start, 0
+        chunk_tokens += unit_tokens
+    if chunk_tokens or not chunks:
+        chunks.append((chunk_start, len(lines), chunk_tokens))
+    return [{
+        'start_line': chunk_start + 1,
+        'end_line': chunk_end,
+        'tokens': tokens,
+        'code': ''.join(lines[chunk_start:chunk_end])
+    } for chunk_start, chunk_end, tokens in chunks]
@@ -0,0 +1,190 @@
+'''
+Static Pre-Analysis for the YAML-Based Project Documentation Tool
+
+This module derives, without any LLM call, what can be derived deterministically from a source file: imports,
+module-level constants, classes, functions with their signatures, docstrings and call edges. It is used to seed the
+agents with DataDictionary/codecontext skeletons, and to build a compact outline (signatures, docstrings and call
+edges instead of full bodies) for the optional outline mode. Python is analyzed with `ast`, any other language (or
+Python that does not parse) with a regex fallback.
+'''
+import ast
+import re
+
+python_extensions = ('.py', '.pyw', '.pyi')
+max_constant_repr = 80                                                                # Longer constant values are truncated in skeletons and outlines
+
+# Regex fallback for other languages (JavaScript/TypeScript, Java/C#/Kotlin, Go, Rust, C/C++, PHP, Ruby, shell)
+regex_imports = re.compile(r'^\s*(?:import\s.+|from\s+\S+\s+import\s.+|#include\s*[<"].+[>"]|using\s+[\w.]+\s*;|require\(.+\)|use\s+[\w:]+.*;|package\s+[\w.]+)\s*$')
+regex_classes = re.compile(r'^\s*(?:export\s+)?(?:public\s+|private\s+|protected\s+|abstract\s+|final\s+|static\s+|sealed\s+)*(?:class|interface|struct|enum|trait|type)\s+(\w+)')
+regex_functions = re.compile(r'''^\s*(?:
+      (?:export\s+)?(?:default\s+)?(?:async\s+)?function\s*\*?\s*(?P<js>\w+)\s*\((?P<js_args>[^)]*)\)
+    | func\s+(?:\([^)]*\)\s*)?(?P<go>\w+)\s*\((?P<go_args>[^)]*)\)
+    | (?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn\s+(?P<rs>\w+)\s*(?:<[^>]*>)?\s*\((?P<rs_args>[^)]*)\)
+    | def\s+(?P<rb>[\w?!.]+)\s*(?:\((?P<rb_args>[^)]*)\))?
+    | (?:const|let|var)\s+(?P<arrow>\w+)\s*=\s*(?:async\s+)?\((?P<arrow_args>[^)]*)\)\s*=>
+    | (?:(?:public|private|protected|internal|static|final|virtual|override|abstract|synchronized|inline|extern|const|unsigned|signed)\s+)*
+      [\w<>\[\]:*&,\s]+?\s+[*&]?(?P<c>\w+)\s*\((?P<c_args>[^;{}()]*)\)\s*(?:const\s*)?(?:throws\s+[\w.,\s]+)?\{?\s*$
+    )''', re.X)
+regex_constants = re.compile(r'^(?:export\s+)?(?:const\s+|final\s+|static\s+final\s+|#define\s+)?([A-Z][A-Z0-9_]{2,})\s*(?::[^=]+)?=?\s*(.*?);?\s*$')
+regex_calls = re.compile(r'\b([A-Za-z_][\w.]*)\s*\(')
+regex_keywords = {'if', 'for', 'while', 'switch', 'catch', 'return', 'function', 'sizeof', 'typeof', 'new', 'elif', 'and', 'or', 'not', 'print'}
+
+# Function to render a value for a skeleton or an outline, truncated to max_constant_repr
+def _short(text):
+    text = ' '.join(str(text).split())
+    return text if len(text) <= max_constant_repr else text[:max_constant_repr - 3] + '...'
+
+# Function to list the functions called inside a node, in order of first appearance
+def _python_calls(node):
+    calls = []
+    for child in ast.walk(node):
+        if isinstance(child, ast.Call):
+            try:
+                name = ast.unparse(child.func)
+            except Exception:
+                continue
+            if len(name) <= max_constant_repr and name not in calls:
+                calls.append(name)
+    return calls
+
+# Function to describe a Python function or method: signature, first docstring line and call edges
+def _python_function(node):
+    prefix = 'async def' if isinstance(node, ast.AsyncFunctionDef) else 'def'
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns is not None else ''
+    docstring = ast.get_docstring(node) or ''
+    return {
+        'signature': f"{prefix} {node.name}({ast.unparse(node.args)}){returns}",
+        'docstring': docstring.strip().splitlines()[0] if docstring.strip() else '',
+        'decorators': [_short(ast.unparse(d)) for d in node.decorator_list],
+        'calls': _python_calls(node),
+        'lines': f"{node.lineno}-{node.end_lineno}"
+    }
+
+# Function to analyze Python source with ast
+def _analyze_python(tree):
+    analysis = {'language': 'python', 'docstring': (ast.get_docstring(tree) or '').strip(), 'imports': [], 'constants': {}, 'functions': {}, 'classes': {}}
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            analysis['imports'].append(ast.unparse(node))
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name in ast.walk(target):
+                    if isinstance(name, ast.Name):
+                        analysis['constants'][name.id] = _short(ast.unparse(node.value))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            analysis['functions'][node.name] = _python_function(node)
+        elif isinstance(node, ast.ClassDef):
+            attributes = {}
+            for child in ast.walk(node):
+                if isinstance(child, ast.Attribute) and isinstance(child.value, ast.Name) and child.value.id == 'self' and isinstance(child.ctx, ast.Store):
+                    attributes.setdefault(child.attr, '')
+            for child in node.body:
+                if isinstance(child, (ast.Assign, ast.AnnAssign)):
+                    targets = child.targets if isinstance(child, ast.Assign) else [child.target]
+                    for target in targets:
+                        if isinstance(target, ast.Name):
+                            attributes[target.id] = _short(ast.unparse(child.value)) if child.value is not None else ''
+            docstring = (ast.get_docstring(node) or '').strip()
+            analysis['classes'][node.name] = {
+                'bases': [ast.unparse(base) for base in node.bases],
+                'docstring': docstring.splitlines()[0] if docstring else '',
+                'attributes': attributes,
+                'methods': {child.name: _python_function(child) for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))},
+                'lines': f"{node.lineno}-{node.end_lineno}"
+            }
+    return analysis
+
+# Function to analyze any other language line by line with the regex fallback (calls are attributed to the last declared function)
+def _analyze_regex(code):
+    analysis = {'language': 'other', 'docstring': '', 'imports': [], 'constants': {}, 'functions': {}, 'classes': {}}
+    current = None
+    for number, line in enumerate(code.splitlines(), start=1):
+        if regex_imports.match(line):
+            analysis['imports'].append(line.strip())
+            continue
+        class_match = regex_classes.match(line)
+        if class_match:
+            analysis['classes'].setdefault(class_match.group(1), {'bases': [], 'docstring': '', 'attributes': {}, 'methods': {}, 'lines': str(number)})
+            continue
+        function_match = regex_functions.match(line)
+        if function_match:
+            groups = function_match.groupdict()
+            for kind in ('js', 'go', 'rs', 'rb', 'arrow', 'c'):
+                name = groups.get(kind)
+                if name and name not in regex_keywords:
+                    args = ' '.join((groups.get(f"{kind}_args") or '').split())
+                    current = {'signature': f"{name}({args})", 'docstring': '', 'decorators': [], 'calls': [], 'lines': str(number)}
+                    analysis['functions'].setdefault(name, current)
+                    break
+            continue
+        if not line[:1].isspace():
+            constant_match = regex_constants.match(line)
+            if constant_match:
+                analysis['constants'][constant_match.group(1)] = _short(constant_match.group(2))
+                continue
+        if current is not None:
+            for call in regex_calls.findall(line):
+                if call not in regex_keywords and call not in current['calls']:
+                    current['calls'].append(call)
+    return analysis
+
+# Function to analyze a source file (Python with ast, anything else with the regex fallback)
+def analyze_code(code, filename):
+    if filename.endswith(python_extensions):
+        try:
+            return _analyze_python(ast.parse(code))
+        except (SyntaxError, ValueError):
+            pass
+    return _analyze_regex(code)
+
+# Function to build the DataDictionary/codecontext skeletons the agents are seeded with (they complete the descriptions)
+def build_skeleton(analysis):
+    data_dictionary, codecontext = {}, {}
+    if analysis['constants']:
+        data_dictionary['Module Constants'] = {name: f"= {value}" for name, value in analysis['constants'].items()}
+    for name, details in analysis['classes'].items():
+        if details['attributes']:
+            data_dictionary[name] = {attribute: (f"= {value}" if value else "") for attribute, value in details['attributes'].items()}
+        for method, method_details in details['methods'].items():
+            codecontext[f"{name}.{method}"] = {'Signature': method_details['signature'], 'Description': method_details['docstring']}
+    for name, details in analysis['functions'].items():
+        codecontext[name] = {'Signature': details['signature'], 'Description': details['docstring']}
+    return {'DataDictionary': data_dictionary, 'codecontext': codecontext}
+
+# Function to render a function in an outline: signature, docstring and call edges, the body is omitted
+def _outline_function(details, indent):
+    lines = [f"{indent}@{decorator}" for decorator in details['decorators']]
+    lines.append(f"{indent}{details['signature']}:")
+    if details['docstring']:
+        lines.append(f'{indent}    """{details["docstring"]}"""')
+    if details['calls']:
+        lines.append(f"{indent}    # calls: {', '.join(details['calls'])}")
+    lines.append(f"{indent}    ...  # lines {details['lines']}")
+    return lines
+
+# Function to build the compact outline sent instead of the full source in outline mode
+def build_outline(analysis, filename):
+    lines = [f"# OUTLINE of {filename}: imports, constants, signatures, docstrings and call edges only, function bodies are omitted"]
+    if analysis['docstring']:
+        lines.append(f'"""{analysis["docstring"]}"""')
+    lines += analysis['imports']
+    lines += [f"{name} = {value}" for name, value in analysis['constants'].items()]
+    for name, details in analysis['classes'].items():
+        bases = f"({', '.join(details['bases'])})" if details['bases'] else ''
+        lines.append(f"class {name}{bases}:")
+        if details['docstring']:
+            lines.append(f'    """{details["docstring"]}"""')
+        lines += [f"    {attribute} = {value}" if value else f"    self.{attribute}" for attribute, value in details['attributes'].items()]
+        for method_details in details['methods'].values():
+            lines += _outline_function(method_details, '    ')
+    for details in analysis['functions'].values():
+        lines += _outline_function(details, '')
+    return '\n'.join(lines) + '\n'
+
+# Function to list the symbol names found by the pre-analysis (used to measure how much of a file a report covers)
+def symbol_names(analysis):
+    names = set(analysis['constants']) | set(analysis['functions']) | set(analysis['classes'])
+    for details in analysis['classes'].values():
+        names |= set(details['methods']) | set(details['attributes'])
+    return names
@@ -0,0 +1,89 @@
+'''
+Duplicate Collapsing for the YAML-Based Project Documentation Tool
+
+This module keeps copies of the same file from costing more than one documentation run. Exact duplicates (same MD5,
+e.g. the license headers, `__init__.py` files and copied utilities of a monorepo or a vendored tree) are collapsed into
+their shallowest path: that file is scanned once, and its result is fanned out to the report of every copy. Optionally,
+near-duplicates are found with MinHash over shingles of the normalized source (tokens only, so layout and whitespace do
+not count) and an LSH index, and reuse the result of their most similar sibling. Those reports are marked with the
+sibling's path and the estimated similarity.
+'''
+import hashlib
+import random
+import re
+
+shingle_size = 5                                                                      # Tokens per shingle
+minhash_permutations = 64                                                             # Signature length (the similarity estimate is within ~0.05 at 0.9)
+lsh_bands = 16                                                                        # 16 bands of 4 rows: pairs above ~0.5 similarity become candidates
+mersenne_prime = (1 << 61) - 1
+token_re = re.compile(r'\w+|[^\w\s]')
+
+# Fixed seed, so the same file always gets the same signature
+_rng = random.Random(1)
+permutations = [(_rng.randrange(1, mersenne_prime), _rng.randrange(0, mersenne_prime)) for _ in range(minhash_permutations)]
+
+# Function to compute the MinHash signature of a piece of source code (None when there is nothing to compare)
+def minhash_signature(code):
+    tokens = token_re.findall(code)
+    if not tokens:
+        return None
+    shingles = {' '.join(tokens[i:i + shingle_size]) for i in range(max(1, len(tokens) - shingle_size + 1))}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big') for shingle in shingles]
+    return [min((a * h + b) % mersenne_prime for h in hashes) for a, b in permutations]
+
+# Function to estimate the Jaccard similarity of two files from their signatures
+def signature_similarity(signature, other):
+    return sum(1 for x, y in zip(signature, other) if x == y) / minhash_permutations
+
+# Function to describe a plan entry as a duplicate of another (what the fan-out needs to write its report)
+def as_duplicate(item, similarity):
+    return {
+        'relpath': item['relpath'],
+        'dirpath': item['dirpath'],
+        'filename': item['filename'],
+        'md5': item['md5'],
+        'lines_of_code': item.get('lines_of_code', 0),
+        'est_tokens': item['est_tokens'],
+        'est_cost': item['est_cost'],
+        'similarity': round(similarity, 4)
+    }
+
+# Function to attach near-duplicates to their most similar sibling (greedy: the most copied, then the largest variant is scanned, so most reports stay exact)
+def _collapse_near_duplicates(leaders, threshold):
+    rows = minhash_permutations // lsh_bands
+    index, kept = {}, set()
+    for item in sorted(leaders, key=lambda item: (-len(item['duplicates']), -item.get('tokens', 0), item['relpath'])):
+        signature = item.get('minhash')
+        if signature is not None and not item.get('cached'):                           # A cached file has its own result, it never borrows one
+            candidates = {id(other): other for band in range(lsh_bands) for other in index.get((band, tuple(signature[band * rows:(band + 1) * rows])), [])}
+            scored = [(signature_similarity(signature, other['minhash']), other['relpath'], other) for other in candidates.values()]
+            if scored:
+                similarity, _, sibling = max(scored, key=lambda entry: (entry[0], entry[1]))
+                if similarity >= threshold:
+                    sibling['duplicates'] += [as_duplicate(item, similarity)] + [dict(duplicate, similarity=round(similarity, 4)) for duplicate in item['duplicates']]
+                    continue
+        kept.add(id(item))
+        if signature is not None:
+            for band in range(lsh_bands):
+                index.setdefault((band, tuple(signature[band * rows:(band + 1) * rows])), []).append(item)
+    return [item for item in leaders if id(item) in kept]
+
+# Function to collapse the duplicates of an estimated plan (entries need md5, and minhash for the near-duplicates)
+# Returns the entries to scan, in plan order: each has a 'duplicates' list with the copies its result is fanned out to
+def collapse_duplicates(plan, near_threshold=0.0):
+    groups = {}
+    for item in plan:
+        if item.get('md5'):
+            groups.setdefault(item['md5'], []).append(item)
+    leaders = []
+    for item in plan:
+        group = groups.get(item.get('md5'), [item])
+        leader = min(group, key=lambda other: (other['relpath'].count('/'), other['relpath']))    # The shallowest copy is the canonical one (vendored copies sit deeper)
+        if item is leader:
+            item['duplicates'] = [as_duplicate(other, 1.0) for other in group if other is not leader]
+            leaders.append(item)
+    if near_threshold:
+        leaders = _collapse_near_duplicates(leaders, near_threshold)
+    for item in plan:
+        item.pop('minhash', None)
+    return leaders
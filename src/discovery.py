@@ -0,0 +1,252 @@
+'''
+Repository Discovery for the YAML-Based Project Documentation Tool
+
+This module decides, before any file is read in full, which files of a repository are worth a documentation run. It walks
+the tree with `os.scandir` (one stat per entry, pruned directories are never entered), honors `.gitignore` files (and
+`.git/info/exclude`) with the usual gitignore pattern rules, and applies a project-level include/exclude config
+(`.genmermaid.yml` at the root of the scanned repository, or any file given with `--discovery-config`). Files are further
+filtered by an extension allowlist, size thresholds and heuristics for vendored, generated and minified code. The result
+is a plan ordered by estimated token cost, plus the skipped files and the reason each was skipped.
+
+Project-level config (every key is optional; `include`/`exclude`/`priority`/`extensions`/`filenames`/`vendored_dirs`
+extend the defaults, the other keys replace them):
+
+    include: [src/, lib/**/*.py]            # When set, only matching files are planned (a vendored folder it names, e.g. out/, is walked)
+    exclude: [migrations/, "*_test.go"]     # Always skipped (gitignore pattern syntax)
+    extensions: [.proto]
+    vendored_dirs: ["!build"]               # '!name' takes a default off the list (extensions, filenames, vendored_dirs)
+    max_file_bytes: 1048576
+    priority: [src/core/, "*.sql"]          # Scheduling order with --schedule priority (first matching pattern wins)
+'''
+import logging
+import os
+import re
+
+import yaml
+
+project_config_name = '.genmermaid.yml'
+generated_sniff_bytes = 4096                                                          # Generated/minified heuristics only look at this prefix
+
+# Default discovery settings (see the module docstring for the project-level overrides)
+default_config = {
+    'respect_gitignore': True,
+    'include': [],
+    'exclude': ['/' + project_config_name],
+    'extensions': [
+        '.py', '.pyw', '.pyi', '.js', '.jsx', '.mjs', '.cjs', '.ts', '.tsx', '.vue', '.svelte', '.java', '.kt', '.kts', '.scala',
+        '.groovy', '.go', '.rs', '.c', '.h', '.cc', '.cpp', '.cxx', '.hpp', '.hh', '.cs', '.fs', '.php', '.rb', '.swift', '.m', '.mm',
+        '.dart', '.lua', '.pl', '.pm', '.r', '.jl', '.ex', '.exs', '.erl', '.hs', '.clj', '.elm', '.sh', '.bash', '.zsh', '.ps1',
+        '.sql', '.tf', '.proto', '.graphql', '.yml', '.yaml', '.toml', '.ini', '.cfg'
+    ],
+    'filenames': ['Dockerfile', 'Makefile', 'Jenkinsfile', 'Vagrantfile', 'Rakefile', 'Procfile'],
+    'min_file_bytes': 16,                                                             # Empty or trivial files (e.g. an empty __init__.py) are not worth a conversation
+    'max_file_bytes': 2 * 1024 * 1024,                                                # Larger files are almost always data or generated code
+    'bytes_per_token': 4,                                                             # Token estimate used to order the plan (no file is read for it)
+    'vendored_dirs': [
+        '.git', '.hg', '.svn', 'node_modules', 'bower_components', 'jspm_packages', 'vendor', 'third_party', 'third-party',
+        'site-packages', '.venv', 'venv', '.tox', '.nox', '.mypy_cache', '.pytest_cache', '.ruff_cache', '__pycache__',
+        '.ipynb_checkpoints', '.idea', '.vscode', 'dist', 'build', 'target', 'out', '.next', '.nuxt', 'coverage', '.gradle', 'Pods'
+    ],
+    'generated_names': [
+        '*.min.js', '*.min.css', '*.bundle.js', '*.map', '*_pb2.py', '*_pb2_grpc.py', '*.pb.go', '*.pb.cc', '*.pb.h', '*.g.dart',
+        '*.generated.*', '*.designer.cs', '*.egg*', 'package-lock.json', 'yarn.lock', 'pnpm-lock.yaml', 'poetry.lock', 'Pipfile.lock',
+        'Cargo.lock', 'composer.lock', 'Gemfile.lock', 'go.sum'
+    ],
+    'generated_markers': ['@generated', 'DO NOT EDIT', 'Code generated by', 'auto-generated', 'autogenerated', 'Generated by the protocol buffer compiler'],
+    'sniff_generated': True,                                                          # Read the first bytes of every candidate to spot generated/minified files
+    'priority': []                                                                    # Patterns scheduled first with --schedule priority, in order
+}
+list_keys = ('include', 'exclude', 'priority', 'extensions', 'filenames', 'vendored_dirs', 'generated_names', 'generated_markers')
+removable_keys = ('extensions', 'filenames', 'vendored_dirs')                          # Plain names, not patterns: '!name' removes a default
+
+# Function to translate a gitignore pattern into regular expressions for the path itself and for anything below it
+def _pattern_regex(pattern):
+    anchored = '/' in pattern.rstrip('/')
+    pattern = pattern.strip('/')
+    out, i = '', 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out, i = out + '(?:.*/)?', i + 3
+            continue
+        if pattern.startswith('**', i):
+            out, i = out + '.*', i + 2
+            continue
+        c = pattern[i]
+        if c == '*':
+            out += '[^/]*'
+        elif c == '?':
+            out += '[^/]'
+        elif c == '[' and pattern.find(']', i + 2) != -1:
+            j = pattern.find(']', i + 2)
+            body = pattern[i + 1:j]
+            out += '[' + ('^' + body[1:] if body[:1] in ('!', '^') else body).replace('\\', '\\\\') + ']'
+            i = j
+        elif c == '\\' and i + 1 < len(pattern):
+            out, i = out + re.escape(pattern[i + 1]), i + 1
+        else:
+            out += re.escape(c)
+        i += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    return re.compile(f'^{prefix}{out}$'), re.compile(f'^{prefix}{out}/')
+
+# Function to parse gitignore-style lines into rules: (base folder, negated, directory only, exact regex, below regex)
+def parse_rules(lines, base=''):
+    rules = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        if not line.strip() or line.startswith('#'):
+            continue
+        line = line.rstrip() if not line.endswith('\\ ') else line
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        if line.startswith('\\'):
+            line = line[1:]
+        exact, below = _pattern_regex(line)
+        rules.append((base, negated, line.endswith('/'), exact, below))
+    return rules
+
+# Function to tell whether a path is ignored by a list of rules (the last matching rule wins, as in git)
+def is_ignored(rules, relpath, is_dir):
+    ignored = False
+    for base, negated, dir_only, exact, below in rules:
+        if base:
+            if not relpath.startswith(base + '/'):
+                continue
+            path = relpath[len(base) + 1:]
+        else:
+            path = relpath
+        if (exact.match(path) and (is_dir or not dir_only)) or below.match(path):
+            ignored = not negated
+    return ignored
+
+# Function to tell whether a list of rules names a folder itself (not merely something above it), the last matching rule winning
+def names_folder(rules, relpath):
+    named = False
+    for base, negated, dir_only, exact, below in rules:
+        if base:
+            if not relpath.startswith(base + '/'):
+                continue
+            path = relpath[len(base) + 1:]
+        else:
+            path = relpath
+        if exact.match(path):
+            named = not negated
+    return named
+
+# Function to read the ignore rules of a folder (its .gitignore, plus .git/info/exclude at the repository root)
+def read_ignore_rules(dirpath, relpath):
+    rules = []
+    sources = [os.path.join(dirpath, '.gitignore')]
+    if not relpath:
+        sources.insert(0, os.path.join(dirpath, '.git', 'info', 'exclude'))
+    for source in sources:
+        try:
+            with open(source, 'r', encoding='utf-8', errors='replace') as f:
+                rules += parse_rules(f, relpath)
+        except OSError:
+            continue
+    return rules
+
+# Function to load the discovery config: defaults, then the project-level config of the scanned repository (or the given file)
+def load_discovery_config(repo_to_scan, config_path=None):
+    config = {k: list(v) if isinstance(v, list) else v for k, v in default_config.items()}
+    path = config_path or os.path.join(repo_to_scan, project_config_name)
+    if not os.path.isfile(path):
+        if config_path:
+            logging.error("Discovery config not found: %s", config_path)
+        return config
+    with open(path, 'r', encoding='utf-8') as f:
+        overrides = yaml.safe_load(f) or {}
+    for k, v in overrides.items():
+        if k not in default_config:
+            logging.warning("Unknown discovery setting ignored: %s (%s)", k, path)
+        elif k in removable_keys:
+            removed = {str(value)[1:] for value in v or [] if str(value).startswith('!')}           # '!build' takes a default name off the list
+            config[k] = [value for value in config[k] if value not in removed] + [value for value in v or [] if not str(value).startswith('!')]
+        elif k in list_keys:
+            config[k] += list(v or [])
+        else:
+            config[k] = v
+    logging.info("DISCOVERY CONFIG: %s", path)
+    return config
+
+# Function to spot generated or minified code from the first bytes of a file
+def generated_reason(path, config):
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(generated_sniff_bytes)
+    except OSError:
+        return None
+    return sniff_head(head, config)
+
+# Function to spot generated or minified code from the first bytes of a file that were already read (only the first generated_sniff_bytes count)
+def sniff_head(head, config):
+    head = head[:generated_sniff_bytes]
+    text = head.decode('utf-8', errors='replace')
+    if any(marker in text for marker in config['generated_markers']):
+        return 'generated'
+    if len(head) == generated_sniff_bytes and head.count(b'\n') <= 1:                  # 4 KiB without a line break is a minified bundle, not hand-written code
+        return 'minified'
+    return None
+
+# Function to plan a scan: walk the repository, prune ignored/vendored folders and unwanted files, order the rest by estimated tokens
+# Returns (plan, skipped): plan entries are dicts with dirpath, filename, relpath, size and est_tokens; skipped is a list of (relpath, reason)
+def discover_files(repo_to_scan, config):
+    plan, skipped = [], []
+    extensions = {extension.lower() for extension in config['extensions']}
+    vendored = set(config['vendored_dirs'])
+    include = parse_rules(config['include'])
+    exclude = parse_rules(config['exclude'])
+    generated = parse_rules(config['generated_names'])
+    stack = [(repo_to_scan, '', [])]
+    while stack:
+        dirpath, relpath, rules = stack.pop()
+        if config['respect_gitignore']:
+            rules = rules + read_ignore_rules(dirpath, relpath)
+        try:
+            with os.scandir(dirpath) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logging.error("FOLDER UNREADABLE: %s - %s", dirpath, e)
+            continue
+        for entry in entries:
+            entry_relpath = f"{relpath}/{entry.name}" if relpath else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if (entry.name in vendored or entry.name.endswith('.egg-info')) and not (include and names_folder(include, entry_relpath)):
+                    skipped.append((entry_relpath + '/', 'vendored'))
+                elif rules and is_ignored(rules, entry_relpath, True):
+                    skipped.append((entry_relpath + '/', 'gitignore'))
+                elif exclude and is_ignored(exclude, entry_relpath, True):
+                    skipped.append((entry_relpath + '/', 'excluded'))
+                else:
+                    stack.append((entry.path, entry_relpath, rules))
+                continue
+            if not entry.is_file():
+                continue
+            reason = None
+            if rules and is_ignored(rules, entry_relpath, False):
+                reason = 'gitignore'
+            elif exclude and is_ignored(exclude, entry_relpath, False):
+                reason = 'excluded'
+            elif include and not is_ignored(include, entry_relpath, False):
+                reason = 'not_included'
+            elif is_ignored(generated, entry_relpath, False):
+                reason = 'generated'
+            elif os.path.splitext(entry.name)[1].lower() not in extensions and entry.name not in config['filenames']:
+                reason = 'extension'
+            else:
+                stat = entry.stat()
+                size = stat.st_size
+                if size < config['min_file_bytes']:
+                    reason = 'too_small'
+                elif size > config['max_file_bytes']:
+                    reason = 'too_large'
+                elif config['sniff_generated']:
+                    reason = generated_reason(entry.path, config)
+            if reason:
+                skipped.append((entry_relpath, reason))
+                continue
+            plan.append({'dirpath': dirpath, 'filename': entry.name, 'relpath': entry_relpath, 'size': size, 'mtime_ns': stat.st_mtime_ns, 'est_tokens': size // config['bytes_per_token']})
+    plan.sort(key=lambda item: (item['est_tokens'], item['relpath']))                  # Cheapest first: most of the repository is documented early
+    return plan, skipped
@@ -27,53 +27,122 @@ Author Information:
 
 '''
 
-# Import necessary Libraries for the scanner functionality
-from autogen import AssistantAgent, UserProxyAgent, GroupChat, GroupChatManager, OpenAIWrapper, gather_usage_summary
+# Import necessary Libraries for the scanner functionality (autogen, openai, tiktoken and chardet are imported where they are first needed, so that
+# --help and --plan start without loading the agent framework)
 import os
 import yaml
 import sys
 from dotenv import load_dotenv
-import chardet
 import json
 from datetime import datetime, timedelta
 import random
 import hashlib
+import codecs
 import argparse
-import tiktoken
+import ast
+import functools
+import importlib.util
 import logging
+import time
+import re
+from chunker import split_code
+from codeoutline import analyze_code, build_skeleton, build_outline
+from mermaidtools import merge_flowcharts, merge_erdiagrams, validate_flowchart, validate_erdiagram
+from metrics import Metrics, Profiler
+from discovery import load_discovery_config, discover_files, sniff_head
+from scheduler import schedule_orders, schedule_plan, apply_budget, format_plan
+from journal import Journal, journal_path
+from dedup import minhash_signature, collapse_duplicates
+from reportstore import ReportStore, default_store_folder, store_name
+from architecture import build_architecture
+import math
+import signal
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Constants for file paths and model configuration
-reportsdir = './output/'                                                              # Location to store JSON output (one per file)
+reportsdir = default_store_folder                                                     # Location of the report store (and of the read/token size errors)
 feedbackdir = './feedback/'  
 logsdir = './logs/'
 yamlfile = './yaml/promptsmermaid.yml'
+cachedir = './cache/'                                                                 # Content-addressed result cache (one JSON per file content + prompts + model)
+journaldir = './journal/'                                                             # Job journals (one JSONL per repository + prompts), for --resume
 fecha1 = datetime.now().strftime("%Y%m%dT%H%M%S")
 
-# Initialize folders
-os.makedirs(reportsdir, exist_ok=True)
-os.makedirs(feedbackdir, exist_ok=True)
-os.makedirs(logsdir, exist_ok=True)
-
-# Initialize Logging Mechanism
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler(f"{logsdir}scan_{fecha1}.log"),
-        logging.StreamHandler()
-    ]
-)
+# Initialize folders (when a run starts, never at import time): a --plan run only writes to the logs folder
+def init_folders(plan_only=False):
+    for folder in (logsdir,) if plan_only else (reportsdir, feedbackdir, logsdir, cachedir, journaldir):
+        os.makedirs(folder, exist_ok=True)
+
+# Initialize Logging Mechanism (once: a caller that configured logging already keeps its own handlers)
+def setup_logging():
+    if logging.getLogger().handlers:
+        return
+    os.makedirs(logsdir, exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s [%(levelname)s] %(message)s',
+        handlers=[
+            logging.FileHandler(f"{logsdir}scan_{fecha1}.log"),
+            logging.StreamHandler()
+        ]
+    )
 
 # Function to parse command-line arguments (better than doing it in main, scalable)
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Read and document source code repository')
     parser.add_argument('repo_to_scan', type=str, help='Folder to scan')
+    parser.add_argument('--no-cache', action='store_true', help='Do not read or write the result cache')
+    parser.add_argument('--refresh', action='store_true', help='Ignore cached results and re-scan every file, near-duplicates included (the cache is rewritten)')
+    parser.add_argument('--workers', type=int, default=1, help='Number of files scanned concurrently (default: 1)')
+    parser.add_argument('--chunk-tokens', type=int, default=30000, help='Files over the context size are documented in chunks of up to this many tokens (default: 30000)')
+    parser.add_argument('--speaker-selection', choices=['fixed', 'auto'], default='fixed', help='fixed: deterministic coder/reviewer turns, auto: GroupChatManager LLM selection (default: fixed)')
+    parser.add_argument('--trust-valid', action='store_true', help='Approve results that pass the local Mermaid/JSON validation without the LLM review')
+    parser.add_argument('--outline', action='store_true', help='Send compact outlines (signatures, docstrings, call edges) instead of the full source')
+    parser.add_argument('--rpm', type=int, default=int(os.getenv('OPENAI_RPM', 0)), help='Requests-per-minute quota shared by all workers (0: unlimited)')
+    parser.add_argument('--tpm', type=int, default=int(os.getenv('OPENAI_TPM', 0)), help='Tokens-per-minute quota shared by all workers (0: unlimited)')
+    parser.add_argument('--metrics-file', type=str, default=os.getenv('METRICS_TEXTFILE') or f"{logsdir}genmermaid.prom", help='Prometheus textfile snapshot of the scan metrics')
+    parser.add_argument('--near-duplicates', type=float, default=0.0, help='Reuse the result of a near-identical file at or above this MinHash similarity, e.g. 0.9 (0: exact duplicates only)')
+    parser.add_argument('--architecture', action='store_true', help='After the scan, document the packages and the repository from the per-file results (only the ancestors of changed files)')
+    parser.add_argument('--watch', type=float, default=0.0, metavar='SECONDS', help='Stay resident after the scan: poll the folder every SECONDS and rescan only the files added or modified (0: scan once and exit)')
+    parser.add_argument('--resume', action='store_true', help='Resume the last run on this folder: files already done (and unchanged) are not scanned again')
+    parser.add_argument('--plan', action='store_true', help='Print the scan plan with the pre-flight token and cost estimates, then exit without any API call')
+    parser.add_argument('--budget-usd', type=float, default=0.0, help='Stop planning (and scanning) files beyond this estimated cost in USD (0: unlimited)')
+    parser.add_argument('--budget-tokens', type=int, default=0, help='Stop planning (and scanning) files beyond this many estimated tokens (0: unlimited)')
+    parser.add_argument('--schedule', choices=schedule_orders, default='largest-first', help='Scan order: largest-first, cheapest-first, or the discovery config priority patterns (default: largest-first)')
+    parser.add_argument('--discovery-config', type=str, default=None, help='Include/exclude config for the discovery (default: .genmermaid.yml in the scanned folder, if any)')
+    parser.add_argument('--profile', action='store_true', help='Profile the scan with cProfile and tracemalloc (written to the logs folder)')
     return parser.parse_args()
 
 # Location to store feedback JSON output for improvement
 temperature = 0.2
 context_size = 120000
 semilla = random.randint(100, 999)
+cache_max_age_days = 30                                                               # Cached results older than this are evicted
+cache_max_size_mb = 512                                                               # Oldest cached results are evicted beyond this size
+result_keys = ("SUMMARY", "DFD", "ERD", "DataDictionary", "codecontext")
+nextstep_re = re.compile(r'NEXTSTEP\W*(REVISE|TERMINATE)')
+ingest_block_size = 1024 * 1024                                                       # Files are read (and hashed) in blocks of this size
+encoding_sniff_bytes = 64 * 1024                                                      # Binary sniffing and encoding detection only look at this prefix
+token_count_slice = 64 * 1024                                                         # Tokens are counted in slices of this many characters (early stop)
+text_bytes = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)) - {0x7f})
+max_local_revisions = 3                                                               # Malformed results sent back by the local validator before deferring to the LLM review
+history_window_size = 2                                                               # Messages kept after the code submission (latest submission + reviewer feedback)
+completion_reserve = 2000                                                             # Tokens reserved per request for the completion when rate-limiting on TPM
+estimate_coder_rounds = 1.5                                                           # Pre-flight estimate: average core_coder_agent submissions per conversation
+estimate_completion_ratio = 0.35                                                      # Pre-flight estimate: core_coder_agent completion tokens per source token...
+estimate_completion_range = (500, 4096)                                               # ...kept within this range
+estimate_review_tokens = 250                                                          # Pre-flight estimate: completion tokens of a reviewer verdict
+estimate_workers = 8                                                                  # Files estimated in parallel before the scan
+estimate_chars_per_token = 4                                                          # Pre-flight estimate without --plan or a budget: tokens from the size, the file is not tokenized twice
+chat_max_attempts = 4                                                                 # Attempts per conversation on transient API failures (on top of the OpenAI client retries)
+retry_base_delay = 2                                                                  # Seconds before the first retry, doubled at every attempt (with jitter)...
+retry_max_delay = 60                                                                  # ...up to this many seconds
+breaker_threshold = 5                                                                 # Consecutive transient failures (any worker) that open the circuit breaker
+breaker_cooldown = 60                                                                 # Seconds the whole run pauses before a single probe conversation is let through
+report_keep_versions = 5                                                              # Reports kept per path, older versions are dropped after every run...
+report_max_age_days = 90                                                              # ...as are superseded versions older than this (the latest report of a path is always kept)
 
 ############################################## CODE NOT SERVICEABLE BEYOND THIS LINE ##########################################################
 
@@ -88,11 +157,17 @@ def load_yaml_file(yaml_file_path):
 load_dotenv(override=True)
 api_key = os.getenv('OPEN_AI_API_KEY2')                                               # Use the 'Project' API key 
 model_name = os.getenv('MODEL_NAME')                                                  # I select the model in the YAML file
+base_url = os.getenv('MODEL_BASE_URL')                                                # Optional OpenAI-compatible endpoint (e.g. the offline benchmark mock server)
+price_1k = os.getenv('MODEL_PRICE_1K')                                                # Optional "prompt,completion" USD per 1K tokens, for models autogen has no price for
 
 # Base config for OpenAI
 config_list_openai = [
     {"model": model_name, "api_key": api_key}
 ]
+if base_url:
+    config_list_openai[0]["base_url"] = base_url
+if price_1k:
+    config_list_openai[0]["price"] = [float(price) for price in price_1k.split(',')]
 llm_config = {
     "seed": semilla,                                                                   # change the seed for different trials
     "config_list": config_list_openai,
@@ -101,53 +176,168 @@ llm_config = {
     "response_format": {'type': "json_object"},                                        # This is KEY, only GPT-4o is consistent in JSON, I tried OSS ones (All Mistral ones, llama 3, and Hermes variants, and even GPT-4o-mini, but these are NOT consistent, they deviate.
 }
 
-# Initialize variables
-sum_total_tokens, sum_total_cost, sum_error = 0, 0.0, 0
-encoding = tiktoken.get_encoding("cl100k_base")
+# Encoding used to count tokens, loaded on first use and kept for the life of the process (watch mode counts with a warm encoding)
+@functools.lru_cache(maxsize=None)
+def get_encoding():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+# Byte order marks, UTF-32 first (its little-endian mark starts with the UTF-16 one)
+boms = ((codecs.BOM_UTF32_LE, 'utf-32'), (codecs.BOM_UTF32_BE, 'utf-32'), (codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
 
-# Function to read a file and determine its encoding
-def read_file(file_path):
+# Function to read the encoding announced by a byte order mark (None without one)
+def bom_encoding(prefix):
+    for bom, encoding in boms:
+        if prefix.startswith(bom):
+            return encoding
+    return None
+
+# Function to tell binary content from text on a bounded prefix (NUL bytes, or too many control characters)
+def is_binary(prefix):
+    if not prefix:
+        return False
+    if b'\x00' in prefix:
+        return True
+    non_text = prefix.translate(None, text_bytes)
+    return len(non_text) / len(prefix) > 0.30
+
+# Function to decode a file's bytes (the encoding of its byte order mark, UTF-8, then the chardet guess on a bounded prefix, then Latin-1 which never fails)
+def decode_bytes(raw_data):
+    encoding = bom_encoding(raw_data)
+    if encoding:
+        try:
+            return raw_data.decode(encoding), encoding
+        except UnicodeDecodeError:
+            pass
     try:
-        with open(file_path, 'rb') as f:
-            raw_data = f.read()
-        encoding = chardet.detect(raw_data)['encoding']
-        return raw_data.decode(encoding)
+        return raw_data.decode('utf-8'), 'utf-8'
     except UnicodeDecodeError:
+        pass
+    import chardet
+    detected = chardet.detect(raw_data[:encoding_sniff_bytes])['encoding']
+    if detected:
         try:
-            with open(file_path, "r", encoding='Latin-1') as f:                         # I added latin since the chardet library is for some reason ignoring this one . weird.
-                raw_data = f.read()
-            return raw_data
-        except Exception:
-            return None
+            return raw_data.decode(detected), detected
+        except (UnicodeDecodeError, LookupError):
+            pass
+    return raw_data.decode('Latin-1'), 'Latin-1'                                                 # I added latin since the chardet library is for some reason ignoring this one . weird.
 
-# Function to count tokens in a given text (uses tiktoken and cl100k_base)
-def count_tokens(text, filename):
-    global context_size
-    try:
-        num_tokens = encoding.encode(text)
-        if len(num_tokens) > context_size:
-            raise ValueError(f'Token limit exceeded: {len(num_tokens)} tokens (limit is {context_size} tokens)')
-    except ValueError as e:
-        fecha = datetime.now().strftime("%Y%m%dT%H%M%S")
-        error_message = f"ERROR: [Timestamp: {fecha}] - [File Size limit exceeded: {len(num_tokens)} tokens (limit is {context_size} tokens)]"
-        output_filename = f"{reportsdir}/TOKEN_SIZE_ERROR_{filename}_{fecha}.txt"
-        with open(output_filename, "w") as f:
-            f.write(error_message)
-        logging.error(error_message)
-        return False
-    return True
+# Function to count tokens in a given text (uses tiktoken and cl100k_base), it stops as soon as the limit is exceeded
+def count_tokens(text, limit=None):
+    num_tokens, start = 0, 0
+    while start < len(text):
+        end = text.find('\n', start + token_count_slice)                                         # Slice on line boundaries so no token straddles two slices
+        end = len(text) if end == -1 else end + 1
+        num_tokens += len(get_encoding().encode(text[start:end], disallowed_special=()))
+        if limit is not None and num_tokens > limit:
+            break
+        start = end
+    return num_tokens
 
-# Function to calculate MD5 hash of a file's contents (for integrity and non-repudiation)
-def calculate_md5(file_path):
+# Function to ingest a file in a single pass: read once, hash while reading, reject binaries early, decode and count tokens up to token_limit (None: all of them)
+# With count=False the tokens are not counted (tokens and over_limit are None)
+def ingest_file(file_path, token_limit=context_size, count=True):
     hasher = hashlib.md5()
-    with open(file_path, "rb") as f:
-        buf = f.read()
-        hasher.update(buf)
-    return hasher.hexdigest()
-
-# Function to save the vulnerability report in JSON format (here it appends the value-keys below, to the value-keys already generated as per the YAML prompt and YAML examples.)
-def save_vulnerability_report(vuln_data, filename, path, duration, md5, total_tokens, total_cost, lines_of_code, target):
-    global reportsdir
+    chunks = []
+    read_start = time.perf_counter()
+    with open(file_path, 'rb') as f:
+        for buf in iter(lambda: f.read(ingest_block_size), b''):
+            if not chunks and not bom_encoding(buf) and is_binary(buf[:encoding_sniff_bytes]):     # UTF-16/32 text is full of NUL bytes, its BOM tells it apart
+                return None
+            hasher.update(buf)
+            chunks.append(buf)
+    raw_data = b''.join(chunks)
+    code, detected = decode_bytes(raw_data)
+    tokenize_start = time.perf_counter()
+    num_tokens = count_tokens(code, token_limit) if count else None
+    return {
+        'code': code,
+        'head': raw_data[:encoding_sniff_bytes],
+        'md5': hasher.hexdigest(),
+        'encoding': detected,
+        'tokens': num_tokens,
+        'over_limit': num_tokens > context_size if count else None,
+        'lines_of_code': len(code.splitlines()),
+        'read_seconds': tokenize_start - read_start,
+        'tokenize_seconds': time.perf_counter() - tokenize_start
+    }
+
+# Function to record a file dropped for exceeding context_size
+def report_token_size_error(filename, num_tokens):
+    fecha = datetime.now().strftime("%Y%m%dT%H%M%S")
+    error_message = f"ERROR: [Timestamp: {fecha}] - [File Size limit exceeded: at least {num_tokens} tokens (limit is {context_size} tokens)]"
+    output_filename = f"{reportsdir}/TOKEN_SIZE_ERROR_{filename}_{fecha}.txt"
+    with open(output_filename, "w") as f:
+        f.write(error_message)
+    logging.error(error_message)
+
+# Function to hash the loaded YAML prompts and the prompt mode (any prompt change invalidates the cached results)
+def calculate_prompt_hash(prompts, prompt_mode="full"):
+    return hashlib.md5(json.dumps([prompts, prompt_mode], sort_keys=True).encode('utf-8')).hexdigest()
+
+# Function to build the cache key of a file: content hash + prompt hash + model + temperature
+def cache_key(md5, prompt_hash):
+    return hashlib.sha256(f"{md5}|{prompt_hash}|{model_name}|{temperature}".encode('utf-8')).hexdigest()
+
+# Function to load a cached result (None on a miss, on an expired entry, or on a corrupted entry)
+def load_cached_result(key):
+    cache_path = os.path.join(cachedir, f"{key}.json")
+    try:
+        if time.time() - os.path.getmtime(cache_path) > cache_max_age_days * 86400:
+            os.remove(cache_path)
+            return None
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            entry = json.load(f)
+        os.utime(cache_path)                                                                  # Touch the entry so the size-based eviction drops the least recently used first
+    except (OSError, json.JSONDecodeError):
+        return None
+    if not all(k in entry.get("result", {}) for k in result_keys):
+        return None
+    return entry
+
+# Function to store a result in the cache (only the keys generated by the agents, not the per-run metadata)
+def save_cached_result(key, result, md5, prompt_hash, total_tokens, total_cost):
+    entry = {
+        'md5_hash': md5,
+        'prompt_hash': prompt_hash,
+        'model': model_name,
+        'temperature': temperature,
+        'cached_at': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"),
+        'total_tokens': total_tokens,
+        'total_cost': total_cost,
+        'result': {k: result[k] for k in result_keys}
+    }
+    cache_path = os.path.join(cachedir, f"{key}.json")
+    tmp_path = f"{cache_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, cache_path)                                                          # Atomic, so an interrupted run never leaves half an entry behind
+
+# Function to evict expired cache entries, then the least recently used ones until the cache fits its size budget
+def evict_cache():
+    now, entries, evicted = time.time(), [], 0
+    with os.scandir(cachedir) as it:
+        for entry in it:
+            if not entry.name.endswith('.json') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > cache_max_age_days * 86400:
+                os.remove(entry.path)
+                evicted += 1
+            else:
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= cache_max_size_mb * 1024 * 1024:
+            break
+        os.remove(path)
+        total_size -= size
+        evicted += 1
+    if evicted:
+        logging.info("CACHE EVICTED: %s entries", evicted)
+
+# Function to save the vulnerability report in the report store (here it appends the value-keys below, to the value-keys already generated as per the YAML prompt and YAML examples.)
+def save_vulnerability_report(store, vuln_data, filename, path, duration, md5, total_tokens, total_cost, lines_of_code, target, cache_hit=False, prompt_tokens_saved=0, prompt_mode="full", duplicate_of=None, similarity=None, prompt_hash=None):
     vuln_data.update({
         'filename': filename,
         'file_path': path,
@@ -157,17 +347,22 @@ def save_vulnerability_report(vuln_data, filename, path, duration, md5, total_to
         'total_tokens': total_tokens,
         'total_cost': total_cost,
         'lines_of_code': lines_of_code,
-        'scan_type': target
+        'scan_type': target,
+        'cache_hit': cache_hit,
+        'prompt_tokens_saved': prompt_tokens_saved,
+        'prompt_mode': prompt_mode,
+        'duplicate_of': duplicate_of,
+        'similarity': similarity,
+        'model': model_name,
+        'prompt_hash': prompt_hash
     })
-    report_filename = f"scan_report_{filename}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
-    report_path = os.path.join(reportsdir, report_filename)
-    with open(report_path, "w") as f:
-        json.dump(vuln_data, f, indent=4)
+    store.save(vuln_data)
 
 # Save JSON with the challenge (if any) from the adversary agent. To be used for manual prompt engineeringg / improvement.
-def save_feedback_report(vuln_data):
+# Named after the scanned file, with a microsecond timestamp and a random suffix: workers (and rounds) saving at once never overwrite each other
+def save_feedback_report(vuln_data, filename):
     global feedbackdir
-    report_filename = f"feedback_report_{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    report_filename = f"feedback_report_{filename}_{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{uuid.uuid4().hex[:8]}.json"
     report_path = os.path.join(feedbackdir, report_filename)
     with open(report_path, "w") as f:
         json.dump(vuln_data, f, indent=4)
@@ -180,31 +375,972 @@ def format_duration(total_duration):
     return f"{hours} hours, {minutes} minutes, {seconds} seconds"
 
 # Function to print a summary banner after the scan is completed
-def banner_full(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error, target):
+def banner_full(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error, target, sum_tokens_saved=0):
     delta = format_duration(total_duration)
     summary1 = f'''
 [ Script Finished ] {'*' * 103}
 [ {vueltas} files scanned for {target} ] [ {sum_lines_of_code:,} lines of code ] [ Total Duration: {delta} ]
-[ Total Tokens: {sum_total_tokens:,} ] [ Total Cost in USD: #{sum_total_cost:.2f} ]
+[ Total Tokens: {sum_total_tokens:,} ] [ Total Cost in USD: #{sum_total_cost:.2f} ] [ Prompt Tokens Saved: {sum_tokens_saved:,} ]
 [ Statistics ] [ ERRORS: {sum_error:,} ]
 {'*' * 123}'''
     return summary1
 
 
 # Function to print a concise summary banner during the scan
-def banner_small(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error ):
+def banner_small(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error, sum_tokens_saved=0, eta=None, projected_cost=None):
     delta = format_duration (total_duration)
+    progress = f"\n[ ETA: {format_duration(eta)} ] [ Projected Cost (USD): {projected_cost: 2f} ]" if eta is not None else ""
     summary1 = f'''
 {'*' * 150}
-[ Scan Duration: {delta} ] [ Total Tokens: {sum_total_tokens:,}] [Total Cost (USD): {sum_total_cost: 2f} ] [ ERROR: {sum_error:,} ]
+[ Scan Duration: {delta} ] [ Total Tokens: {sum_total_tokens:,}] [Total Cost (USD): {sum_total_cost: 2f} ] [ Prompt Tokens Saved: {sum_tokens_saved:,} ] [ ERROR: {sum_error:,} ]{progress}
 {'*' * 150}
 '''
     return (summary1)
 
+# Class to accumulate the run totals from concurrent workers (replaces the old module-level sum_* globals)
+class ScanStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vueltas = 0
+        self.total_duration = timedelta(0)
+        self.sum_lines_of_code = 0
+        self.sum_total_tokens = 0
+        self.sum_total_cost = 0.0
+        self.sum_error = 0
+        self.cache_hits = 0
+        self.duplicates = 0                                                                   # Files that got the result of a copy (exact or near-duplicate) without a scan
+        self.sum_tokens_saved = 0
+        self.file_durations = []                                                              # Seconds per file scanned by the agents (for latency percentiles)
+        self.started = datetime.now()
+        self.planned_tokens, self.planned_cost = 0, 0.0                                       # Pre-flight estimates of the whole plan...
+        self.done_est_tokens, self.done_est_cost = 0, 0.0                                     # ...and of the files done so far (for the ETA and projected cost)
+
+    # Extrapolate the wall time left and the final cost from the estimates of the files done so far (the actual/estimated cost ratio corrects the projection)
+    def progress(self):
+        if not self.done_est_tokens:
+            return None, None
+        remaining = max(0, self.planned_tokens - self.done_est_tokens)
+        eta = timedelta(seconds=(datetime.now() - self.started).total_seconds() * remaining / self.done_est_tokens)
+        ratio = self.sum_total_cost / self.done_est_cost if self.done_est_cost else 1.0
+        return eta, self.sum_total_cost + max(0.0, self.planned_cost - self.done_est_cost) * ratio
+
+    # Add the given amounts to the totals and print the running banner, atomically
+    def add(self, show_banner=False, **amounts):
+        with self.lock:
+            for name, amount in amounts.items():
+                setattr(self, name, getattr(self, name) + amount)
+            if show_banner:
+                eta, projected_cost = self.progress()
+                print(banner_small(self.vueltas, self.total_duration, self.sum_lines_of_code, self.sum_total_tokens, self.sum_total_cost, self.sum_error, self.sum_tokens_saved, eta, projected_cost))
+
+# Class to share the OpenAI quota between workers (token buckets for requests-per-minute and tokens-per-minute, 0 disables a bucket)
+class RateLimiter:
+    def __init__(self, rpm=0, tpm=0):
+        self.rpm, self.tpm = rpm, tpm
+        self.requests, self.tokens = float(rpm), float(tpm)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        if self.rpm:
+            self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    # Block until one request and the given number of tokens fit in the buckets
+    def acquire(self, tokens=0):
+        if not self.rpm and not self.tpm:
+            return
+        tokens = min(tokens, self.tpm)                                                        # A single oversized request must still be able to go through
+        while True:
+            with self.lock:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self.requests < 1:
+                    wait = (1 - self.requests) * 60 / self.rpm
+                if self.tpm and self.tokens < tokens:
+                    wait = max(wait, (tokens - self.tokens) * 60 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self.requests -= 1
+                    if self.tpm:
+                        self.tokens -= tokens
+                    return
+            time.sleep(wait)
+
+# Function to tell transient API failures (rate limits, timeouts, connection errors, 5xx), worth a retry, from permanent ones
+def is_transient(error):
+    import openai
+    if isinstance(error, (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError, openai.InternalServerError, TimeoutError, ConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (error.status_code == 429 or error.status_code >= 500)
+
+# Class to pause the whole run while the endpoint is unhealthy (closed -> open after breaker_threshold consecutive transient failures,
+# then half-open after breaker_cooldown seconds: a single probe goes through, its success closes the breaker, its failure opens it again)
+class CircuitBreaker:
+    def __init__(self, threshold=breaker_threshold, cooldown=breaker_cooldown, metrics=None):
+        self.threshold, self.cooldown, self.metrics = threshold, cooldown, metrics
+        self.state, self.failures, self.opened_at = "closed", 0, 0.0
+        self.condition = threading.Condition()
+
+    def _set_state(self, state):
+        self.state = state
+        if self.metrics is not None:
+            self.metrics.set('genmermaid_circuit_open', int(state != "closed"))
+        self.condition.notify_all()
+
+    # Block while the breaker is open (or while another worker's probe is in flight)
+    def wait(self):
+        with self.condition:
+            while True:
+                if self.state == "closed":
+                    return
+                remaining = self.opened_at + self.cooldown - time.monotonic()
+                if self.state == "open" and remaining <= 0:
+                    logging.warning("CIRCUIT HALF-OPEN: probing the endpoint with a single conversation")
+                    self._set_state("half_open")
+                    return
+                self.condition.wait(timeout=remaining if self.state == "open" else self.cooldown)
+
+    def success(self):
+        with self.condition:
+            self.failures = 0
+            if self.state != "closed":
+                logging.warning("CIRCUIT CLOSED: the endpoint is healthy again, resuming the run")
+                self._set_state("closed")
+
+    def failure(self):
+        with self.condition:
+            self.failures += 1
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.threshold):
+                logging.error("CIRCUIT OPEN: %s consecutive API failures, pausing every worker for %ss", self.failures, self.cooldown)
+                self.opened_at = time.monotonic()
+                self._set_state("open")
+
+# Function to gate every agent reply through the shared rate limiter (registered first in the reply chain, never answers itself)
+def register_rate_limit(agent, limiter):
+    from autogen import Agent
+    encoding = get_encoding()
+    def rate_limited_reply(recipient, messages=None, sender=None, config=None):
+        prompt_tokens = len(encoding.encode(recipient.system_message))
+        for message in messages or []:
+            prompt_tokens += len(encoding.encode(str(message.get("content") or "")))
+        limiter.acquire(prompt_tokens + completion_reserve)
+        return False, None
+    agent.register_reply([Agent, None], rate_limited_reply, position=0)
+
+# Usage, label and legacy prompt prefix of the GroupChat running in the current thread (the agent hooks and the OpenAI client retries are attributed to it)
+chat_context = threading.local()
+
+# Class to count the requests retried by the OpenAI client (it retries 429s, 5xx and timeouts on its own, and only logs it)
+class RetryCounter(logging.Handler):
+    def __init__(self, metrics):
+        super().__init__(logging.INFO)
+        self.metrics = metrics
+
+    def emit(self, record):
+        if not str(record.msg).startswith("Retrying request"):
+            return
+        self.metrics.inc('genmermaid_llm_retries_total')
+        usage = getattr(chat_context, "usage", None)
+        if usage is not None:
+            usage["retries"] += 1
+
+# Function to add up the usage of an agent over every model it called (prompt/completion/total tokens and cost)
+def agent_usage(agent):
+    totals = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "cost": 0.0}
+    for model, model_usage in (agent.get_total_usage() or {}).items():
+        if isinstance(model_usage, dict):
+            for k in totals:
+                totals[k] += model_usage.get(k, 0)
+    return totals
+
+# Function to time every round of an agent and record the tokens and cost it spent (registered last, so it runs before the other reply functions)
+def register_round_metrics(agent):
+    from autogen import Agent
+    state = {}
+    def round_start(recipient, messages=None, sender=None, config=None):
+        state["start"], state["usage"] = time.perf_counter(), agent_usage(recipient)
+        return False, None
+    def round_end(sender, message, recipient, silent):
+        if "start" in state:
+            seconds = time.perf_counter() - state.pop("start")
+            before, after = state.pop("usage"), agent_usage(sender)
+            spent = {k: after[k] - before[k] for k in after}
+            usage = chat_context.usage
+            usage["rounds"].append(dict(spent, label=chat_context.label, agent=sender.name, round=len(usage["rounds"]) + 1, seconds=seconds, source="llm" if spent["total_tokens"] else "local"))
+        return message
+    agent.register_reply([Agent, None], round_start, position=0)
+    agent.register_hook("process_message_before_send", round_end)
+
+# Function to plan the files to scan (gitignore, include/exclude config, extensions, sizes, vendored/generated code), cheapest first
+def collect_files(repo_to_scan, metrics, config):
+    discovery_start = time.perf_counter()
+    plan, skipped = discover_files(repo_to_scan, config)
+    reasons = {}
+    for relpath, reason in skipped:
+        reasons[reason] = reasons.get(reason, 0) + 1
+        metrics.inc('genmermaid_discovery_skipped_total', reason=reason)
+        logging.debug("SKIPPED: - %s: %s", reason, relpath)
+    est_tokens = sum(item['est_tokens'] for item in plan)
+    metrics.set('genmermaid_discovery_planned_files', len(plan))
+    metrics.set('genmermaid_discovery_estimated_tokens', est_tokens)
+    metrics.event('discovery', repo=repo_to_scan, planned=len(plan), est_tokens=est_tokens, skipped=reasons, seconds=time.perf_counter() - discovery_start)
+    logging.info("DISCOVERY: %s files planned (~%s tokens of source), skipped: %s", len(plan), f"{est_tokens:,}", ", ".join(f"{reason} {count}" for reason, count in sorted(reasons.items())) or "none")
+    return plan
+
+# Function to load autogen's price table (USD per 1K tokens per model) without importing autogen: the table is a literal in its source, read with ast.
+# Falls back to the import when the source cannot be read
+@functools.lru_cache(maxsize=None)
+def autogen_price_table():
+    try:
+        spec = importlib.util.find_spec("autogen")                                        # Locates the package, does not run it
+        with open(os.path.join(os.path.dirname(spec.origin), "oai", "openai_utils.py"), 'r', encoding='utf-8') as f:
+            tree = ast.parse(f.read())
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and any(getattr(target, "id", None) == "OAI_PRICE1K" for target in node.targets):
+                return ast.literal_eval(node.value)
+    except (AttributeError, TypeError, OSError, SyntaxError, ValueError):
+        pass
+    from autogen.oai.openai_utils import OAI_PRICE1K
+    return OAI_PRICE1K
+
+# Function to find the price of the configured model in USD per 1K tokens (prompt, completion): the config_list "price", then autogen's table (longest matching prefix)
+def model_price():
+    if "price" in config_list_openai[0]:
+        return tuple(config_list_openai[0]["price"])
+    OAI_PRICE1K = autogen_price_table()
+    matches = [name for name in OAI_PRICE1K if model_name and model_name.startswith(name)]
+    if not matches:
+        return None
+    price = OAI_PRICE1K[max(matches, key=len)]
+    return tuple(price) if isinstance(price, (tuple, list)) else (price, price)
+
+# Function to estimate the prompt and completion tokens of one conversation over a piece of code (see the estimate_* constants)
+def estimate_conversation(code_tokens, skeleton_tokens, run):
+    submission = run["submission_tokens"] + skeleton_tokens + code_tokens
+    completion = min(max(int(code_tokens * estimate_completion_ratio), estimate_completion_range[0]), estimate_completion_range[1])
+    rounds = estimate_coder_rounds
+    prompt_tokens = rounds * (run["system_tokens"]["core_coder_agent"] + submission) + (rounds - 1) * (completion + estimate_review_tokens)
+    completion_tokens = rounds * completion
+    if not run["trust_valid"]:
+        prompt_tokens += rounds * (run["system_tokens"]["core_manager_agent"] + submission + completion)
+        completion_tokens += rounds * estimate_review_tokens
+    return int(prompt_tokens), int(completion_tokens)
+
+# Function to pre-flight a planned file: the only read of the file (generated-code sniff, MD5 for duplicates, cache lookup and resume), source tokens,
+# conversations needed (chunks), estimated tokens and cost. The source is carried on the entry ('code') for scan_file, unless the file is served from the cache.
+# The tokens are exact (tiktoken, plus the static analysis for the skeleton and outline) only with --plan or a budget, where the estimates decide
+# what runs. Otherwise they are estimated from the size, so that only the files sent to the LLM are tokenized and analyzed (by scan_file)
+def estimate_file(item, run, config):
+    item.update(md5=None, tokens=0, lines_of_code=0, chunks=1, cached=False, est_prompt_tokens=0, est_completion_tokens=0, est_tokens=0, est_cost=0.0)
+    exact = run["exact_estimates"]
+    try:
+        ingested = ingest_file(os.path.join(item['dirpath'], item['filename']), token_limit=None, count=exact)
+    except Exception:
+        return item                                                                           # scan_file reports the read error
+    if ingested is None:
+        return item
+    reason = sniff_head(ingested['head'], config) if config['sniff_generated'] else None
+    if reason:
+        item['skipped'] = reason
+        return item
+    tokens = ingested['tokens'] if exact else len(ingested['code']) // estimate_chars_per_token
+    item.update(tokens=tokens, md5=ingested['md5'], lines_of_code=ingested['lines_of_code'], read_seconds=ingested['read_seconds'], tokenize_seconds=ingested['tokenize_seconds'])
+    if run["near_duplicates"] and not run["refresh_cache"]:
+        item['minhash'] = minhash_signature(ingested['code'])
+    if run["use_cache"] and not run["refresh_cache"] and os.path.isfile(os.path.join(cachedir, f"{cache_key(ingested['md5'], run['prompt_hash'])}.json")):
+        item['cached'] = True
+        return item
+    item['code'] = ingested['code']
+    skeleton_tokens, code_tokens = 0, tokens
+    if exact:
+        analysis = analyze_code(ingested['code'], item['filename'])
+        skeleton_tokens = count_tokens(json.dumps(build_skeleton(analysis), indent=1))
+        if run["outline"]:
+            code_tokens = min(code_tokens, count_tokens(build_outline(analysis, item['filename'])))
+    if code_tokens > context_size:
+        item['chunks'] = math.ceil(code_tokens / run["chunk_tokens"])
+    prompt_tokens, completion_tokens = estimate_conversation(code_tokens // item['chunks'], skeleton_tokens // item['chunks'], run)
+    price = run["price"] or (0.0, 0.0)
+    item.update(
+        est_prompt_tokens=prompt_tokens * item['chunks'],
+        est_completion_tokens=completion_tokens * item['chunks'],
+        est_tokens=(prompt_tokens + completion_tokens) * item['chunks'],
+        est_cost=round((prompt_tokens * price[0] + completion_tokens * price[1]) / 1000 * item['chunks'], 6)
+    )
+    return item
+
+# Function to drop the carried source from a plan entry (and its duplicates) for the plan file
+def plan_entry(item):
+    entry = {k: v for k, v in item.items() if k != 'code'}
+    if 'duplicates' in entry:
+        entry['duplicates'] = [plan_entry(duplicate) for duplicate in entry['duplicates']]
+    return entry
+
+# Function to plan a scan: discover the files, estimate them (in parallel), collapse the duplicates, order them and fit them into the budgets
+# The plan is written to the logs folder, and the files cut by the budget are listed in the log. Returns (selected, cut)
+# The walk does not open the files: the generated-code sniff runs on the bytes estimate_file reads anyway.
+# In watch mode only the changed files (entries of the stat-only walk) are planned, and the ones whose content did not actually change are left out
+def plan_scan(repo_to_scan, run, config, schedule, completed=None, changed=None):
+    if changed is None:
+        files = collect_files(repo_to_scan, run["metrics"], dict(config, sniff_generated=False))
+    else:
+        files = [dict(item) for item in changed]
+    with ThreadPoolExecutor(max_workers=estimate_workers) as pool:
+        list(pool.map(lambda item: estimate_file(item, run, config), files))
+    for item in files:
+        if item.get('skipped'):
+            run["metrics"].inc('genmermaid_discovery_skipped_total', reason=item['skipped'])
+            logging.info("SKIPPED: - %s: %s", item['skipped'], item['relpath'])
+    files = [item for item in files if not item.get('skipped')]
+    if completed:
+        remaining = [item for item in files if item['relpath'] not in completed or completed[item['relpath']] != item['md5']]
+        if changed is None:
+            logging.info("RESUME: %s files already done in the previous run, %s left", len(files) - len(remaining), len(remaining))
+        elif len(remaining) < len(files):
+            logging.info("UNCHANGED: %s files were touched but their content is the same, %s left", len(files) - len(remaining), len(remaining))
+        files = remaining
+    files = collapse_duplicates(files, 0.0 if run["refresh_cache"] else run["near_duplicates"])      # --refresh scans the near-duplicates on their own
+    duplicates = [duplicate for item in files for duplicate in item['duplicates']]
+    for duplicate in duplicates:
+        duplicate.pop('code', None)                                                          # Duplicates get the result of their file, their source is never sent
+    if duplicates:
+        near = sum(1 for duplicate in duplicates if duplicate['similarity'] < 1.0)
+        logging.info("DEDUP: %s exact and %s near-duplicates collapsed into %s files (~%s tokens, ~$%s not spent)", len(duplicates) - near, near, sum(1 for item in files if item['duplicates']),
+                     f"{sum(duplicate['est_tokens'] for duplicate in duplicates):,}", round(sum(duplicate['est_cost'] for duplicate in duplicates), 4))
+    selected, cut = apply_budget(schedule_plan(files, schedule, config['priority']), run["budget_usd"], run["budget_tokens"])
+    if run["price"] is None:
+        logging.warning("No price known for model %s, cost estimates are 0 (set MODEL_PRICE_1K=prompt,completion in USD per 1K tokens)", model_name)
+    est_tokens, est_cost = sum(item['est_tokens'] for item in selected), sum(item['est_cost'] for item in selected)
+    logging.info("PLAN: %s files, %s cached, ~%s tokens, ~$%s estimated (%s)", len(selected), sum(1 for item in selected if item['cached']), f"{est_tokens:,}", round(est_cost, 4), schedule)
+    for item in cut:
+        logging.warning("CUT BY THE BUDGET: %s (~%s tokens, ~$%s)", item['relpath'], f"{item['est_tokens']:,}", item['est_cost'])
+    plan_path = f"{logsdir}plan_{fecha1}.json"
+    with open(plan_path, 'w') as f:
+        json.dump({'repo': repo_to_scan, 'schedule': schedule, 'budget_usd': run["budget_usd"], 'budget_tokens': run["budget_tokens"], 'model': model_name, 'price_1k': run["price"],
+                   'est_tokens': est_tokens, 'est_cost': est_cost, 'selected': [plan_entry(item) for item in selected], 'cut': [plan_entry(item) for item in cut]}, f, indent=4)
+    run["metrics"].event('plan', path=plan_path, files=len(selected), cut=len(cut), est_tokens=est_tokens, est_cost=est_cost, schedule=schedule)
+    return selected, cut
+
+# Function to read the reviewer's verdict from a message: "REVISE", "TERMINATE" or None (JSON first, then "NEXTSTEP: TERMINATE" in plain text)
+def reviewer_verdict(message):
+    content = str(message.get("content") or "")
+    try:
+        verdict = json.loads(content).get("NEXTSTEP")
+        if verdict in ("REVISE", "TERMINATE"):
+            return verdict
+    except (json.JSONDecodeError, AttributeError):
+        pass
+    match = nextstep_re.search(content)
+    return match.group(1) if match else None
+
+# Function to detect the reviewer's "NEXTSTEP: TERMINATE" (tolerates messages that are not JSON, such as the code submission)
+def is_nextstep_terminate(message):
+    return reviewer_verdict(message) == "TERMINATE"
+
+# Function to check the structure of a core_coder_agent result locally, before any reviewer round (returns the list of errors, empty when valid)
+def validate_result(salida):
+    if not isinstance(salida, dict):
+        return ["the response must be a JSON object"]
+    errors = [f"missing key \"{k}\"" for k in result_keys if k not in salida]
+    if errors:
+        return errors
+    if not isinstance(salida["SUMMARY"], str) or not salida["SUMMARY"].strip():
+        errors.append("SUMMARY must be a non-empty string")
+    errors += validate_flowchart(salida["DFD"])
+    errors += validate_erdiagram(salida["ERD"])
+    if not isinstance(salida["DataDictionary"], dict) or not salida["DataDictionary"]:
+        errors.append("DataDictionary must be a non-empty object of components")
+    else:
+        errors += [f"DataDictionary[\"{component}\"] must be an object of field: description" for component, fields in salida["DataDictionary"].items() if not isinstance(fields, dict)]
+    if not isinstance(salida["codecontext"], dict) or not salida["codecontext"]:
+        errors.append("codecontext must be a non-empty object")
+    else:
+        errors += [f"codecontext[\"{context}\"] must be an object (e.g. Description, Error Handling, Output) or a string" for context, details in salida["codecontext"].items() if not isinstance(details, (dict, str))]
+    return errors
+
+# Function to parse and validate a message as a core_coder_agent result, returns (result or None, errors)
+def parse_result(message):
+    try:
+        salida = json.loads(message.get("content") or "")
+    except (json.JSONDecodeError, TypeError) as e:
+        return None, [f"the response is not valid JSON: {e}"]
+    return salida, validate_result(salida)
+
+# Function to answer for the core_manager_agent locally: malformed results go back to the coder with precise errors, without any LLM call.
+# Well-formed results are approved straight away with --trust-valid, otherwise they go on to the LLM review (registered last, so it runs first).
+def register_local_validation(reviewer, trust_valid):
+    from autogen import Agent
+    def local_review(recipient, messages=None, sender=None, config=None):
+        if not messages:
+            return False, None
+        usage = chat_context.usage
+        salida, errors = parse_result(messages[-1])
+        if errors and usage["local_revisions"] < max_local_revisions:
+            usage["local_revisions"] += 1
+            return True, json.dumps({"NEXTSTEP": "REVISE", "source": "local_validator", "errors": errors})
+        if not errors and trust_valid:
+            return True, json.dumps({"NEXTSTEP": "TERMINATE", "source": "local_validator"})
+        return False, None
+    reviewer.register_reply([Agent, None], local_review, position=0)
+
+# Function to pick the next speaker without any LLM call: coder -> reviewer -> coder ... until the reviewer says TERMINATE (None ends the chat)
+def coder_reviewer_selection(last_speaker, groupchat):
+    if last_speaker.name == "core_coder_agent":
+        return groupchat.agent_by_name("core_manager_agent")
+    if len(groupchat.messages) > 1 and is_nextstep_terminate(groupchat.messages[-1]):                 # The first message is the code submission, never a verdict
+        return None
+    return groupchat.agent_by_name("core_coder_agent")
+
+# Function to pick the next speaker with the "auto" method behind the shared rate limiter. autogen only asks the LLM when more than one agent
+# may speak (never with the two agents of a pod, the last speaker cannot repeat), so only those selections acquire; a requery is not gated again
+def rate_limited_auto_selection(limiter):
+    def select(last_speaker, groupchat):
+        eligible = [agent for agent in groupchat.agents if agent is not last_speaker]
+        if len(eligible) > 1:
+            prompt_tokens = count_tokens(groupchat.select_speaker_msg(eligible)) + sum(count_tokens(str(m.get("content") or "")) for m in groupchat.messages)
+            limiter.acquire(prompt_tokens + completion_reserve)
+        return "auto"
+    return select
+
+# Function to build the agents system messages once per run (they hold only the static YAML sections, so every call shares a byte-identical prefix that provider-side prompt caching can reuse)
+def build_system_messages(target):
+    example_schema = prompts["prompts"]["example_schema"]
+    output_example = prompts["prompts"]["output_example"]
+    example_mermaid = prompts["prompts"]["example_mermaid"]
+    return {
+        "core_manager_agent": prompts['prompts']['core_manager_agent'].format(target=target, example_mermaid=example_mermaid, output_example=output_example, example_schema=example_schema),
+        "core_coder_agent": prompts['prompts']['core_coder_agent'].format(example_mermaid=example_mermaid, output_example=output_example, target=target, example_schema=example_schema)
+    }
+
+# Function to keep only the code submission plus the latest `history_window` messages in every LLM call (latest submission + reviewer feedback)
+# It also adds up what the same call cost in the previous prompt layout: the source in the agent's system prompt, and the whole history
+def register_history_window(agent, system_tokens):
+    def history_window(messages):
+        usage = chat_context.usage
+        usage["cacheable_prompt_tokens"] += system_tokens
+        history = [count_tokens(str(m.get("content") or "")) for m in messages[1:]]
+        usage["legacy_prompt_tokens"] += system_tokens + chat_context.legacy_prefix_tokens + sum(history)
+        if len(messages) <= history_window_size + 1:
+            return messages
+        usage["history_tokens_dropped"] += sum(history[:-history_window_size])
+        return messages[:1] + messages[-history_window_size:]
+    agent.register_hook("process_all_messages_before_reply", history_window)
+
+# Function to build the first message of a conversation: instructions, the locally derived skeletons, and the code (or its outline)
+def build_code_submission(code, skeleton):
+    return prompts["prompts"]["code_submission"].format(instructions=prompts["prompts"]["autogen_manager_agent"], skeleton=json.dumps(skeleton, indent=1), code=code)
+
+# Function to start the usage record of a GroupChat (rounds and rounds_to_terminate are lists, agents holds the agent_usage totals per agent)
+def new_usage():
+    return {"total_tokens": 0, "total_cost": 0.0, "prompt_tokens_saved": 0, "legacy_prompt_tokens": 0, "history_tokens_dropped": 0, "cacheable_prompt_tokens": 0, "local_revisions": 0, "retries": 0, "chat_retries": 0, "parse_seconds": 0.0, "rounds": [], "rounds_to_terminate": [], "agents": {}}
+
+# Function to build the agents, GroupChat and manager of a worker thread (its "pod"): built once per thread and reset before every
+# conversation, so the agents keep their OpenAI clients (and the HTTP connections) from file to file. The hooks read the usage of the
+# conversation in flight from chat_context
+def build_pod(run):
+    from autogen import AssistantAgent, UserProxyAgent, GroupChat, GroupChatManager
+    system_messages = run["system_messages"]
+
+    # Define Microsoft Autogen Agents (version 0.2.3), the short descriptions keep the system messages out of any speaker selection prompt
+    pod_agents = {
+        "core_manager_agent": UserProxyAgent(
+            name="core_manager_agent",
+            description="Reviews the core_coder_agent results against the source code and decides NEXTSTEP: REVISE or TERMINATE.",
+            human_input_mode="NEVER",
+            max_consecutive_auto_reply=6,
+            is_termination_msg=lambda x: "TERMINATE" in x.get("content", ""),
+            llm_config=llm_config,
+            code_execution_config=False,
+            system_message=system_messages["core_manager_agent"]
+        ),
+        "core_coder_agent": AssistantAgent(
+            name="core_coder_agent",
+            description="Documents the source code as JSON with SUMMARY, DFD, ERD, DataDictionary and codecontext.",
+            max_consecutive_auto_reply=6,
+            is_termination_msg=is_nextstep_terminate,
+            llm_config=llm_config,
+            code_execution_config=False,
+            system_message=system_messages["core_coder_agent"]
+        )
+    }
+    for name, podagent in pod_agents.items():
+        register_history_window(podagent, run["system_tokens"][name])
+        register_rate_limit(podagent, run["limiter"])
+    register_local_validation(pod_agents["core_manager_agent"], run["trust_valid"])
+    for podagent in pod_agents.values():
+        register_round_metrics(podagent)
+
+    # Define GroupChat Structure for Microsoft Autogen (version 0.2.3), "fixed" replaces the LLM speaker selection with the coder/reviewer state machine
+    fixed_selection = run["speaker_selection"] == "fixed"
+    groupchat = GroupChat(
+        agents=list(pod_agents.values()),
+        messages=[],
+        max_round=20,
+        speaker_selection_method=coder_reviewer_selection if fixed_selection else rate_limited_auto_selection(run["limiter"]),
+        allow_repeat_speaker=False
+    )
+
+    # Add a built-in manager to ensure chat transition (it needs no LLM when the selection is fixed). The manager relays the messages
+    # of the chat, so it is the one that must be silent when several chats run at once (their transcripts would interleave)
+    manager = GroupChatManager(groupchat=groupchat, llm_config=False if fixed_selection else llm_config, silent=run["workers"] > 1)
+    return pod_agents, groupchat, manager
+
+# Function to get the pod of the current worker thread, built on its first conversation
+def worker_pod(run):
+    pod = getattr(run["pods"], "pod", None)
+    if pod is None:
+        pod = run["pods"].pod = build_pod(run)
+    return pod
+
+# Function to document a piece of code with the GroupChat of the current thread, returns (result or None, usage)
+# source_tokens are the tokens of the source the code stands for, which the previous prompt layout put in the system prompts (prompt_tokens_saved)
+def run_groupchat(code, filename, run, label, skeleton, source_tokens):
+    usage = new_usage()
+    chat_context.usage, chat_context.label = usage, label
+    chat_context.legacy_prefix_tokens = source_tokens + run["instruction_tokens"]
+    pod_agents, groupchat, manager = worker_pod(run)
+    for podagent in list(pod_agents.values()) + [manager]:
+        podagent.reset()                                                                  # Clears the history, the reply counters and the client usage of the last conversation
+
+    # Start GroupChat (silent when several chats run at once, their transcripts would interleave), retried on transient API failures
+    # with exponential backoff and jitter, behind the circuit breaker shared by all workers
+    failed = True
+    for attempt in range(1, chat_max_attempts + 1):
+        run["breaker"].wait()
+        groupchat.reset()
+        try:
+            pod_agents["core_manager_agent"].initiate_chat(
+                manager, silent=run["workers"] > 1,
+                code_execution_config=False,
+                max_rounds=12,
+                message=build_code_submission(code, skeleton)
+                )
+        except Exception as e:
+            if not is_transient(e):
+                run["breaker"].success()                                                  # The endpoint answered, the failure is ours (or the request's)
+                logging.error(f"Agent initiation failed: {label} - {e}")
+                break
+            run["breaker"].failure()
+            if attempt == chat_max_attempts:
+                logging.error(f"Agent initiation failed after {attempt} attempts: {label} - {e}")
+                break
+            delay = min(retry_max_delay, retry_base_delay * 2 ** (attempt - 1))
+            delay = random.uniform(delay / 2, delay)                                      # Jitter, so that workers failing together do not retry together
+            usage["chat_retries"] += 1
+            run["metrics"].inc('genmermaid_chat_retries_total')
+            logging.warning(f"Transient API failure ({type(e).__name__}), retrying {label} in {delay:.1f}s (attempt {attempt + 1}/{chat_max_attempts}): {e}")
+            time.sleep(delay)
+        else:
+            run["breaker"].success()
+            failed = False
+            break
+
+    # Track Token Usage and cost per agent, over every agent and every model (the manager only spends tokens on the "auto" speaker selection)
+    for podagent in list(pod_agents.values()) + [manager]:
+        if podagent.get_total_usage() is not None:
+            usage["agents"][podagent.name] = agent_usage(podagent)
+            usage["total_tokens"] += usage["agents"][podagent.name]["total_tokens"]
+            usage["total_cost"] += usage["agents"][podagent.name]["cost"]
+    usage["prompt_tokens_saved"] = usage["legacy_prompt_tokens"] - sum(totals["prompt_tokens"] for totals in usage["agents"].values())
+    if failed:
+        return None, usage
+
+    # Count the core_coder_agent rounds it took to get the reviewer's TERMINATE
+    verdicts = [reviewer_verdict(message) for message in groupchat.messages[1:] if message["name"] == pod_agents["core_manager_agent"].name]
+    if verdicts and verdicts[-1] == "TERMINATE":
+        usage["rounds_to_terminate"].append(sum(1 for message in groupchat.messages if message["name"] == pod_agents["core_coder_agent"].name))
+
+    # Collect feedback for agent self-training (manual), the reviewer's only: the local validator's revisions are machine-generated, they are logged
+    for message2 in groupchat.messages:
+        if message2["name"] == pod_agents["core_manager_agent"].name:
+            try:
+                salida2 = json.loads(message2["content"])
+                if "NEXTSTEP" in salida2:
+                    feedback = salida2["NEXTSTEP"]
+                    if feedback == "REVISE" and salida2.get("source") == "local_validator":
+                        logging.info("LOCAL REVISION: %s - %s", label, "; ".join(salida2.get("errors") or []))
+                    elif feedback == "REVISE":
+                        save_feedback_report(salida2, filename)
+            except json.JSONDecodeError:
+                continue
+
+    # Parse Conversation Log in reverse for the last valid entry (falling back to the last complete one, flagged with its validation errors)
+    parse_start = time.perf_counter()
+    result = fallback = None
+    for message in reversed(groupchat.messages):
+        if message["name"] == pod_agents["core_coder_agent"].name:
+            salida, errors = parse_result(message)
+            if not errors:
+                result = salida
+                break
+            if salida is None:
+                logging.error("READ-JSON-ERROR-GROUPCHAT-MSG: %s", label)
+            elif fallback is None and isinstance(salida, dict) and all(k in salida for k in result_keys):
+                fallback = dict(salida, validation_errors=errors)
+    if result is None and fallback is not None:
+        logging.error("VALIDATION FAILED: %s - %s", label, "; ".join(fallback["validation_errors"]))
+        result = fallback
+    usage["parse_seconds"] += time.perf_counter() - parse_start
+    return result, usage
+
+# Function to merge nested dictionaries (DataDictionary, codecontext) from several chunks, conflicting texts are concatenated
+def merge_dicts(merged, other):
+    for k, v in other.items():
+        if k not in merged:
+            merged[k] = v
+        elif isinstance(merged[k], dict) and isinstance(v, dict):
+            merge_dicts(merged[k], v)
+        elif merged[k] != v:
+            merged[k] = f"{merged[k]} {v}"
+    return merged
+
+# Function to reduce the per-chunk results of a large file into a single result
+def merge_chunk_results(results, chunks):
+    merged = {
+        "SUMMARY": "\n\n".join(f"[Lines {chunk['start_line']}-{chunk['end_line']}] {result['SUMMARY']}" for result, chunk in zip(results, chunks)),
+        "DFD": merge_flowcharts([result["DFD"] for result in results]),
+        "ERD": merge_erdiagrams([result["ERD"] for result in results]),
+        "DataDictionary": {},
+        "codecontext": {}
+    }
+    validation_errors = [error for result in results for error in result.get("validation_errors", [])]
+    if validation_errors:
+        merged["validation_errors"] = validation_errors
+    for result in results:
+        if isinstance(result["DataDictionary"], dict):
+            merge_dicts(merged["DataDictionary"], result["DataDictionary"])
+        if isinstance(result["codecontext"], dict):
+            merge_dicts(merged["codecontext"], result["codecontext"])
+    return merged
+
+# Function to add up the usage of several GroupChats (numbers are added, lists concatenated, per-agent totals added agent by agent)
+def sum_usage(usages):
+    total = new_usage()
+    for usage in usages:
+        for k in total:
+            if k == "agents":
+                for name, totals in usage[k].items():
+                    merged = total[k].setdefault(name, dict.fromkeys(totals, 0))
+                    for field, amount in totals.items():
+                        merged[field] += amount
+            else:
+                total[k] += usage[k]
+    return total
+
+# Function to document a file larger than context_size: split it on code boundaries (map), document the chunks one by one, merge (reduce)
+def run_chunked(code, filename, run):
+    chunks = split_code(code, filename, run["chunk_tokens"], count_tokens)
+    if any(chunk['tokens'] > context_size for chunk in chunks):
+        return None, sum_usage([]), chunks
+    logging.info("CHUNKED: %s in %s chunks of up to %s tokens", filename, len(chunks), run["chunk_tokens"])
+
+    def document_chunk(index, chunk):
+        label = f"{filename} [part {index}/{len(chunks)}, lines {chunk['start_line']}-{chunk['end_line']}]"
+        skeleton = build_skeleton(analyze_code(chunk['code'], filename))
+        return run_groupchat(f"# FILE: {label}\n{chunk['code']}", filename, run, label, skeleton, chunk['tokens'])
+
+    outcomes = [document_chunk(index, chunk) for index, chunk in enumerate(chunks, 1)]         # One after the other on the worker's own pod, --workers bounds the concurrency
+
+    usage = sum_usage([chunk_usage for _, chunk_usage in outcomes])
+    failed = [chunk for (result, _), chunk in zip(outcomes, chunks) if result is None]
+    if failed:
+        logging.error("CHUNKS FAILED: %s - lines %s", filename, ", ".join(f"{c['start_line']}-{c['end_line']}" for c in failed))
+        return None, usage, chunks
+    return merge_chunk_results([result for result, _ in outcomes], chunks), usage, chunks
+
+# Function to record the metrics of a scanned file: one JSONL event per file and per agent round, counters and histograms for the Prometheus snapshot
+def record_file_metrics(run, file_path, status, phases, usage=None, duration=None, lines_of_code=0, **fields):
+    metrics = run["metrics"]
+    usage = usage or new_usage()
+    metrics.inc('genmermaid_files_total', status=status)
+    metrics.inc('genmermaid_lines_of_code_total', lines_of_code)
+    for phase, seconds in phases.items():
+        metrics.inc('genmermaid_phase_seconds_total', seconds, phase=phase)
+    for name, totals in usage["agents"].items():
+        metrics.inc('genmermaid_tokens_total', totals["prompt_tokens"], agent=name, kind="prompt")
+        metrics.inc('genmermaid_tokens_total', totals["completion_tokens"], agent=name, kind="completion")
+        metrics.inc('genmermaid_cost_usd_total', totals["cost"], agent=name)
+    for entry in usage["rounds"]:
+        metrics.inc('genmermaid_llm_requests_total', agent=entry["agent"], source=entry["source"])
+        metrics.observe('genmermaid_round_duration_seconds', entry["seconds"], agent=entry["agent"])
+        metrics.event('round', file_path=file_path, **entry)
+    for rounds in usage["rounds_to_terminate"]:
+        metrics.observe('genmermaid_rounds_to_terminate', rounds)
+    metrics.inc('genmermaid_prompt_tokens_saved_total', usage["prompt_tokens_saved"])
+    if duration is not None:
+        metrics.observe('genmermaid_file_duration_seconds', duration.total_seconds())
+    metrics.event('file', file_path=file_path, status=status, lines_of_code=lines_of_code, phases={phase: round(seconds, 4) for phase, seconds in phases.items()},
+                  duration=duration.total_seconds() if duration is not None else 0.0, total_tokens=usage["total_tokens"], total_cost=usage["total_cost"],
+                  agents=usage["agents"], rounds=len(usage["rounds"]), llm_rounds=sum(1 for entry in usage["rounds"] if entry["source"] == "llm"),
+                  rounds_to_terminate=usage["rounds_to_terminate"], local_revisions=usage["local_revisions"], retries=usage["retries"], chat_retries=usage["chat_retries"],
+                  prompt_tokens_saved=usage["prompt_tokens_saved"], **fields)
+    metrics.snapshot()
+
+# Function to write the result of a scanned file to the report of every copy of it (no agents, no API calls)
+def fan_out_duplicates(item, result, run):
+    stats, target = run["stats"], run["target"]
+    for duplicate in item['duplicates']:
+        file_path = os.path.join(duplicate['dirpath'], duplicate['filename'])
+        write_start = time.perf_counter()
+        save_vulnerability_report(run["store"], dict(result), duplicate['filename'], duplicate['dirpath'], timedelta(0), duplicate['md5'], 0, 0.0, duplicate['lines_of_code'], target,
+                                  duplicate_of=item['relpath'], similarity=duplicate['similarity'], prompt_hash=run["prompt_hash"])
+        logging.info("DUPLICATE: %s reuses the result of %s (similarity %s)", file_path, item['relpath'], duplicate['similarity'])
+        stats.add(vueltas=1, duplicates=1, sum_lines_of_code=duplicate['lines_of_code'], done_est_tokens=duplicate['est_tokens'], done_est_cost=duplicate['est_cost'])
+        record_file_metrics(run, file_path, "duplicate", {"write": time.perf_counter() - write_start}, lines_of_code=duplicate['lines_of_code'], md5=duplicate['md5'],
+                            duplicate_of=item['relpath'], similarity=duplicate['similarity'])
+
+# Function to scan a single file (runs inside a worker thread, shares only `run`), returns its status (ok, error, validation_error, cache_hit, skipped, budget_cut)
+# Its duplicates get the result of a scan that succeeded (ok or cache_hit), otherwise they share its status in the journal
+def scan_file(vuelta, item, run):
+    stats, target = run["stats"], run["target"]
+    dirpath, filename = item['dirpath'], item['filename']
+    file_path = os.path.join(dirpath, filename)
+    stats.add(vueltas=1)
+
+    # The pre-flight (estimate_file) read the file and carries its source, unless the file is served from the cache. It is read here
+    # only when the pre-flight could not read it, or when its cache entry is gone
+    md5, code, lines_of_code = item['md5'], item.pop('code', None), item['lines_of_code']
+    phases = {"read": item.get('read_seconds', 0.0), "tokenize": item.get('tokenize_seconds', 0.0)}
+    use_cache = run["use_cache"] and not run["refresh_cache"]
+    cached = load_cached_result(cache_key(md5, run["prompt_hash"])) if md5 and code is None and use_cache else None
+    if code is None and cached is None:
+        try:
+            ingested = ingest_file(file_path, count=False)
+        except Exception as e:
+            stats.add(sum_error=1)
+            record_file_metrics(run, file_path, "error", {}, error=str(e))
+            fecha = datetime.now().strftime("%Y%m%dT%H%M%S")
+            error_message = f"ERROR: [Timestamp: {fecha}] - [Target file corrupted: {file_path} - Error details: {e}]"
+            output_filename = f"{reportsdir}READ_ERROR_{fecha}_{filename}.txt"
+            with open(output_filename, "w") as f:
+                f.write(error_message)
+            logging.error(error_message)
+            return "error"
+
+        if ingested is None:
+            logging.info("FILE SKIPPED: - binary: %s", file_path)
+            record_file_metrics(run, file_path, "skipped", {}, reason="binary")
+            return "skipped"
+        code, md5, lines_of_code = ingested['code'], ingested['md5'], ingested['lines_of_code']
+        phases["read"] = ingested['read_seconds']
+
+    # Further processing
+    stats.add(sum_lines_of_code=lines_of_code)
+    key = cache_key(md5, run["prompt_hash"])
+
+    # Serve unchanged files straight from the cache (no agents, no API calls)
+    if cached is None and use_cache:
+        cached = load_cached_result(key)
+    if cached is not None:
+        stats.add(cache_hits=1)
+        logging.info("CACHE HIT: %s (%s)", file_path, md5)
+        write_start = time.perf_counter()
+        save_vulnerability_report(run["store"], dict(cached["result"]), filename, dirpath, timedelta(0), md5, 0, 0.0, lines_of_code, target, cache_hit=True, prompt_hash=run["prompt_hash"])
+        phases["write"] = time.perf_counter() - write_start
+        record_file_metrics(run, file_path, "cache_hit", phases, lines_of_code=lines_of_code, md5=md5)
+        fan_out_duplicates(item, cached["result"], run)
+        return "cache_hit"
+
+    # Hard stop once the actual spend reaches a budget (the pre-flight selection is only an estimate)
+    if (run["budget_usd"] and stats.sum_total_cost >= run["budget_usd"]) or (run["budget_tokens"] and stats.sum_total_tokens >= run["budget_tokens"]):
+        logging.warning("BUDGET REACHED: %s not scanned (spent $%s, %s tokens)", file_path, round(stats.sum_total_cost, 4), stats.sum_total_tokens)
+        stats.add(done_est_tokens=item['est_tokens'], done_est_cost=item['est_cost'])
+        record_file_metrics(run, file_path, "budget_cut", phases, lines_of_code=lines_of_code, md5=md5)
+        return "budget_cut"
+
+    # The pod of the worker (its agents, and the autogen import for the first one) is built outside the timed scan, as a phase of its own
+    pod_start = time.perf_counter()
+    worker_pod(run)
+    phases["pod"] = time.perf_counter() - pod_start
+
+    # Minimal console status and tag inference start-time
+    print(f"\n[{vuelta}] - scanning {file_path} for {target}")
+    start_time = datetime.now()
+
+    # Only the files sent to the LLM are tokenized (the pre-flight already counted them with exact estimates)
+    tokenize_start = time.perf_counter()
+    if run["exact_estimates"] and md5 == item['md5']:
+        source_tokens = item['tokens']
+    else:
+        source_tokens = count_tokens(code, context_size)
+    over_limit = source_tokens > context_size
+    phases["tokenize"] += time.perf_counter() - tokenize_start
+
+    # Static pre-analysis: skeletons to seed the agents with and, in outline mode, the outline sent instead of the source
+    analyze_start = time.perf_counter()
+    analysis = analyze_code(code, filename)
+    skeleton = build_skeleton(analysis)
+    prompt_mode = "full"
+    if run["outline"]:
+        outline = build_outline(analysis, filename)
+        if count_tokens(outline, context_size) <= context_size:
+            code, prompt_mode = outline, "outline"
+    phases["analyze"] = time.perf_counter() - analyze_start
+
+    # Files over context_size are documented in chunks (map-reduce), any other file in a single GroupChat
+    llm_start, chunks = time.perf_counter(), None
+    if over_limit and prompt_mode == "full":
+        salida, usage, chunks = run_chunked(code, filename, run)
+        if salida is None and any(chunk['tokens'] > context_size for chunk in chunks):
+            report_token_size_error(filename, max(chunk['tokens'] for chunk in chunks))
+    else:
+        salida, usage = run_groupchat(code, filename, run, filename, skeleton, source_tokens)
+    phases["llm"] = max(0.0, time.perf_counter() - llm_start - usage["parse_seconds"])
+    phases["parse"] = usage["parse_seconds"]
+    total_tokens, total_cost = usage["total_tokens"], usage["total_cost"]
+    logging.info("PROMPT TOKENS SAVED: %s - %s against the previous prompt layout (%s dropped by the history window), %s in the cacheable static prefix", file_path,
+                 usage["prompt_tokens_saved"], usage["history_tokens_dropped"], usage["cacheable_prompt_tokens"])
+
+    # Track Duration for stats
+    duration = abs(start_time - datetime.now())
+
+    write_start = time.perf_counter()
+    if salida is None:
+        stats.add(sum_error=1)
+        status = "error"
+    else:
+        if "validation_errors" in salida:
+            stats.add(sum_error=1)
+            status = "validation_error"
+        else:
+            status = "ok"
+            if run["use_cache"]:
+                save_cached_result(key, salida, md5, run["prompt_hash"], total_tokens, total_cost)
+            result = {k: salida[k] for k in result_keys}
+        save_vulnerability_report(run["store"], salida, filename, dirpath, duration, md5, total_tokens, total_cost, lines_of_code, target, prompt_tokens_saved=usage["prompt_tokens_saved"], prompt_mode=prompt_mode, prompt_hash=run["prompt_hash"])
+    phases["write"] = time.perf_counter() - write_start
+    record_file_metrics(run, file_path, status, phases, usage, duration, lines_of_code, md5=md5, prompt_mode=prompt_mode, chunks=len(chunks) if chunks else 1)
+    if status == "ok":
+        fan_out_duplicates(item, result, run)
+
+    # Store Grand Totals and print Stats per file analyzed
+    stats.add(show_banner=True, sum_total_tokens=total_tokens, sum_total_cost=total_cost, total_duration=duration, sum_tokens_saved=usage["prompt_tokens_saved"], file_durations=[duration.total_seconds()],
+              done_est_tokens=item['est_tokens'], done_est_cost=item['est_cost'])
+    return status
+
+# Function to run a planned file as a journaled job: in_flight while scanning, then done or failed (files cut by the budget stay pending for a later --resume)
+# The duplicates of the file follow it: done when they got its result, pending or failed along with it otherwise
+def run_job(vuelta, item, run):
+    journal = run["journal"]
+    journal.record(item['relpath'], "in_flight", md5=item['md5'])
+    try:
+        status = scan_file(vuelta, item, run)
+    except Exception as e:
+        journal.record(item['relpath'], "failed", md5=item['md5'], status="exception", error=str(e))
+        for duplicate in item['duplicates']:
+            journal.record(duplicate['relpath'], "failed", md5=duplicate['md5'], status="exception", duplicate_of=item['relpath'])
+        raise
+    if status in ("ok", "cache_hit", "skipped"):
+        state = "done"
+    elif status == "budget_cut":
+        state = "pending"
+    else:
+        state = "failed"
+    journal.record(item['relpath'], state, md5=item['md5'], status=status)
+    for duplicate in item['duplicates']:
+        journal.record(duplicate['relpath'], state, md5=duplicate['md5'], status="duplicate" if status in ("ok", "cache_hit") else status, duplicate_of=item['relpath'])
+    return status
+
+# Function to set up the client of the package summaries (architecture stage): one plain completion per package, no agents, behind the scan's rate limiter
+def new_summary_run(limiter=None):
+    from autogen import OpenAIWrapper
+    return {"client": OpenAIWrapper(config_list=config_list_openai, cache_seed=None, temperature=temperature), "limiter": limiter or RateLimiter(), "lock": threading.Lock(), "requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "total_cost": 0.0}
+
+# Function to have the LLM write a package summary (the prompt only holds the child summaries and import edges, never source code)
+def summarize_package(prompt, summary_run):
+    client = summary_run["client"]
+    summary_run["limiter"].acquire(count_tokens(prompt) + completion_reserve)
+    response = client.create(messages=[{"role": "user", "content": prompt}])
+    with summary_run["lock"]:
+        summary_run["requests"] += 1
+        if response.usage:
+            summary_run["prompt_tokens"] += response.usage.prompt_tokens
+            summary_run["completion_tokens"] += response.usage.completion_tokens
+            summary_run["total_tokens"] += response.usage.total_tokens
+        summary_run["total_cost"] += getattr(response, "cost", 0.0) or 0.0
+    return (client.extract_text_or_completion_object(response)[0] or '').strip()
+
+# Function to walk the folder with stats only (no source file is opened, the generated-code sniffing is left to the files that changed), as relpath -> plan entry
+def file_snapshot(repo_to_scan, config):
+    plan, _ = discover_files(repo_to_scan, dict(config, sniff_generated=False))
+    return {item['relpath']: item for item in plan}
+
+# Function to poll the folder every `interval` seconds until files are added or modified (watch mode), returns (changed plan entries, new snapshot)
+def wait_for_changes(repo_to_scan, config, snapshot, interval):
+    while True:
+        time.sleep(interval)
+        current = file_snapshot(repo_to_scan, config)
+        for relpath in sorted(snapshot.keys() - current.keys()):
+            logging.info("WATCH: %s is gone (its reports stay in the report store)", relpath)
+        changed = [item for relpath, item in current.items()
+                   if relpath not in snapshot or (snapshot[relpath]['size'], snapshot[relpath]['mtime_ns']) != (item['size'], item['mtime_ns'])]
+        if changed:
+            logging.info("WATCH: %s files added or modified", len(changed))
+            return changed, current
+        snapshot = current
+
+# Function to scan the planned files on the worker pool, every file (and its duplicates) as a journaled job, returns False when interrupted (Ctrl-C)
+def scan_plan(files, cut, run, pool, profiler):
+    stats, journal = run["stats"], run["journal"]
+
+    # Journal every planned file, so that an interrupted run can be resumed (--resume)
+    journal.record_many([relpath for item in files for relpath in [item['relpath']] + [duplicate['relpath'] for duplicate in item['duplicates']]], "pending")
+    journal.record_many([relpath for item in cut for relpath in [item['relpath']] + [duplicate['relpath'] for duplicate in item['duplicates']]], "pending", status="budget_cut")
+
+    futures = [pool.submit(profiler.call, run_job, vuelta, item, run) for vuelta, item in enumerate(files, start=stats.vueltas + 1)]
+    try:
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                stats.add(sum_error=1)
+                logging.error(f"Unexpected scan failure: {e}")
+    except KeyboardInterrupt:
+        cancelled = sum(1 for future in futures if future.cancel())
+        logging.warning("INTERRUPTED: %s files not started, waiting for the files in flight (Ctrl-C again to abort). Resume with --resume", cancelled)
+        return False
+    finally:
+        logging.info("JOURNAL: %s (%s)", journal.path, ", ".join(f"{state} {count}" for state, count in journal.summary().items()))
+    return True
+
+# Function to bring the documentation up to date after a scan: cache eviction, package- and repository-level results (only the ancestors
+# of changed files are recomputed), report store housekeeping
+def update_documentation(repo_to_scan, run, architecture):
+    stats, metrics, store = run["stats"], run["metrics"], run["store"]
+    if run["use_cache"]:
+        evict_cache()
+
+    if architecture:
+        summary_run = run.setdefault("summary_run", new_summary_run(run["limiter"]))                    # Reused from pass to pass in watch mode (its counters add up)
+        before = {k: summary_run[k] for k in ("requests", "prompt_tokens", "completion_tokens", "total_tokens", "total_cost")}
+        build_architecture(store, repo_to_scan, summarize=lambda prompt: summarize_package(prompt, summary_run))
+        spent = {k: summary_run[k] - before[k] for k in before}
+        stats.add(sum_total_tokens=spent["total_tokens"], sum_total_cost=spent["total_cost"])
+        metrics.inc('genmermaid_tokens_total', spent["prompt_tokens"], agent="package_summary", kind="prompt")
+        metrics.inc('genmermaid_tokens_total', spent["completion_tokens"], agent="package_summary", kind="completion")
+        metrics.inc('genmermaid_cost_usd_total', spent["total_cost"], agent="package_summary")
+        metrics.event('architecture', **spent)
+        logging.info("PACKAGE SUMMARIES: %s requests, %s tokens, $%s", spent["requests"], spent["total_tokens"], round(spent["total_cost"], 5))
+
+    # Report store housekeeping: drop superseded reports, compact when enough pages are free
+    dropped = store.apply_retention(report_keep_versions, report_max_age_days)
+    if dropped:
+        logging.info("REPORT STORE: %s superseded reports dropped", dropped)
+    store.compact()
+    reports, paths = store.count()
+    logging.info("REPORT STORE: %s (%s reports, latest of %s paths)", store.path, reports, paths)
+    metrics.snapshot(force=True)
+
 # Main function to initiate the scanning process
-def main(repo_to_scan):
-    global prompts, sum_total_tokens, sum_total_cost, sum_error
-    
+def main(repo_to_scan, use_cache=True, refresh_cache=False, workers=1, rpm=0, tpm=0, chunk_tokens=30000, speaker_selection="fixed", trust_valid=False, outline=False, metrics_file=None, profile=False, discovery_config=None, plan_only=False, budget_usd=0.0, budget_tokens=0, schedule="largest-first", resume=False, near_duplicates=0.0, architecture=False, watch=0.0):
+    global prompts
+    init_folders(plan_only)
+    setup_logging()
+
     try:
         yaml_file_path = yamlfile
         prompts = load_yaml_file(yaml_file_path)
@@ -216,169 +1352,112 @@ def main(repo_to_scan):
         logging.error(f"Repository not found: {repo_to_scan}")
         return
 
-    vueltas, total_duration, sum_lines_of_code = 0, timedelta(0), 0
     #os.system('clear')
     target = prompts["prompts"]["target"].upper()
     print(f"{'*' * 104}\n{target}\n{'*' * 104}")
 
-    for dirpath, dirnames, filenames in os.walk(repo_to_scan):
-        if 'ipynb_checkpoints' in dirpath:                                                                                       # Here we skip any folder that we don't fancy scanning
-            logging.info("FOLDER SKIPPED: - ipynb_checkpoints: %s", dirpath)
-            continue
-        for filename in filenames:                                                                                               # Here we skip any file extension that we don't fancy scanning
-            if '.egg' in filename:
-                logging.info("FILE SKIPPED: - .egg: %s", filename)
-                continue
+    stats = ScanStats()
+    metrics = Metrics(f"{logsdir}metrics_{fecha1}.jsonl", metrics_file)
+    system_messages = build_system_messages(target)
+    run = {
+        "target": target,
+        "prompt_hash": calculate_prompt_hash(prompts, "outline" if outline else "full"),
+        "system_messages": system_messages,
+        "system_tokens": {name: count_tokens(message) for name, message in system_messages.items()},
+        "stats": stats,
+        "metrics": metrics,
+        "limiter": RateLimiter(rpm, tpm),
+        "use_cache": use_cache,
+        "refresh_cache": refresh_cache,
+        "workers": workers,
+        "chunk_tokens": min(chunk_tokens, context_size),
+        "speaker_selection": speaker_selection,
+        "trust_valid": trust_valid,
+        "outline": outline,
+        "submission_tokens": count_tokens(prompts["prompts"]["code_submission"].format(instructions=prompts["prompts"]["autogen_manager_agent"], skeleton='', code='')),
+        "instruction_tokens": count_tokens(prompts["prompts"]["autogen_manager_agent"]),                # The first message of the previous layout
+        "price": model_price(),
+        "budget_usd": budget_usd,
+        "budget_tokens": budget_tokens,
+        "near_duplicates": near_duplicates,
+        "exact_estimates": bool(plan_only or budget_usd or budget_tokens)
+    }
+    wall_start = datetime.now()
 
-            file_path = os.path.join(dirpath, filename)
-            if os.path.isfile(file_path):
-                total_tokens, total_cost = 0, 0.0
-                vueltas += 1
-
-                try:
-                    code = read_file(file_path)
-                except Exception as e:
-                    sum_error += 1
-                    fecha = datetime.now().strftime("%Y%m%dT%H%M%S")
-                    error_message = f"ERROR: [Timestamp: {fecha}] - [Target file corrupted: {file_path} - Error details: {e}]"
-                    output_filename = f"{reportsdir}READ_ERROR_{fecha}_{filename}.txt"
-                    with open(output_filename, "w") as f:
-                        f.write(error_message)
-                    logging.error(error_message)
-                    continue
-
-                if not count_tokens(code, filename):
-                    sum_error += 1
-                    continue
-
-                # Further processing
-                lines_of_code = len(code.splitlines())
-                sum_lines_of_code += lines_of_code
-                md5 = calculate_md5(file_path)
-                
-                # Define reference and tag inference start-time
-                reference = f"[md5]_{datetime.now().strftime('%Y%m%dT%H%M%S')}_{filename}"
-                start_time = datetime.now()
-
-                # Populating agents system messages from YAML config file
-                example_schema = prompts["prompts"]["example_schema"]
-                output_example = prompts["prompts"]["output_example"]
-                example_mermaid = prompts["prompts"]["example_mermaid"]
-                system_message_manager_agent = f"{prompts['prompts']['core_manager_agent'].format(target=target, code=code,  example_mermaid=example_mermaid, output_example=output_example, example_schema=example_schema)}"
-                system_message_core_coder_agent = f"{prompts['prompts']['core_coder_agent'].format(filename=filename, example_mermaid=example_mermaid, output_example=output_example, reference=reference, code=code, target=target,  example_schema=example_schema)}"
-
-                # Define Microsoft Autogen Agents (version 0.2.3)
-                pod_agents = {
-                    "core_manager_agent": UserProxyAgent(
-                        name="core_manager_agent",
-                        human_input_mode="NEVER",
-                        max_consecutive_auto_reply=6,
-                        is_termination_msg=lambda x: "TERMINATE" in x.get("content", ""),
-                        llm_config=llm_config,
-                        code_execution_config=False,
-                        system_message=system_message_manager_agent
-                    ),
-                    "core_coder_agent": AssistantAgent(
-                        name="core_coder_agent",
-                        max_consecutive_auto_reply=6,
-                        is_termination_msg=lambda x: json.loads(x.get("content", "{}")) .get("NEXTSTEP") == "TERMINATE",
-                        llm_config=llm_config,
-                        code_execution_config=False,
-                        system_message=system_message_core_coder_agent
-                    )
-                }
-
-                # Define GroupChat Structure for Microsoft Autogen (version 0.2.3)
-                groupchat = GroupChat(
-                    agents=list(pod_agents.values()),
-                    messages=[],
-                    max_round=20,
-                    speaker_selection_method="auto",
-                    allow_repeat_speaker=False
-                )
+    if budget_usd and run["price"] is None:
+        logging.error(f"No price known for model {model_name}, set MODEL_PRICE_1K=prompt,completion (USD per 1K tokens) to use --budget-usd")
+        metrics.close()
+        return
+
+    # Plan the scan: discovery, pre-flight estimates, schedule and budget (minus the files a resumed run already documented)
+    config = load_discovery_config(repo_to_scan, discovery_config)
+    snapshot = file_snapshot(repo_to_scan, config) if watch else None                       # Taken before the plan: files changed during the first pass are rescanned
+    journal = None if plan_only else Journal(journal_path(journaldir, repo_to_scan, run["prompt_hash"]), resume=resume)
+    files, cut = plan_scan(repo_to_scan, run, config, schedule, journal.completed() if journal and resume else None)
+    stats.planned_tokens = sum(item['est_tokens'] for item in files)
+    stats.planned_cost = sum(item['est_cost'] for item in files)
+    if plan_only:
+        print(format_plan(files, cut))
+        metrics.close()
+        return stats
+    stats.started = datetime.now()
+    run["journal"] = journal
+    run["breaker"] = CircuitBreaker(metrics=metrics)
+    run["store"] = ReportStore(os.path.join(reportsdir, store_name))
+    run["pods"] = threading.local()
 
-                # Add a built-in manager to ensure chat transition
-                manager = GroupChatManager(groupchat=groupchat, llm_config=llm_config)
-
-                # Minimal console status
-                print(f"\n[{vueltas}] - scanning {file_path} for {target}")
-
-                # Start GroupChat
-                try:
-                    pod_agents["core_manager_agent"].initiate_chat(
-                        manager, silent=False,
-                        code_execution_config=False,
-                        max_rounds=12,
-                        message=prompts["prompts"]["autogen_manager_agent"]
-                        )
-                except Exception as e:
-                    logging.error(f"Agent initiation failed: {e}")
-                    continue
-
-                end_time = datetime.now()
-
-                # Track Token Usage and cost per agent
-                total_usage_list = []
-                for podagent in pod_agents:
-                    if pod_agents[podagent].get_total_usage() is not None:
-                        total_usage_list.append(pod_agents[podagent].get_total_usage())
-
-                for usage in total_usage_list:
-                    for key, value in usage.items():
-                        if isinstance(value, dict):
-                            total_tokens = value.get("total_tokens", 0)
-                            total_cost = value.get("cost", 0.00000)
-                            break
-
-                # Store Grand Totals
-                sum_total_tokens += total_tokens
-                sum_total_cost += total_cost
-
-                # Track Duration for stats
-                duration = abs(start_time - end_time)
-                total_duration += duration
-
-                # Collect feedback for agent self-training (manual)
-                for message2 in groupchat.messages:
-                    if message2["name"] == pod_agents["core_manager_agent"].name:
-                        try:
-                            salida2 = json.loads(message2["content"])
-                            if "NEXTSTEP" in salida2:
-                                feedback = salida2["NEXTSTEP"]
-                                if feedback == "REVISE":
-                                    save_feedback_report(salida2)
-                        except json.JSONDecodeError:
-                            continue
-
-                # Parse Conversation Log in reverse for the last valid entry
-                for message in reversed(groupchat.messages):
-                    if message["name"] == pod_agents["core_coder_agent"].name:
-                        try:
-                            salida = json.loads(message["content"])
-                            if "SUMMARY" in salida and "DataDictionary" in salida and "DFD" in salida and "ERD" in salida and "codecontext" in salida:
-                                save_vulnerability_report(salida, filename, dirpath, duration, md5, total_tokens, total_cost, lines_of_code, target)
-                                break
-                        except json.JSONDecodeError:
-                            logging.error("READ-JSON-ERROR-GROUPCHAT-MSG", filename)
-                            continue
-
-                # Print Stats per file analyzed
-                # Print Stats per file analyzed
-                print(banner_small(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error))
+    # Every file gets its own conversation on the GroupChat of its worker thread, so files are scanned by a bounded pool of worker threads.
+    # In watch mode the pool (and the agents of its threads) stays up, and only the files added or modified since the last pass are scanned again
+    profiler = Profiler(profile)
+    retry_counter = RetryCounter(metrics)
+    logging.getLogger("openai._base_client").addHandler(retry_counter)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        completed = scan_plan(files, cut, run, pool, profiler)
+        if architecture and not completed:
+            logging.warning("ARCHITECTURE SKIPPED: the run was interrupted (no package summaries are requested), run it again with --resume")
+        update_documentation(repo_to_scan, run, architecture and completed)
+        if watch and completed:
+            logging.info("WATCH: polling %s every %ss for added or modified files (Ctrl-C to stop)", repo_to_scan, watch)
+        try:
+            while watch and completed:
+                changed, snapshot = wait_for_changes(repo_to_scan, config, snapshot, watch)
+                files, cut = plan_scan(repo_to_scan, run, config, schedule, journal.completed(), changed)
+                stats.add(planned_tokens=sum(item['est_tokens'] for item in files), planned_cost=sum(item['est_cost'] for item in files))
+                completed = scan_plan(files, cut, run, pool, profiler)
+                journal.compact()                                                           # One line per file again, the journal of a long watch stays small
+                update_documentation(repo_to_scan, run, architecture and completed)
+        except KeyboardInterrupt:
+            logging.info("WATCH: stopped")
+    journal.close()
+    run["store"].close()
+
+    # Close the instrumentation: profile dumps, the run summary event and the final Prometheus snapshot
+    logging.getLogger("openai._base_client").removeHandler(retry_counter)
+    peak_memory = profiler.dump(f"{logsdir}profile_{fecha1}.prof")
+    if peak_memory is not None:
+        metrics.set('genmermaid_peak_traced_memory_bytes', peak_memory)
+    metrics.event('run', repo=repo_to_scan, files=stats.vueltas, errors=stats.sum_error, cache_hits=stats.cache_hits, duplicates=stats.duplicates, lines_of_code=stats.sum_lines_of_code,
+                  total_tokens=stats.sum_total_tokens, total_cost=stats.sum_total_cost, wall_seconds=(datetime.now() - wall_start).total_seconds(), workers=workers)
+    metrics.close()
 
     # Print Final Stats
-    adios = banner_full(vueltas, total_duration, sum_lines_of_code, sum_total_tokens, sum_total_cost, sum_error, target)
+    adios = banner_full(stats.vueltas, stats.total_duration, stats.sum_lines_of_code, stats.sum_total_tokens, stats.sum_total_cost, stats.sum_error, target, stats.sum_tokens_saved)
     print(adios)
-    chau = f'''Tally: {vueltas}, Duration: {total_duration}, LoC: {sum_lines_of_code}, Tokens: {sum_total_tokens}, Cost: ${sum_total_cost}, ERROR: {sum_error}, TARGET: {target}'''
+    chau = f'''Tally: {stats.vueltas}, Duration: {stats.total_duration}, Wall: {datetime.now() - wall_start}, Workers: {workers}, LoC: {stats.sum_lines_of_code}, Tokens: {stats.sum_total_tokens}, Cost: ${stats.sum_total_cost}, Tokens Saved: {stats.sum_tokens_saved}, ERROR: {stats.sum_error}, CACHE HITS: {stats.cache_hits}, DUPLICATES: {stats.duplicates}, TARGET: {target}'''
     logging.info( chau)
+    return stats
 
 # Entry point for the script
 if __name__ == "__main__":
     args = parse_arguments()
     repo_to_scan = args.repo_to_scan
-    
+    setup_logging()
+    if args.watch:
+        signal.signal(signal.SIGTERM, signal.default_int_handler)                           # A service manager stops the watch like Ctrl-C: the files in flight are finished
+
     if not os.path.isdir(repo_to_scan):
         logging.error(f"Invalid directory specified: {repo_to_scan}")
         sys.exit(1)
 
-    main(repo_to_scan)
+    main(repo_to_scan, use_cache=not args.no_cache, refresh_cache=args.refresh, workers=args.workers, rpm=args.rpm, tpm=args.tpm, chunk_tokens=args.chunk_tokens, speaker_selection=args.speaker_selection, trust_valid=args.trust_valid, outline=args.outline, metrics_file=args.metrics_file, profile=args.profile, discovery_config=args.discovery_config,
+         plan_only=args.plan, budget_usd=args.budget_usd, budget_tokens=args.budget_tokens, schedule=args.schedule, resume=args.resume, near_duplicates=args.near_duplicates, architecture=args.architecture, watch=args.watch)
@@ -1,77 +1,225 @@
-
 '''
-YAML-Based Project Documentation REPORTING Tool 
+YAML-Based Project Documentation REPORTING Tool
+
+This script is a command-line interface tool designed to convert the JSON into markdown (the latest report of every scanned file, read from the report store)
 
-This script is a command-line interface tool designed to convert the JSON into markdown
+It renders incrementally: a manifest in the reports folder records the report each Markdown file was rendered from, so
+only the files scanned since the last run are rendered again (`--full` renders everything and drops stale renders). Reports are rendered across a
+pool of processes, each Markdown file is written in one go, and a malformed report is listed as failed without stopping the
+batch. An index page (`index.md`) links the report of every file, grouped by folder.
 
 Author Information:
 - Author: Nic Cravino
-- Email: spidernic@me.com 
+- Email: spidernic@me.com
 - LinkedIn: https://www.linkedin.com/in/nic-cravino
 - Date: October 26, 2024
 
 '''
+import argparse
 import json
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from reportstore import ReportStore, default_store_path, report_name
 
-# Directories for input and output
-input_folder = './output/'
+# Report store for input, directory for output
+store_path = default_store_path
 output_folder = './reports/'
+manifest_name = 'manifest.json'                                                       # Report id (and index entry) every Markdown file was rendered from
+index_name = 'index.md'
+parallel_min_reports = 64                                                             # Fewer reports are rendered in this process (starting a pool costs more)
+summary_chars = 200                                                                   # Length of the summary shown on the index page
+
+# Function to parse command-line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Render the scan reports as Markdown')
+    parser.add_argument('--full', action='store_true', help='Render every report, not only the ones scanned since the last run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Processes rendering reports (default: one per CPU)')
+    return parser.parse_args()
+
+# Function to make a value safe for a Markdown table cell
+def cell(value):
+    return str(value).replace('|', '\\|').replace('\r', '').replace('\n', '<br>')
+
+# Function to render a report as Markdown (missing sections are rendered as N/A, plain-text sections as a single row)
+def render_markdown(output_data):
+    out = []
+    # Write summary
+    out.append("# Summary\n\n")
+    out.append(f"{output_data.get('SUMMARY', 'N/A')}\n\n")
+    if output_data.get('duplicate_of'):
+        out.append(f"> Result of `{output_data['duplicate_of']}` (similarity {output_data.get('similarity')}), this file was not scanned on its own.\n\n")
+
+    # Write DFD
+    out.append("## Data Flow Diagram\n\n")
+    out.append(f"{output_data.get('DFD', 'N/A')}\n\n")
 
-# Ensure output directory exists
-os.makedirs(output_folder, exist_ok=True)
+    # Write ERD
+    out.append("## Entity Relationship Diagram\n\n")
+    out.append(f"{output_data.get('ERD', 'N/A')}\n\n")
+
+    # Write Data Dictionary in table format
+    out.append("## Data Dictionary\n\n")
+    out.append("| Component | Field | Description |\n")
+    out.append("|-----------|-------|-------------|\n")
+    data_dictionary = output_data.get("DataDictionary") or {}
+    for component, fields in (data_dictionary.items() if isinstance(data_dictionary, dict) else [("N/A", data_dictionary)]):
+        for field, description in (fields.items() if isinstance(fields, dict) else [("N/A", fields)]):
+            out.append(f"| {cell(component)} | {cell(field)} | {cell(description)} |\n")
+    out.append("\n")
+
+    # Write Code Context in table format
+    out.append("## Code Context\n\n")
+    out.append("| Function | Description | Error Handling | Output |\n")
+    out.append("|----------|-------------|----------------|--------|\n")
+    codecontext = output_data.get("codecontext") or {}
+    for function, details in (codecontext.items() if isinstance(codecontext, dict) else [("N/A", codecontext)]):
+        if not isinstance(details, dict):
+            details = {"Description": details}
+        description = details.get("Description", "N/A")
+        error_handling = details.get("Error Handling", "N/A")
+        output = details.get("Output", "N/A")
+        out.append(f"| {cell(function)} | {cell(description)} | {cell(error_handling)} | {cell(output)} |\n")
+    out.append("\n")
+
+    # Write Scan Information in table format
+    out.append("## Scan Information\n\n")
+    out.append("| Filename | File Path | Scan Date | Scan Duration (s) | MD5 Hash | Total Tokens | Total Cost (USD) | Lines of Code | Scan Type |\n")
+    out.append("|----------|-----------|-----------|------------------|----------|--------------|-----------------|---------------|-----------|\n")
+    out.append(f"| {output_data.get('filename', 'N/A')} | {output_data.get('file_path', 'N/A')} | {output_data.get('scan_date', 'N/A')} | {output_data.get('scan_duration', 0.0):.2f} | {output_data.get('md5_hash', 'N/A')} "
+               f"| {output_data.get('total_tokens', 0)} | ${output_data.get('total_cost', 0.0):.5f} | {output_data.get('lines_of_code', 0)} | {output_data.get('scan_type', 'N/A')} |\n")
+    return ''.join(out)
 
 def print_markdown(output_data, output_path):
+    markdown = render_markdown(output_data)
     with open(output_path, 'w') as f:
-        # Write summary
-        f.write("# Summary\n\n")
-        f.write(output_data["SUMMARY"] + "\n\n")
-
-        # Write DFD
-        f.write("## Data Flow Diagram\n\n")
-        f.write(output_data["DFD"] + "\n\n")
-
-        # Write ERD
-        f.write("## Entity Relationship Diagram\n\n")
-        f.write(output_data["ERD"] + "\n\n")
-
-        # Write Data Dictionary in table format
-        f.write("## Data Dictionary\n\n")
-        f.write("| Component | Field | Description |\n")
-        f.write("|-----------|-------|-------------|\n")
-        for component, fields in output_data["DataDictionary"].items():
-            for field, description in fields.items():
-                f.write(f"| {component} | {field} | {description} |\n")
-        f.write("\n")
-
-        # Write Code Context in table format
-        f.write("## Code Context\n\n")
-        f.write("| Function | Description | Error Handling | Output |\n")
-        f.write("|----------|-------------|----------------|--------|\n")
-        for function, details in output_data["codecontext"].items():
-            description = details.get("Description", "N/A")
-            error_handling = details.get("Error Handling", "N/A")
-            output = details.get("Output", "N/A")
-            f.write(f"| {function} | {description} | {error_handling} | {output} |\n")
-        f.write("\n")
-
-        # Write Scan Information in table format
-        f.write("## Scan Information\n\n")
-        f.write("| Filename | File Path | Scan Date | Scan Duration (s) | MD5 Hash | Total Tokens | Total Cost (USD) | Lines of Code | Scan Type |\n")
-        f.write("|----------|-----------|-----------|------------------|----------|--------------|-----------------|---------------|-----------|\n")
-        f.write(f"| {output_data['filename']} | {output_data['file_path']} | {output_data['scan_date']} | {output_data['scan_duration']:.2f} | {output_data['md5_hash']} | {output_data['total_tokens']} | ${output_data['total_cost']:.5f} | {output_data['lines_of_code']} | {output_data['scan_type']} |\n")
+        f.write(markdown)
+
+# Function to render one report in a worker process, returns (path, error): a malformed report fails alone
+def render_job(job):
+    path, output_path, output_data = job
+    try:
+        print_markdown(output_data, output_path)
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}"
+    return path, None
+
+# Function to load the manifest of the last run (empty when there is none, or when it cannot be read)
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+# Function to save the manifest (atomically, an interrupted run never leaves half a manifest behind)
+def save_manifest(manifest, manifest_path):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+# Function to describe a rendered report on the index page
+def index_entry(report_id, output_data, markdown):
+    summary = str(output_data.get('SUMMARY') or '').strip().split('\n')[0]
+    return {
+        'id': report_id,
+        'markdown': markdown,
+        'filename': output_data.get('filename', ''),
+        'summary': summary[:summary_chars] + ('...' if len(summary) > summary_chars else ''),
+        'scan_date': output_data.get('scan_date', ''),
+        'lines_of_code': output_data.get('lines_of_code', 0),
+        'duplicate_of': output_data.get('duplicate_of')
+    }
+
+# Function to write the index page: every documented file, grouped by folder, with a link to its report
+def write_index(manifest, index_path):
+    folders = {}
+    for path, entry in manifest.items():
+        folders.setdefault(os.path.dirname(path), []).append((path, entry))
+    failed = sum(1 for entry in manifest.values() if entry.get('error'))
+    out = ["# Documentation Index\n\n", f"{len(manifest) - failed} files documented ({failed} failed to render), generated {datetime.now().strftime('%Y-%m-%dT%H:%M:%S')}.\n\n"]
+    for folder in sorted(folders):
+        out.append(f"## {folder or '.'}\n\n")
+        out.append("| File | Summary | Lines of Code | Scan Date |\n")
+        out.append("|------|---------|---------------|-----------|\n")
+        for path, entry in sorted(folders[folder]):
+            name = cell(os.path.basename(path))
+            if entry.get('error'):
+                out.append(f"| {name} | render failed: {cell(entry['error'])} | | |\n")
+                continue
+            summary = f"(copy of {entry['duplicate_of']}) {entry['summary']}" if entry.get('duplicate_of') else entry['summary']
+            out.append(f"| [{name}]({entry['markdown']}) | {cell(summary)} | {entry['lines_of_code']} | {entry['scan_date']} |\n")
+        out.append("\n")
+    with open(index_path, 'w') as f:
+        f.write(''.join(out))
+
+# Main function: render the reports scanned since the last run (or every report), then the index page
+def main(full=False, workers=1):
+    store = ReportStore(store_path)
+    latest = store.latest_ids()
+    manifest_path = os.path.join(output_folder, manifest_name)
+    manifest = {} if full else load_manifest(manifest_path)
+
+    # Paths gone from the store lose their Markdown file
+    for path in [path for path in manifest if path not in latest]:
+        entry = manifest.pop(path)
+        if entry.get('markdown') and os.path.exists(os.path.join(output_folder, entry['markdown'])):
+            os.remove(os.path.join(output_folder, entry['markdown']))
+
+    # Render only the reports that changed (a new scan, a failed render, or a Markdown file deleted by hand)
+    changed = [path for path, report_id in latest.items()
+               if path not in manifest or manifest[path].get('id') != report_id or not os.path.exists(os.path.join(output_folder, manifest[path].get('markdown') or ''))]
+    reports = store.reports_by_id(latest[path] for path in changed)
+    store.close()
+    taken = {entry['markdown'] for path, entry in manifest.items() if path not in changed and entry.get('markdown')}
+    jobs, entries = [], {}
+    for path in changed:
+        output_data = reports[latest[path]]
+        markdown = f"{report_name(output_data)}.md"
+        if markdown in taken:
+            markdown = f"{report_name(output_data)}_{latest[path]}.md"                          # Copies of a file share its name and scan second
+        taken.add(markdown)
+        jobs.append((path, os.path.join(output_folder, markdown), output_data))
+        entries[path] = index_entry(latest[path], output_data, markdown)
+
+    if workers > 1 and len(jobs) >= parallel_min_reports:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(render_job, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+    else:
+        results = [render_job(job) for job in jobs]
+
+    failed = 0
+    for path, error in results:
+        previous = manifest.get(path, {}).get('markdown')
+        if error:
+            failed += 1
+            print(f"RENDER FAILED: {path} - {error}")
+            manifest[path] = {'id': None, 'markdown': None, 'error': error}                      # Retried on the next run
+            continue
+        if previous and previous != entries[path]['markdown'] and os.path.exists(os.path.join(output_folder, previous)):
+            os.remove(os.path.join(output_folder, previous))                                     # The stale render of an older report
+        manifest[path] = entries[path]
+
+    # --full starts from an empty manifest, so it sweeps the rendered reports no entry points to any more (stale paths, older renders)
+    if full:
+        kept = {entry['markdown'] for entry in manifest.values() if entry.get('markdown')}
+        for name in os.listdir(output_folder):
+            if name.startswith('scan_report_') and name.endswith('.md') and name not in kept:
+                os.remove(os.path.join(output_folder, name))
+
+    save_manifest(manifest, manifest_path)
+    write_index(manifest, os.path.join(output_folder, index_name))
+    print(f"Rendered {len(jobs) - failed} reports ({failed} failed, {len(latest) - len(jobs)} unchanged), index: {os.path.join(output_folder, index_name)}")
+    return failed
 
 if __name__ == "__main__":
-    # Iterate over JSON files in the input folder
-    for filename in os.listdir(input_folder):
-        if filename.endswith('.json'):
-            input_path = os.path.join(input_folder, filename)
-            output_filename = filename.replace('.json', '.md')
-            output_path = os.path.join(output_folder, output_filename)
-
-            # Load JSON data from the file
-            with open(input_path, 'r') as json_file:
-                output_data = json.load(json_file)
-
-            # Generate markdown report
-            print_markdown(output_data, output_path)
+    args = parse_arguments()
+    if not os.path.isfile(store_path):
+        print(f"Report store not found: {store_path} (reports of older versions can be imported with: python reportstore.py import ./output/)")
+        sys.exit(1)
+
+    # Ensure output directory exists
+    os.makedirs(output_folder, exist_ok=True)
+    sys.exit(1 if main(full=args.full, workers=args.workers) else 0)
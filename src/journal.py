@@ -0,0 +1,98 @@
+'''
+Job Journal for the YAML-Based Project Documentation Tool
+
+This module keeps a durable record of the state of every planned file (pending, in_flight, done, failed) in an
+append-only JSONL file, so that an interrupted or crashed run can be resumed where it stopped (`--resume`). Every state
+change is one line. Terminal states are fsync'ed, and the latest line per file wins. On resume, and after every pass of a
+watch, the journal is compacted to one line per file before the run appends to it again.
+'''
+import hashlib
+import json
+import logging
+import os
+import threading
+from datetime import datetime
+
+job_states = ('pending', 'in_flight', 'done', 'failed')
+
+# Function to name the journal of a repository and prompt set (a different prompt set is a different job)
+def journal_path(journaldir, repo_to_scan, prompt_hash):
+    key = hashlib.md5(f"{os.path.abspath(repo_to_scan)}|{prompt_hash}".encode('utf-8')).hexdigest()[:16]
+    return os.path.join(journaldir, f"journal_{key}.jsonl")
+
+# Class to record the state of every file of a run, thread-safe (workers record their own files)
+class Journal:
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+        self.entries = self.load() if resume else {}
+        if resume:
+            self.compact()
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+
+    # Read the latest entry per file (a torn last line, e.g. after a crash, is ignored)
+    def load(self):
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    entries[entry['relpath']] = entry
+        except OSError:
+            logging.info("JOURNAL: no journal to resume at %s, starting from the first file", self.path)
+        return entries
+
+    # Rewrite the journal with one line per file (atomically), an open journal goes on appending to the compacted file
+    def compact(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                for entry in self.entries.values():
+                    f.write(json.dumps(entry) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            if self.file is not None:
+                self.file.close()
+                self.file = open(self.path, 'a', encoding='utf-8')
+
+    # Files already documented in an earlier run, as relpath -> md5 (a file changed since then is not considered done)
+    def completed(self):
+        return {relpath: entry.get('md5') for relpath, entry in self.entries.items() if entry['state'] == 'done'}
+
+    # Record a state change of a file (done and failed are flushed to disk before returning)
+    def record(self, relpath, state, **fields):
+        entry = dict({'ts': datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), 'relpath': relpath, 'state': state}, **fields)
+        with self.lock:
+            self.entries[relpath] = entry
+            self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            if state in ('done', 'failed'):
+                os.fsync(self.file.fileno())
+
+    # Record many files at once (the pending plan), with a single flush
+    def record_many(self, relpaths, state, **fields):
+        fecha = datetime.now().strftime("%Y-%m-%dT%H:%M:%S")
+        with self.lock:
+            for relpath in relpaths:
+                entry = dict({'ts': fecha, 'relpath': relpath, 'state': state}, **fields)
+                self.entries[relpath] = entry
+                self.file.write(json.dumps(entry) + '\n')
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    # Count the files per state
+    def summary(self):
+        with self.lock:
+            counts = dict.fromkeys(job_states, 0)
+            for entry in self.entries.values():
+                counts[entry['state']] = counts.get(entry['state'], 0) + 1
+            return counts
+
+    def close(self):
+        with self.lock:
+            self.file.close()
@@ -0,0 +1,241 @@
+'''
+Mermaid.js Helpers for the YAML-Based Project Documentation Tool
+
+This module parses the Mermaid.js diagrams generated by the agents (DFD as `flowchart`/`graph`, ERD as `erDiagram`) and merges
+several diagrams into one, e.g. when a large file is documented in chunks and the per-chunk results have to be combined.
+It only understands the subset of the Mermaid.js syntax that the prompts ask for, and works without any external dependency.
+'''
+import re
+
+# Regular expressions for the Mermaid.js subset we understand
+FENCE_RE = re.compile(r'^\s*```\s*mermaid\s*\n(.*?)\n?\s*```\s*$', re.S)
+FLOWCHART_HEADER_RE = re.compile(r'^\s*(flowchart|graph)(\s+(TB|TD|BT|RL|LR))?\s*;?\s*$')
+NODE_ID_RE = re.compile(r'\w+')
+LINK_RE = re.compile(r'''\s*(?:
+      <?--\s+[^-|\s][^|]*?\s+-{2,}[->ox]            # -- text -->
+    | <?==\s+[^=|\s][^|]*?\s+={2,}[=>ox]            # == text ==>
+    | <?-\.\s+[^.|\s][^|]*?\s+\.+-[>ox]?            # -. text .->
+    | <?(?:-{2,}|={2,}|-\.+-|~{3,})[>ox]?           # -->, ---, ==>, -.->, ~~~
+    )\s*(?:\|[^|]*\|)?\s*''', re.X)
+SHAPE_CLOSE = {'[': ']', '(': ')', '{': '}', '>': ']'}
+ER_HEADER_RE = re.compile(r'^\s*erDiagram\s*$')
+ER_NAME = r'(?:[\w\-]+|"[^"]+")'
+ER_RELATION_RE = re.compile(rf'^\s*({ER_NAME})\s*(\|o|\|\||\}}o|\}}\|)(--|\.\.)(o\||\|\||o\{{|\|\{{)\s*({ER_NAME})\s*:\s*(\S.*?)\s*$')
+ER_ENTITY_OPEN_RE = re.compile(rf'^\s*({ER_NAME})(\s*\[\s*"[^"]*"\s*\])?\s*\{{\s*$')
+ER_ENTITY_RE = re.compile(rf'^\s*({ER_NAME})\s*$')
+ER_ATTRIBUTE_RE = re.compile(r'^\s*[\w\-\[\]\(\),]+\s+[\w\-\*]+(\s+(PK|FK|UK)(\s*,\s*(PK|FK|UK))*)?(\s+"[^"]*")?\s*$')
+
+# Function to remove the ```mermaid fence around a diagram (returns None when the value is not fenced or the fence is not closed)
+def strip_fence(text):
+    match = FENCE_RE.match(text or '')
+    return match.group(1) if match else None
+
+# Function to wrap a diagram in a ```mermaid fence, as the agents are asked to deliver it
+def fence(body):
+    return f"```mermaid\n{body}\n```"
+
+# Function to read a node shape (e.g. [label], (label), {{label}}, >label]) starting at `pos`, returns (label, end position)
+def _read_shape(line, pos):
+    opening = ''
+    while pos + len(opening) < len(line) and line[pos + len(opening)] in '[({' and len(opening) < 3:
+        opening += line[pos + len(opening)]
+    if not opening and line[pos:pos + 1] == '>':
+        opening = '>'
+    if not opening:
+        return None, pos
+    closing = ''.join(SHAPE_CLOSE[c] for c in reversed(opening))
+    start = pos + len(opening)
+    if line[start:start + 1] == '"':
+        quote_end = line.find('"', start + 1)
+        if quote_end == -1:
+            raise ValueError(f"unclosed quote in node label at column {start + 1}")
+        end = line.find(closing, quote_end + 1)
+    else:
+        end = line.find(closing, start)
+    if end == -1:
+        raise ValueError(f"node shape opened with '{opening}' at column {pos + 1} is never closed with '{closing}'")
+    return line[start:end].strip().strip('"'), end + len(closing)
+
+# Function to parse one flowchart statement such as `A[Input] -->|uses| B & C`, returns node ids (with spans), labels and edges
+def _parse_chain(line):
+    pos, ids, nodes, edges, previous = 0, [], {}, [], None
+    while True:
+        group = []
+        while True:
+            while pos < len(line) and line[pos].isspace():
+                pos += 1
+            match = NODE_ID_RE.match(line, pos)
+            if not match:
+                raise ValueError(f"expected a node id at column {pos + 1}")
+            node_id = match.group(0)
+            ids.append((match.start(), match.end(), node_id))
+            label, pos = _read_shape(line, match.end())
+            if label is not None or node_id not in nodes:
+                nodes[node_id] = label if label is not None else nodes.get(node_id)
+            if line.startswith(':::', pos):
+                class_match = NODE_ID_RE.match(line, pos + 3)
+                pos = class_match.end() if class_match else pos + 3
+            group.append(node_id)
+            ampersand = re.compile(r'\s*&').match(line, pos)
+            if not ampersand:
+                break
+            pos = ampersand.end()
+        if previous is not None:
+            edges.extend((src, dst) for src in previous for dst in group)
+        link = LINK_RE.match(line, pos)
+        if link and link.end() > pos and line[pos:link.end()].strip():
+            previous, pos = group, link.end()
+            continue
+        if line[pos:].strip():
+            raise ValueError(f"unexpected text '{line[pos:].strip()}' at column {pos + 1}")
+        return ids, nodes, edges
+
+# Function to parse a flowchart (DFD) body line by line: every statement keeps its original text plus the spans of the node ids it uses
+def parse_flowchart(body):
+    statements, errors, header = [], [], None
+    for number, raw in enumerate(body.splitlines(), start=1):
+        line = raw.rstrip().rstrip(';')
+        stripped = line.strip()
+        statement = {'line': number, 'text': line, 'kind': 'chain', 'ids': [], 'nodes': {}, 'edges': []}
+        if not stripped or stripped.startswith('%%'):
+            statement['kind'] = 'comment'
+        elif header is None:
+            match = FLOWCHART_HEADER_RE.match(line)
+            if not match:
+                errors.append(f"line {number}: a DFD must start with 'flowchart <direction>' (or 'graph <direction>'), found '{stripped}'")
+                return None, statements, errors
+            header = stripped
+            statement['kind'] = 'header'
+        elif stripped == 'end':
+            statement['kind'] = 'end'
+        elif stripped.startswith(('classDef ', 'linkStyle ', 'direction ')):
+            statement['kind'] = stripped.split()[0]
+        elif stripped.startswith(('subgraph ', 'style ', 'click ', 'class ')):
+            statement['kind'] = stripped.split()[0]
+            offset = len(line) - len(line.lstrip()) + len(statement['kind'])
+            match = NODE_ID_RE.search(line, offset)
+            if match and not line[offset:match.start()].strip():
+                if statement['kind'] == 'class':
+                    for id_match in NODE_ID_RE.finditer(line[:line.rfind(' ')], offset):
+                        statement['ids'].append((id_match.start(), id_match.end(), id_match.group(0)))
+                else:
+                    statement['ids'].append((match.start(), match.end(), match.group(0)))
+        else:
+            try:
+                statement['ids'], statement['nodes'], statement['edges'] = _parse_chain(line)
+            except ValueError as e:
+                statement['kind'] = 'invalid'
+                errors.append(f"line {number}: {e}: '{stripped}'")
+        statements.append(statement)
+    if header is None:
+        errors.append("is empty")
+    return header, statements, errors
+
+# Function to parse an erDiagram (ERD) body into its entities (with attribute lines) and relationships
+def parse_erdiagram(body):
+    entities, relationships, errors, header, current = {}, [], [], False, None
+    for number, raw in enumerate(body.splitlines(), start=1):
+        line = raw.rstrip()
+        stripped = line.strip()
+        if not stripped or stripped.startswith('%%'):
+            continue
+        if not header:
+            if not ER_HEADER_RE.match(line):
+                errors.append(f"line {number}: an ERD must start with 'erDiagram', found '{stripped}'")
+                return entities, relationships, errors
+            header = True
+        elif current is not None:
+            if stripped == '}':
+                current = None
+            elif ER_ATTRIBUTE_RE.match(line):
+                if stripped not in entities[current]:
+                    entities[current].append(stripped)
+            else:
+                errors.append(f"line {number}: invalid attribute in entity {current}, expected '<type> <name> [PK|FK|UK] [\"comment\"]': '{stripped}'")
+        elif ER_RELATION_RE.match(line):
+            match = ER_RELATION_RE.match(line)
+            left, right = match.group(1).strip('"'), match.group(5).strip('"')
+            entities.setdefault(left, [])
+            entities.setdefault(right, [])
+            relationship = f"{match.group(1)} {match.group(2)}{match.group(3)}{match.group(4)} {match.group(5)} : {match.group(6)}"
+            if relationship not in relationships:
+                relationships.append(relationship)
+        elif ER_ENTITY_OPEN_RE.match(line):
+            current = ER_ENTITY_OPEN_RE.match(line).group(1).strip('"')
+            entities.setdefault(current, [])
+        elif ER_ENTITY_RE.match(line):
+            entities.setdefault(ER_ENTITY_RE.match(line).group(1).strip('"'), [])
+        else:
+            errors.append(f"line {number}: not a relationship ('A ||--o{{ B : label', cardinalities |o || }}o }}| / o| || o{{ |{{) nor an entity: '{stripped}'")
+    if not header:
+        errors.append("is empty")
+    elif current is not None:
+        errors.append(f"entity {current} is never closed with '}}'")
+    return entities, relationships, errors
+
+# Function to merge several flowcharts into one: nodes with the same label are unified, other node ids are prefixed per diagram
+def merge_flowcharts(diagrams, prefix='p'):
+    header, lines, by_label = None, [], {}
+    for index, diagram in enumerate(diagrams, start=1):
+        body = strip_fence(diagram) or diagram or ''
+        chart_header, statements, _ = parse_flowchart(body)
+        if chart_header is None:
+            continue
+        header = header or chart_header
+        renamed = {}
+        for statement in statements:
+            for node_id, label in statement['nodes'].items():
+                if node_id in renamed:
+                    continue
+                if label and label.lower() in by_label:
+                    renamed[node_id] = by_label[label.lower()]
+                else:
+                    renamed[node_id] = f"{prefix}{index}_{node_id}"
+                    if label:
+                        by_label[label.lower()] = renamed[node_id]
+        for statement in statements:
+            if statement['kind'] in ('header', 'comment', 'linkStyle', 'invalid'):
+                continue
+            text = statement['text']
+            for start, end, node_id in sorted(statement['ids'], reverse=True):
+                text = text[:start] + renamed.setdefault(node_id, f"{prefix}{index}_{node_id}") + text[end:]
+            if statement['kind'] in ('subgraph', 'end') or text not in lines:
+                lines.append(text)
+    return fence('\n'.join([header or 'flowchart TD'] + lines))
+
+# Function to merge several erDiagrams into one: entities are unified by name (attributes de-duplicated) and relationships de-duplicated
+def merge_erdiagrams(diagrams):
+    entities, relationships = {}, []
+    for diagram in diagrams:
+        body = strip_fence(diagram) or diagram or ''
+        chart_entities, chart_relationships, _ = parse_erdiagram(body)
+        for name, attributes in chart_entities.items():
+            merged = entities.setdefault(name, [])
+            merged.extend(a for a in attributes if a not in merged)
+        relationships.extend(r for r in chart_relationships if r not in relationships)
+    lines = ['erDiagram'] + [f"    {r}" for r in relationships]
+    for name, attributes in entities.items():
+        if attributes:
+            entity = f'"{name}"' if not re.fullmatch(r'[\w\-]+', name) else name
+            lines += [f"    {entity} {{"] + [f"        {a}" for a in attributes] + ["    }"]
+    return fence('\n'.join(lines))
+
+# Function to validate a DFD: fenced ```mermaid block, flowchart/graph header, node and edge syntax, at least one node (returns the list of errors)
+def validate_flowchart(text):
+    body = strip_fence(text) if isinstance(text, str) else None
+    if body is None:
+        return ["DFD must be a string holding a single ```mermaid fenced block (opened with ```mermaid and closed with ```)"]
+    header, statements, errors = parse_flowchart(body)
+    if not errors and not any(statement['ids'] for statement in statements if statement['kind'] == 'chain'):
+        errors.append("has no nodes")
+    return [f"DFD {error}" for error in errors]
+
+# Function to validate an ERD: fenced ```mermaid block, erDiagram header, relationship cardinalities and entity blocks, at least one entity (returns the list of errors)
+def validate_erdiagram(text):
+    body = strip_fence(text) if isinstance(text, str) else None
+    if body is None:
+        return ["ERD must be a string holding a single ```mermaid fenced block (opened with ```mermaid and closed with ```)"]
+    entities, _, errors = parse_erdiagram(body)
+    if not errors and not entities:
+        errors.append("has no entities")
+    return [f"ERD {error}" for error in errors]
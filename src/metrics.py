@@ -0,0 +1,177 @@
+'''
+Scan Instrumentation for the YAML-Based Project Documentation Tool
+
+This module records where time and money go while scanning: structured events (one JSON object per line, per file and
+per LLM round) and a snapshot of counters and histograms in the Prometheus textfile format, which node_exporter's
+textfile collector (or any scraper reading the file) can pick up. The optional profiler wraps work in cProfile and
+tracemalloc and dumps the aggregated results at the end of the run.
+'''
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+snapshot_interval = 10                                                                # Seconds between two Prometheus snapshots while a scan runs (plus one at the end)
+duration_buckets = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+rounds_buckets = (1, 2, 3, 4, 5, 6, 8, 10, 15, 20)
+profile_top = 25                                                                      # Functions (cProfile) and allocation sites (tracemalloc) written to the log
+
+# Prometheus metric families: name -> (type, help, histogram buckets)
+metric_families = {
+    'genmermaid_files_total': ('counter', 'Files processed, by outcome (ok, error, validation_error, cache_hit, duplicate, skipped, budget_cut).', None),
+    'genmermaid_discovery_skipped_total': ('counter', 'Files and folders left out of the plan by the discovery, by reason.', None),
+    'genmermaid_discovery_planned_files': ('gauge', 'Files in the scan plan.', None),
+    'genmermaid_discovery_estimated_tokens': ('gauge', 'Estimated source tokens of the files in the scan plan.', None),
+    'genmermaid_lines_of_code_total': ('counter', 'Lines of code ingested.', None),
+    'genmermaid_phase_seconds_total': ('counter', 'Time spent per scan phase (read, tokenize, pod, analyze, llm, parse, write).', None),
+    'genmermaid_llm_requests_total': ('counter', 'Agent rounds, by agent and source (llm or local).', None),
+    'genmermaid_llm_retries_total': ('counter', 'Requests retried by the OpenAI client (rate limits, server errors, timeouts).', None),
+    'genmermaid_chat_retries_total': ('counter', 'Conversations restarted after a transient API failure (with backoff).', None),
+    'genmermaid_circuit_open': ('gauge', '1 while the circuit breaker pauses the run (open or probing), 0 otherwise.', None),
+    'genmermaid_tokens_total': ('counter', 'Tokens spent, by agent and kind (prompt or completion).', None),
+    'genmermaid_cost_usd_total': ('counter', 'Cost in USD, by agent.', None),
+    'genmermaid_prompt_tokens_saved_total': ('counter', 'Prompt tokens saved against the previous prompt layout (source in the system prompts, whole history on every call).', None),
+    'genmermaid_round_duration_seconds': ('histogram', 'Duration of a single agent round, by agent.', duration_buckets),
+    'genmermaid_file_duration_seconds': ('histogram', 'Duration of a file scanned by the agents.', duration_buckets),
+    'genmermaid_rounds_to_terminate': ('histogram', 'core_coder_agent rounds until the reviewer answered TERMINATE.', rounds_buckets),
+    'genmermaid_peak_traced_memory_bytes': ('gauge', 'Peak memory traced by tracemalloc (only with --profile).', None),
+    'genmermaid_last_update_timestamp_seconds': ('gauge', 'Unix time of this snapshot.', None)
+}
+
+# Function to render Prometheus labels, sorted so that the same labels always give the same series
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+# Class to collect the run metrics from concurrent workers: JSONL events as they happen, Prometheus snapshots on a timer and at the end
+class Metrics:
+    def __init__(self, jsonl_path=None, prom_path=None):
+        self.lock = threading.Lock()
+        self.jsonl_path, self.prom_path = jsonl_path, prom_path
+        self.values = {}                                                                  # (name, sorted label items) -> value (counters and gauges)
+        self.histograms = {}                                                              # (name, sorted label items) -> [bucket counts, sum, count]
+        self.last_snapshot = 0.0
+        self.jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    # Write one structured event as a JSON line
+    def event(self, kind, **fields):
+        if self.jsonl is None:
+            return
+        line = json.dumps(dict({'ts': datetime.now().strftime("%Y-%m-%dT%H:%M:%S.%f"), 'event': kind}, **fields), default=str)
+        with self.lock:
+            self.jsonl.write(line + '\n')
+            self.jsonl.flush()
+
+    # Add to a counter
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    # Set a gauge
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.values[(name, tuple(sorted(labels.items())))] = value
+
+    # Record an observation in a histogram
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        buckets = metric_families[name][2]
+        with self.lock:
+            histogram = self.histograms.setdefault(key, [[0] * len(buckets), 0.0, 0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    # Render every metric in the Prometheus text exposition format
+    def render(self):
+        with self.lock:
+            values, histograms = dict(self.values), {key: [list(h[0]), h[1], h[2]] for key, h in self.histograms.items()}
+        lines = []
+        for name, (kind, help_text, buckets) in metric_families.items():
+            series = [(dict(labels), value) for (metric, labels), value in sorted(values.items()) if metric == name]
+            observed = [(dict(labels), histogram) for (metric, labels), histogram in sorted(histograms.items()) if metric == name]
+            if not series and not observed:
+                continue
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [f"{name}{_labels(labels)} {value}" for labels, value in series]
+            for labels, (counts, total, count) in observed:
+                lines += [f"{name}_bucket{_labels(dict(labels, le=bound))} {counts[index]}" for index, bound in enumerate(buckets)]
+                lines += [f"{name}_bucket{_labels(dict(labels, le='+Inf'))} {count}", f"{name}_sum{_labels(labels)} {total}", f"{name}_count{_labels(labels)} {count}"]
+        return '\n'.join(lines) + '\n'
+
+    # Write the Prometheus snapshot (atomically, a scraper never reads half a file), at most every snapshot_interval seconds unless forced
+    def snapshot(self, force=False):
+        if not self.prom_path:
+            return
+        with self.lock:
+            if not force and time.monotonic() - self.last_snapshot < snapshot_interval:
+                return
+            self.last_snapshot = time.monotonic()
+        self.set('genmermaid_last_update_timestamp_seconds', round(time.time(), 3))
+        tmp_path = f"{self.prom_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.render())
+        os.replace(tmp_path, self.prom_path)
+
+    # Write the final snapshot and close the event log
+    def close(self):
+        self.snapshot(force=True)
+        if self.jsonl is not None:
+            with self.lock:
+                self.jsonl.close()
+                self.jsonl = None
+
+# Class to profile the scan: one cProfile per call (profiles are per thread), aggregated with pstats, plus tracemalloc for the whole run
+class Profiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.stats = None
+        if enabled:
+            tracemalloc.start()
+
+    # Run a function under cProfile (runs it plainly when profiling is off, or when the interpreter refuses a second active profiler)
+    def call(self, function, *args, **kwargs):
+        if not self.enabled:
+            return function(*args, **kwargs)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            with self.lock:
+                if self.stats is None:
+                    self.stats = pstats.Stats(profile)
+                else:
+                    self.stats.add(profile)
+
+    # Dump the aggregated profile (open it with `python -m pstats` or snakeviz), log the top functions and allocation sites, return the peak traced memory
+    def dump(self, profile_path):
+        if not self.enabled:
+            return None
+        if self.stats is not None:
+            self.stats.dump_stats(profile_path)
+            report = io.StringIO()
+            self.stats.stream = report
+            self.stats.sort_stats('cumulative').print_stats(profile_top)
+            logging.info("PROFILE: %s\n%s", profile_path, report.getvalue())
+        top = tracemalloc.take_snapshot().statistics('lineno')[:profile_top]
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        logging.info("MEMORY: peak %.1f MB traced, top allocation sites:\n%s", peak / 1024 / 1024, '\n'.join(str(stat) for stat in top))
+        return peak
@@ -0,0 +1,215 @@
+'''
+Report Store for the YAML-Based Project Documentation Tool
+
+This module keeps the JSON reports of every scan in a single SQLite database instead of one timestamped JSON file per
+file per run. Each report is stored whole (the JSON payload), next to columns describing it: the scanned path, the MD5
+hash of the content, the scan date, the model and the prompt hash (indexed by path and by scan date, the lookups the tools
+make). The `latest_reports` view holds the latest report per path, so fresh and stale reports are never mixed. Retention
+drops superseded versions (by count and age, the latest report of a path is always kept), and compaction gives the freed
+pages back to the disk. The package- and repository-level results built from the reports (architecture.py) are kept next
+to them, one per folder, with a fingerprint of the inputs they were built from.
+
+The store can be used from the command line to import the reports of older versions (JSON files), export reports in that
+same JSON format, apply the retention and compact:
+
+    python reportstore.py import ./output/
+    python reportstore.py export ./export/ [--all]
+    python reportstore.py compact --keep 5 --max-age-days 90
+'''
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+default_store_folder = './output/'                                                    # genmermaid.py writes the store here (its reportsdir)
+store_name = 'reports.db'
+default_store_path = os.path.join(default_store_folder, store_name)
+compact_free_ratio = 0.25                                                             # Compaction (VACUUM) only runs once this share of the pages is free
+
+schema = '''
+CREATE TABLE IF NOT EXISTS reports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    md5_hash TEXT,
+    scan_date TEXT NOT NULL,
+    model TEXT,
+    prompt_hash TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS reports_path ON reports (path, id);
+CREATE INDEX IF NOT EXISTS reports_scan_date ON reports (scan_date);
+CREATE VIEW IF NOT EXISTS latest_reports AS
+    SELECT reports.* FROM reports JOIN (SELECT MAX(id) AS id FROM reports GROUP BY path) latest ON reports.id = latest.id;
+CREATE TABLE IF NOT EXISTS aggregates (
+    root TEXT NOT NULL,
+    folder TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    updated TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    PRIMARY KEY (root, folder)
+);
+'''
+
+# Function to name a report in the JSON format of the reports folder (scan_report_<filename>_<scan date>)
+def report_name(report):
+    return f"scan_report_{report['filename']}_{report['scan_date'].replace('-', '').replace(':', '')}"
+
+# Class to store and look up the scan reports, thread-safe (the scan workers save their reports through one connection)
+class ReportStore:
+    def __init__(self, path=default_store_path):
+        self.path = path
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')                                          # Readers (genreports.py) never block the scan that writes
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.executescript(schema)
+
+    # Save a report (the payload is the report as written by genmermaid.py), returns its id
+    def save(self, report, model=None, prompt_hash=None):
+        row = (os.path.join(report['file_path'], report['filename']), report['filename'], report.get('md5_hash'), report['scan_date'],
+               model or report.get('model'), prompt_hash or report.get('prompt_hash'), json.dumps(report))
+        with self.lock, self.db:
+            return self.db.execute('INSERT INTO reports (path, filename, md5_hash, scan_date, model, prompt_hash, payload) VALUES (?, ?, ?, ?, ?, ?, ?)', row).lastrowid
+
+    # Latest report of a path (None when the path was never scanned)
+    def latest(self, path):
+        with self.lock:
+            row = self.db.execute('SELECT payload FROM reports WHERE path = ? ORDER BY id DESC LIMIT 1', (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    # Reports as (id, report), ordered by path: the latest one per path, or every stored version (latest=False), newer than since_id
+    def reports(self, latest=True, since_id=0):
+        table = 'latest_reports' if latest else 'reports'
+        with self.lock:
+            rows = self.db.execute(f'SELECT id, payload FROM {table} WHERE id > ? ORDER BY path, id', (since_id,)).fetchall()
+        return [(report_id, json.loads(payload)) for report_id, payload in rows]
+
+    # Id of the latest report of every path, as path -> id (the index only, no payload is read)
+    def latest_ids(self):
+        with self.lock:
+            return dict(self.db.execute('SELECT path, MAX(id) FROM reports GROUP BY path').fetchall())
+
+    # Reports by id, as id -> report
+    def reports_by_id(self, ids):
+        ids, found = list(ids), {}
+        with self.lock:
+            for start in range(0, len(ids), 500):                                                # Within SQLite's limit of bound parameters
+                batch = ids[start:start + 500]
+                found.update(self.db.execute(f"SELECT id, payload FROM reports WHERE id IN ({','.join('?' * len(batch))})", batch).fetchall())
+        return {report_id: json.loads(payload) for report_id, payload in found.items()}
+
+    # Package-level results of a repository, as folder (relative to the repository, '' for its root) -> (fingerprint, result)
+    def aggregates(self, root):
+        with self.lock:
+            rows = self.db.execute('SELECT folder, fingerprint, payload FROM aggregates WHERE root = ?', (root,)).fetchall()
+        return {folder: (fingerprint, json.loads(payload)) for folder, fingerprint, payload in rows}
+
+    # Save the package-level result of a folder (replaces the previous one)
+    def save_aggregate(self, root, folder, fingerprint, result):
+        with self.lock, self.db:
+            self.db.execute('INSERT OR REPLACE INTO aggregates (root, folder, fingerprint, updated, payload) VALUES (?, ?, ?, ?, ?)',
+                            (root, folder, fingerprint, datetime.now().strftime("%Y-%m-%dT%H:%M:%S"), json.dumps(result)))
+
+    # Drop the package-level results of folders that are gone
+    def delete_aggregates(self, root, folders):
+        with self.lock, self.db:
+            self.db.executemany('DELETE FROM aggregates WHERE root = ? AND folder = ?', [(root, folder) for folder in folders])
+
+    # Count the stored reports and the scanned paths
+    def count(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*), COUNT(DISTINCT path) FROM reports').fetchone()
+
+    # Drop superseded reports: beyond the newest keep_versions of a path, or older than max_age_days (0 disables a rule), returns how many were dropped
+    def apply_retention(self, keep_versions=0, max_age_days=0):
+        if not keep_versions and not max_age_days:
+            return 0
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).strftime("%Y-%m-%dT%H:%M:%S") if max_age_days else ''
+        with self.lock, self.db:
+            return self.db.execute('''
+                DELETE FROM reports WHERE id IN (
+                    SELECT id FROM (SELECT id, scan_date, ROW_NUMBER() OVER (PARTITION BY path ORDER BY id DESC) AS version FROM reports)
+                    WHERE version > 1 AND ((? > 0 AND version > ?) OR scan_date < ?))''', (keep_versions, keep_versions, cutoff)).rowcount
+
+    # Give the pages freed by the retention back to the disk, only when enough of the file is free (or when forced), returns whether it ran
+    def compact(self, force=False):
+        with self.lock:
+            free, total = self.db.execute('PRAGMA freelist_count').fetchone()[0], self.db.execute('PRAGMA page_count').fetchone()[0]
+            if not force and (not total or free / total < compact_free_ratio):
+                return False
+            self.db.execute('VACUUM')
+            self.db.execute('PRAGMA optimize')
+        logging.info("REPORT STORE COMPACTED: %s (%s of %s pages were free)", self.path, free, total)
+        return True
+
+    # Import the JSON reports of a folder (the format of older versions), oldest first so that the latest scan of a path stays the latest
+    def import_json(self, folder):
+        reports = []
+        for filename in os.listdir(folder):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(folder, filename), 'r') as f:
+                    report = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.error("REPORT NOT IMPORTED: %s - %s", filename, e)
+                continue
+            if not all(k in report for k in ('filename', 'file_path', 'scan_date')):
+                logging.error("REPORT NOT IMPORTED: %s - not a scan report", filename)
+                continue
+            reports.append(report)
+        for report in sorted(reports, key=lambda report: report['scan_date']):
+            self.save(report)
+        return len(reports)
+
+    # Export reports to a folder in the JSON format of older versions (one file per report), returns how many were written
+    def export_json(self, folder, latest=True):
+        os.makedirs(folder, exist_ok=True)
+        reports = self.reports(latest=latest)
+        for report_id, report in reports:
+            path = os.path.join(folder, f"{report_name(report)}.json")
+            if os.path.exists(path):
+                path = os.path.join(folder, f"{report_name(report)}_{report_id}.json")       # Copies of a file share its name and scan second
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=4)
+        return len(reports)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+# Function to parse command-line arguments
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Manage the report store of the source code documentation tool')
+    parser.add_argument('--store', type=str, default=default_store_path, help=f'Report store (default: {default_store_path})')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    importer = subparsers.add_parser('import', help='Import a folder of JSON reports')
+    importer.add_argument('folder', type=str, help='Folder with the JSON reports')
+    exporter = subparsers.add_parser('export', help='Export the reports as JSON files')
+    exporter.add_argument('folder', type=str, help='Folder to write the JSON reports to')
+    exporter.add_argument('--all', action='store_true', help='Export every stored version, not only the latest report per path')
+    compact = subparsers.add_parser('compact', help='Drop superseded reports and compact the store')
+    compact.add_argument('--keep', type=int, default=5, help='Versions kept per path (default: 5, 0: no limit)')
+    compact.add_argument('--max-age-days', type=int, default=90, help='Superseded versions older than this are dropped (default: 90, 0: no limit)')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(message)s')
+    args = parse_arguments()
+    store = ReportStore(args.store)
+    if args.command == 'import':
+        logging.info("IMPORTED: %s reports from %s", store.import_json(args.folder), args.folder)
+    elif args.command == 'export':
+        logging.info("EXPORTED: %s reports to %s", store.export_json(args.folder, latest=not args.all), args.folder)
+    else:
+        logging.info("RETENTION: %s superseded reports dropped", store.apply_retention(args.keep, args.max_age_days))
+        store.compact(force=True)
+    reports, paths = store.count()
+    logging.info("REPORT STORE: %s (%s reports, %s paths)", store.path, reports, paths)
+    store.close()
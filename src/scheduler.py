@@ -0,0 +1,56 @@
+'''
+Budget Scheduler for the YAML-Based Project Documentation Tool
+
+This module orders a scan plan and fits it into a token and/or USD budget before any money is spent. Every plan entry
+carries the pre-flight estimates computed by genmermaid.py (`est_tokens`, `est_cost`). Files are scheduled largest-first
+(the big conversations start early and the small ones fill the gaps between workers), cheapest-first, or by the
+`priority` patterns of the discovery config. The budget is then filled greedily in schedule order: a file that does not
+fit is cut, and smaller files further down the schedule may still fit.
+'''
+from discovery import parse_rules, is_ignored
+
+schedule_orders = ('largest-first', 'cheapest-first', 'priority')
+
+# Function to rank a file by the priority patterns (index of the first matching pattern, unmatched files come last)
+def priority_rank(relpath, priority_rules):
+    for rank, rules in enumerate(priority_rules):
+        if is_ignored(rules, relpath, False):
+            return rank
+    return len(priority_rules)
+
+# Function to order the plan: largest-first, cheapest-first, or priority (then largest-first within a priority)
+def schedule_plan(plan, order='largest-first', priority=()):
+    if order == 'cheapest-first':
+        return sorted(plan, key=lambda item: (item['est_tokens'], item['relpath']))
+    if order == 'priority':
+        priority_rules = [parse_rules([pattern]) for pattern in priority]
+        return sorted(plan, key=lambda item: (priority_rank(item['relpath'], priority_rules), -item['est_tokens'], item['relpath']))
+    return sorted(plan, key=lambda item: (-item['est_tokens'], item['relpath']))
+
+# Function to fit the scheduled plan into the budgets (0 means no limit), returns (selected, cut) both in schedule order
+def apply_budget(plan, budget_usd=0.0, budget_tokens=0):
+    if not budget_usd and not budget_tokens:
+        return list(plan), []
+    selected, cut, tokens, cost = [], [], 0, 0.0
+    for item in plan:
+        if (budget_tokens and tokens + item['est_tokens'] > budget_tokens) or (budget_usd and cost + item['est_cost'] > budget_usd):
+            cut.append(item)
+            continue
+        selected.append(item)
+        tokens += item['est_tokens']
+        cost += item['est_cost']
+    return selected, cut
+
+# Function to render the plan as a table (order, estimated tokens and cost, flags incl. the copies that reuse the result, path), followed by the files cut by the budget
+def format_plan(selected, cut):
+    lines = [f"{'#':>5}  {'EST. TOKENS':>12}  {'EST. COST':>10}  {'FLAGS':<8}  FILE"]
+    for index, item in enumerate(selected, start=1):
+        flags = 'cached' if item.get('cached') else ('chunked' if item.get('chunks', 1) > 1 else '')
+        if item.get('duplicates'):
+            flags = f"{flags}+{len(item['duplicates'])}dup" if flags else f"+{len(item['duplicates'])}dup"
+        lines.append(f"{index:>5}  {item['est_tokens']:>12,}  {item['est_cost']:>10.4f}  {flags:<8}  {item['relpath']}")
+    lines.append(f"{'TOTAL':>5}  {sum(item['est_tokens'] for item in selected):>12,}  {sum(item['est_cost'] for item in selected):>10.4f}  {'':<8}  {len(selected)} files")
+    if cut:
+        lines.append(f"\nCUT BY THE BUDGET ({len(cut)} files, {sum(item['est_tokens'] for item in cut):,} tokens, ${sum(item['est_cost'] for item in cut):.4f}):")
+        lines += [f"{'-':>5}  {item['est_tokens']:>12,}  {item['est_cost']:>10.4f}  {'':<8}  {item['relpath']}" for item in cut]
+    return '\n'.join(lines)
@@ -0,0 +1,61 @@
+from chunker import split_code
+
+
+def count_tokens(text):
+    return len(text.split())
+
+
+def check(chunks, code, max_tokens):
+    assert ''.join(chunk['code'] for chunk in chunks) == code
+    for previous, chunk in zip(chunks, chunks[1:]):
+        assert chunk['start_line'] == previous['end_line'] + 1
+    for chunk in chunks:
+        assert chunk['tokens'] == count_tokens(chunk['code'])
+        assert chunk['tokens'] <= max_tokens or chunk['start_line'] == chunk['end_line']
+
+
+def test_small_file_is_a_single_chunk():
+    code = 'x = 1\ny = 2\n'
+    assert split_code(code, 'a.py', 100, count_tokens) == [{'start_line': 1, 'end_line': 2, 'tokens': 6, 'code': code}]
+
+
+def test_python_is_split_on_definitions():
+    functions = [f"# helper {i}\ndef f{i}(a, b):\n    c = a + b\n    return c * {i}\n\n" for i in range(6)]
+    code = 'import os\n\n' + ''.join(functions)
+    chunks = split_code(code, 'a.py', 30, count_tokens)
+    check(chunks, code, 30)
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        assert chunk['code'].lstrip('\n').startswith('# helper')
+
+
+def test_large_class_is_split_between_its_methods():
+    methods = ''.join(f"    def m{i}(self):\n        return self.value + {i} + {i}\n\n" for i in range(8))
+    code = f"class Big:\n    value = 1\n\n{methods}"
+    chunks = split_code(code, 'big.py', 40, count_tokens)
+    check(chunks, code, 40)
+    assert len(chunks) > 1
+    for chunk in chunks[1:]:
+        assert chunk['code'].lstrip().startswith('def m')
+
+
+def test_other_languages_are_split_on_blank_lines():
+    paragraphs = [f"function f{i}() {{\n  return {i} + {i};\n}}\n" for i in range(6)]
+    code = '\n'.join(paragraphs)
+    chunks = split_code(code, 'a.js', 20, count_tokens)
+    check(chunks, code, 20)
+    for chunk in chunks:
+        assert chunk['code'].lstrip('\n').startswith('function')
+
+
+def test_python_that_does_not_parse_falls_back_to_lines():
+    code = 'def broken(:\n' + 'x = 1 + 2\n' * 20
+    check(split_code(code, 'a.py', 16, count_tokens), code, 16)
+
+
+def test_a_line_larger_than_the_limit_is_its_own_chunk():
+    long_line = ' '.join(['token'] * 50) + '\n'
+    code = 'a = 1\n' + long_line + 'b = 2\n'
+    chunks = split_code(code, 'a.txt', 10, count_tokens)
+    check(chunks, code, 10)
+    assert {'start_line': 2, 'end_line': 2, 'tokens': 50, 'code': long_line} in chunks
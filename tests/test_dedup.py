@@ -0,0 +1,43 @@
+from dedup import collapse_duplicates, minhash_signature, signature_similarity
+
+base = '\n'.join(f"def handler_{i}(request):\n    return render(request, 'page_{i}.html', {{'id': {i}}})\n" for i in range(40))
+
+
+def entry(relpath, md5, code=None, **fields):
+    dirpath, _, filename = relpath.rpartition('/')
+    item = dict({'relpath': relpath, 'dirpath': dirpath, 'filename': filename, 'md5': md5, 'est_tokens': 100, 'est_cost': 0.01}, **fields)
+    if code is not None:
+        item['minhash'] = minhash_signature(code)
+    return item
+
+
+def test_signature_ignores_layout_and_needs_tokens():
+    assert minhash_signature(base) == minhash_signature(base.replace('\n', '\n\n').replace('    ', '\t'))
+    assert minhash_signature('  \n\t') is None
+    assert signature_similarity(minhash_signature(base), minhash_signature(base)) == 1.0
+
+
+def test_exact_duplicates_collapse_into_the_shallowest_copy():
+    plan = [entry('vendor/lib/util.py', 'm1'), entry('util.py', 'm1'), entry('pkg/util.py', 'm1'), entry('other.py', 'm2')]
+    leaders = collapse_duplicates(plan)
+    assert [item['relpath'] for item in leaders] == ['util.py', 'other.py']
+    assert [d['relpath'] for d in leaders[0]['duplicates']] == ['vendor/lib/util.py', 'pkg/util.py']
+    assert all(d['similarity'] == 1.0 for d in leaders[0]['duplicates'])
+    assert leaders[1]['duplicates'] == []
+
+
+def test_near_duplicates_borrow_from_their_sibling_only_when_enabled():
+    edited = base.replace("'page_39.html'", "'page_39_v2.html'")
+    plan = [entry('a.py', 'm1', base, tokens=200), entry('b.py', 'm2', edited, tokens=100), entry('c.py', 'm3', 'x = 1\n' * 50)]
+    leaders = collapse_duplicates([dict(item) for item in plan])
+    assert len(leaders) == 3
+    leaders = collapse_duplicates(plan, near_threshold=0.9)
+    assert [item['relpath'] for item in leaders] == ['a.py', 'c.py']
+    duplicate = leaders[0]['duplicates'][0]
+    assert duplicate['relpath'] == 'b.py' and duplicate['similarity'] >= 0.9
+    assert not any('minhash' in item for item in plan)
+
+
+def test_a_cached_file_never_borrows_a_result():
+    plan = [entry('a.py', 'm1', base, tokens=200), entry('b.py', 'm2', base.replace('39', '390'), tokens=100, cached=True)]
+    assert [item['relpath'] for item in collapse_duplicates(plan, near_threshold=0.9)] == ['a.py', 'b.py']
@@ -0,0 +1,129 @@
+import os
+
+from discovery import default_config, discover_files, is_ignored, load_discovery_config, names_folder, parse_rules, sniff_head
+
+
+def write(root, relpath, content="x = 1\n" * 20):
+    path = os.path.join(root, relpath)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def planned(root, config):
+    plan, _ = discover_files(str(root), config)
+    return sorted(item['relpath'] for item in plan)
+
+
+def skipped(root, config):
+    _, skipped = discover_files(str(root), config)
+    return dict(skipped)
+
+
+def test_unanchored_pattern_matches_at_any_depth():
+    rules = parse_rules(['*.log'])
+    assert is_ignored(rules, 'a.log', False)
+    assert is_ignored(rules, 'deep/down/a.log', False)
+    assert not is_ignored(rules, 'a.py', False)
+
+
+def test_anchored_pattern_only_matches_from_the_base():
+    rules = parse_rules(['/build/out.txt', 'docs/*.md'])
+    assert is_ignored(rules, 'build/out.txt', False)
+    assert not is_ignored(rules, 'src/build/out.txt', False)
+    assert is_ignored(rules, 'docs/a.md', False)
+    assert not is_ignored(rules, 'docs/sub/a.md', False)
+
+
+def test_double_star_and_negation_last_rule_wins():
+    rules = parse_rules(['**/gen/**', '!**/gen/keep.py'])
+    assert is_ignored(rules, 'a/gen/b.py', False)
+    assert not is_ignored(rules, 'a/gen/keep.py', False)
+
+
+def test_directory_only_pattern_ignores_files_below_but_not_a_file_of_that_name():
+    rules = parse_rules(['tmp/'])
+    assert is_ignored(rules, 'tmp', True)
+    assert is_ignored(rules, 'tmp/a.py', False)
+    assert not is_ignored(rules, 'tmp', False)
+
+
+def test_rules_of_a_subfolder_apply_below_it_only():
+    rules = parse_rules(['*.py'], base='pkg')
+    assert is_ignored(rules, 'pkg/a.py', False)
+    assert not is_ignored(rules, 'a.py', False)
+
+
+def test_names_folder_needs_the_folder_itself():
+    rules = parse_rules(['src/', '**/out/'])
+    assert names_folder(rules, 'src')
+    assert names_folder(rules, 'lib/out')
+    assert not names_folder(rules, 'src/node_modules')
+
+
+def test_config_removes_a_default_with_bang_and_adds_to_lists(tmp_path):
+    (tmp_path / '.genmermaid.yml').write_text('vendored_dirs: ["!build", "third_party"]\nexclude: ["*.sql"]\nmin_file_bytes: 1\n')
+    config = load_discovery_config(str(tmp_path))
+    assert 'build' not in config['vendored_dirs']
+    assert 'third_party' in config['vendored_dirs']
+    assert 'node_modules' in config['vendored_dirs']
+    assert config['exclude'] == default_config['exclude'] + ['*.sql']
+    assert config['min_file_bytes'] == 1
+
+
+def test_defaults_are_not_shared_between_configs(tmp_path):
+    config = load_discovery_config(str(tmp_path))
+    config['exclude'].append('*.tmp')
+    assert '*.tmp' not in load_discovery_config(str(tmp_path))['exclude']
+
+
+def test_gitignore_vendored_and_extension_rules(tmp_path):
+    write(tmp_path, 'app/main.py')
+    write(tmp_path, 'app/ignored.py')
+    write(tmp_path, 'node_modules/lib/index.js')
+    write(tmp_path, 'notes.bin')
+    write(tmp_path, '.gitignore', 'ignored.py\n')
+    config = load_discovery_config(str(tmp_path))
+    assert planned(tmp_path, config) == ['app/main.py']
+    reasons = skipped(tmp_path, config)
+    assert reasons['app/ignored.py'] == 'gitignore'
+    assert reasons['node_modules/'] == 'vendored'
+    assert reasons['notes.bin'] == 'extension'
+
+
+def test_include_of_a_parent_does_not_walk_its_vendored_folders(tmp_path):
+    write(tmp_path, 'src/a.py')
+    write(tmp_path, 'src/node_modules/b.js')
+    write(tmp_path, 'src/__pycache__/c.py')
+    write(tmp_path, 'other/d.py')
+    config = dict(load_discovery_config(str(tmp_path)), include=['src/'])
+    assert planned(tmp_path, config) == ['src/a.py']
+    reasons = skipped(tmp_path, config)
+    assert reasons['src/node_modules/'] == 'vendored'
+    assert reasons['other/d.py'] == 'not_included'
+
+
+def test_include_naming_a_vendored_folder_walks_it(tmp_path):
+    write(tmp_path, 'out/a.py')
+    config = dict(load_discovery_config(str(tmp_path)), include=['out/'])
+    assert planned(tmp_path, config) == ['out/a.py']
+
+
+def test_size_limits_and_plan_order(tmp_path):
+    write(tmp_path, 'tiny.py', 'x')
+    write(tmp_path, 'small.py', 'x = 1\n' * 10)
+    write(tmp_path, 'large.py', 'x = 1\n' * 100)
+    config = load_discovery_config(str(tmp_path))
+    plan, skipped_files = discover_files(str(tmp_path), config)
+    assert [item['relpath'] for item in plan] == ['small.py', 'large.py']
+    assert dict(skipped_files)['tiny.py'] == 'too_small'
+
+
+def test_generated_and_minified_files_are_sniffed(tmp_path):
+    config = load_discovery_config(str(tmp_path))
+    assert sniff_head(b'// Code generated by protoc. DO NOT EDIT.\nvar a = 1;\n', config) == 'generated'
+    assert sniff_head(b'var a=1;' * 1024, config) == 'minified'
+    assert sniff_head(b'def f():\n    return 1\n', config) is None
+    write(tmp_path, 'gen.py', '# @generated\n' + 'x = 1\n' * 20)
+    assert skipped(tmp_path, config)['gen.py'] == 'generated'
+    assert planned(tmp_path, dict(config, sniff_generated=False)) == ['gen.py']
@@ -0,0 +1,82 @@
+import json
+
+from journal import Journal, journal_path
+
+
+def lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_journal_path_depends_on_repository_and_prompts(tmp_path):
+    path = journal_path(str(tmp_path), 'repo', 'p1')
+    assert path == journal_path(str(tmp_path), 'repo', 'p1')
+    assert path != journal_path(str(tmp_path), 'repo', 'p2')
+    assert path != journal_path(str(tmp_path), 'other', 'p1')
+
+
+def test_latest_state_wins_and_completed_carries_the_md5(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.record_many(['a.py', 'b.py', 'c.py'], 'pending')
+    journal.record('a.py', 'in_flight', md5='m1')
+    journal.record('a.py', 'done', md5='m1')
+    journal.record('b.py', 'failed', md5='m2', status='error')
+    journal.close()
+    assert journal.completed() == {'a.py': 'm1'}
+    assert journal.summary() == {'pending': 1, 'in_flight': 0, 'done': 1, 'failed': 1}
+    assert len(lines(path)) == 6
+
+
+def test_resume_loads_compacts_and_appends(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.record_many(['a.py', 'b.py'], 'pending')
+    journal.record('a.py', 'done', md5='m1')
+    journal.close()
+
+    resumed = Journal(path, resume=True)
+    assert resumed.completed() == {'a.py': 'm1'}
+    assert len(lines(path)) == 2
+    resumed.record('b.py', 'done', md5='m2')
+    resumed.close()
+    assert Journal(path, resume=True).completed() == {'a.py': 'm1', 'b.py': 'm2'}
+
+
+def test_a_new_run_starts_from_an_empty_journal(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.record('a.py', 'done', md5='m1')
+    journal.close()
+    fresh = Journal(path)
+    fresh.close()
+    assert fresh.completed() == {}
+    assert lines(path) == []
+
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    journal.record('a.py', 'done', md5='m1')
+    journal.close()
+    with open(path, 'a') as f:
+        f.write('{"relpath": "b.py", "sta')
+    assert Journal(path, resume=True).completed() == {'a.py': 'm1'}
+
+
+def test_missing_journal_resumes_from_scratch(tmp_path):
+    journal = Journal(str(tmp_path / 'missing.jsonl'), resume=True)
+    journal.close()
+    assert journal.completed() == {}
+
+
+def test_compact_while_open_keeps_appending(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = Journal(path)
+    for state in ('pending', 'in_flight', 'done'):
+        journal.record('a.py', state, md5='m1')
+    journal.compact()
+    assert len(lines(path)) == 1
+    journal.record('b.py', 'done', md5='m2')
+    journal.close()
+    assert [entry['relpath'] for entry in lines(path)] == ['a.py', 'b.py']
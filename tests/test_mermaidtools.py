@@ -0,0 +1,56 @@
+from mermaidtools import fence, merge_erdiagrams, merge_flowcharts, strip_fence, validate_erdiagram, validate_flowchart
+
+
+def test_fence_round_trip_and_unfenced_values():
+    assert strip_fence(fence('flowchart TD\n    A --> B')) == 'flowchart TD\n    A --> B'
+    assert strip_fence('flowchart TD\n    A --> B') is None
+    assert strip_fence('```mermaid\nflowchart TD') is None
+
+
+def test_valid_diagrams_have_no_errors():
+    assert validate_flowchart(fence('flowchart LR\n    A[Input] -->|reads| B[(Database)]\n    B --> C & D')) == []
+    erd = fence('erDiagram\n    CUSTOMER ||--o{ ORDER : places\n    ORDER {\n        int id PK\n        string note "free text"\n    }')
+    assert validate_erdiagram(erd) == []
+
+
+def test_unfenced_or_non_string_values_are_rejected():
+    assert validate_flowchart('flowchart TD\n    A --> B')[0].startswith('DFD must be a string')
+    assert validate_erdiagram(None)[0].startswith('ERD must be a string')
+
+
+def test_empty_diagrams_get_one_error_each():
+    assert validate_flowchart(fence('flowchart TD')) == ['DFD has no nodes']
+    assert validate_flowchart(fence('')) == ['DFD is empty']
+    assert validate_erdiagram(fence('erDiagram')) == ['ERD has no entities']
+    assert validate_erdiagram(fence('')) == ['ERD is empty']
+
+
+def test_parse_errors_are_reported_without_the_empty_diagram_error():
+    errors = validate_flowchart(fence('sequenceDiagram\n    A->>B: hi'))
+    assert len(errors) == 1 and "must start with 'flowchart" in errors[0]
+    errors = validate_erdiagram(fence('erDiagram\n    CUSTOMER --> ORDER'))
+    assert len(errors) == 1 and 'not a relationship' in errors[0]
+    assert validate_erdiagram(fence('erDiagram\n    ORDER {\n        int id PK'))[-1] == "ERD entity ORDER is never closed with '}'"
+
+
+def test_merge_flowcharts_unifies_nodes_by_label():
+    merged = merge_flowcharts([fence('flowchart LR\n    A[User] --> B[API]'), fence('flowchart TD\n    X[api] --> Y[Store]')])
+    body = strip_fence(merged)
+    assert body.splitlines()[0] == 'flowchart LR'
+    assert 'p1_B[API]' in body and 'p2_X' not in body
+    assert 'p1_B[api] --> p2_Y[Store]' in body
+    assert validate_flowchart(merged) == []
+
+
+def test_merge_flowcharts_skips_invalid_parts():
+    merged = merge_flowcharts(['not a diagram', fence('flowchart TD\n    A --> B')])
+    assert strip_fence(merged) == 'flowchart TD\n    p2_A --> p2_B'
+
+
+def test_merge_erdiagrams_unifies_entities_and_relationships():
+    first = fence('erDiagram\n    USER ||--o{ ORDER : places\n    USER {\n        int id PK\n    }')
+    second = fence('erDiagram\n    USER ||--o{ ORDER : places\n    USER {\n        int id PK\n        string email\n    }\n    ORDER {\n        int id PK\n    }')
+    body = strip_fence(merge_erdiagrams([first, second]))
+    assert body.count('USER ||--o{ ORDER : places') == 1
+    assert body.count('USER {') == 1 and body.count('int id PK') == 2 and 'string email' in body
+    assert validate_erdiagram(fence(body)) == []
@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from reportstore import ReportStore, report_name
+
+
+def report(filename, scan_date, folder='repo/pkg', **fields):
+    return dict({'filename': filename, 'file_path': folder, 'scan_date': scan_date, 'md5_hash': 'm', 'SUMMARY': filename}, **fields)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReportStore(str(tmp_path / 'reports.db'))
+    yield store
+    store.close()
+
+
+def test_latest_report_per_path(store):
+    store.save(report('a.py', '2026-01-01T00:00:00', SUMMARY='old'))
+    newest = store.save(report('a.py', '2026-01-02T00:00:00', SUMMARY='new'))
+    store.save(report('b.py', '2026-01-01T00:00:00'))
+    path = os.path.join('repo/pkg', 'a.py')
+    assert store.latest(path)['SUMMARY'] == 'new'
+    assert store.latest('repo/missing.py') is None
+    assert store.latest_ids()[path] == newest
+    assert [r['SUMMARY'] for _, r in store.reports()] == ['new', 'b.py']
+    assert len(store.reports(latest=False)) == 3
+    assert tuple(store.count()) == (3, 2)
+
+
+def test_reports_since_an_id_and_by_id(store):
+    first = store.save(report('a.py', '2026-01-01T00:00:00'))
+    second = store.save(report('b.py', '2026-01-01T00:00:00'))
+    assert [report_id for report_id, _ in store.reports(since_id=first)] == [second]
+    assert set(store.reports_by_id([first, second])) == {first, second}
+
+
+def test_retention_by_count_keeps_the_latest(store):
+    for day in range(1, 5):
+        store.save(report('a.py', f'2026-01-0{day}T00:00:00', SUMMARY=str(day)))
+    assert store.apply_retention(keep_versions=2) == 2
+    assert [r['SUMMARY'] for _, r in store.reports(latest=False)] == ['3', '4']
+
+
+def test_retention_by_age_never_drops_the_latest(store):
+    old = (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%dT%H:%M:%S")
+    store.save(report('a.py', old, SUMMARY='old'))
+    store.save(report('a.py', old, SUMMARY='also old'))
+    store.save(report('b.py', old, SUMMARY='only one'))
+    assert store.apply_retention(max_age_days=7) == 1
+    assert sorted(r['SUMMARY'] for _, r in store.reports(latest=False)) == ['also old', 'only one']
+
+
+def test_retention_disabled(store):
+    store.save(report('a.py', '2026-01-01T00:00:00'))
+    store.save(report('a.py', '2026-01-02T00:00:00'))
+    assert store.apply_retention() == 0
+
+
+def test_aggregates_are_replaced_and_deleted(store):
+    store.save_aggregate('repo', 'pkg', 'f1', {'summary': 'one'})
+    store.save_aggregate('repo', 'pkg', 'f2', {'summary': 'two'})
+    store.save_aggregate('repo', '', 'f3', {'summary': 'root'})
+    assert store.aggregates('repo')['pkg'] == ('f2', {'summary': 'two'})
+    store.delete_aggregates('repo', ['pkg'])
+    assert list(store.aggregates('repo')) == ['']
+    assert store.aggregates('other') == {}
+
+
+def test_export_and_import_round_trip(store, tmp_path):
+    store.save(report('a.py', '2026-01-01T00:00:00', SUMMARY='old'))
+    store.save(report('a.py', '2026-01-02T00:00:00', SUMMARY='new'))
+    export = tmp_path / 'export'
+    assert store.export_json(str(export), latest=False) == 2
+    assert sorted(os.listdir(export)) == [f"{report_name(report('a.py', date))}.json" for date in ('2026-01-01T00:00:00', '2026-01-02T00:00:00')]
+    (export / 'broken.json').write_text('{')
+    (export / 'other.json').write_text(json.dumps({'not': 'a report'}))
+
+    imported = ReportStore(str(tmp_path / 'imported.db'))
+    assert imported.import_json(str(export)) == 2
+    assert imported.latest(os.path.join('repo/pkg', 'a.py'))['SUMMARY'] == 'new'
+    imported.close()
+
+
+def test_compact_only_runs_when_enough_is_free(store):
+    store.save(report('a.py', '2026-01-01T00:00:00'))
+    assert not store.compact()
+    assert store.compact(force=True)
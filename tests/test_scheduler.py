@@ -0,0 +1,62 @@
+from scheduler import apply_budget, format_plan, schedule_plan
+
+
+def entry(relpath, est_tokens, est_cost=0.0, **fields):
+    return dict({'relpath': relpath, 'est_tokens': est_tokens, 'est_cost': est_cost}, **fields)
+
+
+plan = [entry('a.py', 100, 0.1), entry('b.py', 300, 0.3), entry('src/core/c.py', 200, 0.2), entry('d.sql', 50, 0.05)]
+
+
+def relpaths(items):
+    return [item['relpath'] for item in items]
+
+
+def test_largest_first_is_the_default():
+    assert relpaths(schedule_plan(plan)) == ['b.py', 'src/core/c.py', 'a.py', 'd.sql']
+
+
+def test_cheapest_first():
+    assert relpaths(schedule_plan(plan, 'cheapest-first')) == ['d.sql', 'a.py', 'src/core/c.py', 'b.py']
+
+
+def test_priority_patterns_first_match_first_then_largest():
+    ordered = schedule_plan(plan, 'priority', ['src/core/', '*.sql'])
+    assert relpaths(ordered) == ['src/core/c.py', 'd.sql', 'b.py', 'a.py']
+
+
+def test_ties_are_broken_by_path():
+    assert relpaths(schedule_plan([entry('z.py', 10), entry('a.py', 10)])) == ['a.py', 'z.py']
+
+
+def test_no_budget_selects_everything():
+    selected, cut = apply_budget(plan)
+    assert relpaths(selected) == relpaths(plan)
+    assert cut == []
+
+
+def test_token_budget_cuts_what_does_not_fit_and_keeps_filling():
+    selected, cut = apply_budget(schedule_plan(plan), budget_tokens=420)
+    assert relpaths(selected) == ['b.py', 'a.py']
+    assert relpaths(cut) == ['src/core/c.py', 'd.sql']
+
+
+def test_usd_budget():
+    selected, cut = apply_budget(schedule_plan(plan, 'cheapest-first'), budget_usd=0.2)
+    assert relpaths(selected) == ['d.sql', 'a.py']
+    assert relpaths(cut) == ['src/core/c.py', 'b.py']
+
+
+def test_both_budgets_apply():
+    selected, _ = apply_budget(schedule_plan(plan, 'cheapest-first'), budget_usd=1.0, budget_tokens=160)
+    assert relpaths(selected) == ['d.sql', 'a.py']
+
+
+def test_format_plan_flags_and_cut_section():
+    selected = [entry('a.py', 1000, 0.5, cached=True), entry('b.py', 2000, 1.0, chunks=3, duplicates=[{}, {}])]
+    text = format_plan(selected, [entry('c.py', 10, 0.01)])
+    lines = text.splitlines()
+    assert 'cached' in lines[1] and lines[1].endswith('a.py')
+    assert 'chunked+2dup' in lines[2]
+    assert '3,000' in lines[3] and '2 files' in lines[3]
+    assert 'CUT BY THE BUDGET (1 files' in text